@@ -19,6 +19,12 @@
 # SOFTWARE.
 
 import aplib.net.ip as ip
+import aplib.tb
+import collections
+import contextlib
+import heapq
+import math
+import select
 import time
 
 """
@@ -36,16 +42,141 @@ The ConnectionPool periodically checks the state of its Connections and destroys
 
 The ConnectionManager periodically checks the state of its ConnectionPools and removes reference to any that have zero Connections left.
 
+Idle connections are expired by a timer rather than by scanning: each pool
+keeps its idle connections in order of when they were returned, and the
+ConnectionManager keeps a heap of pools ordered by when their oldest idle
+connection expires.  The background sweeper wakes up when the next one is due
+and only touches the connections that have expired.
+
 A ConnectionManager has limits on the maximum number of ConnectionPools it will create.
 
+A ConnectionManager may also limit the total number of sockets open across all
+of its ConnectionPools.  When that limit is reached and a pool needs a new
+connection, the idle connection of any pool that is closest to expiring
+(normally the least recently used one) is closed to make room, so the limit
+is only an error when every connection is in use.
+
 Exceeding any of these limits results in an exception being raised and the
 connection is not created. This behavior is preferred over creating a queue for
 two reasons: This is simpler and the queue only introduces latency.
 
+Pools created with ``max_waiters`` set are the exception.  When such a pool is
+at ``max_connections``, callers wait in a FIFO queue for up to
+``wait_timeout`` seconds, and a released connection is handed directly to the
+first waiter.  Once ``max_waiters`` callers are waiting, further callers get
+`MaxConnectionsLimit` right away, so an overloaded pool still fails fast.
+
+Pools may also limit how many connections are being established at once with
+``max_connecting``.  Callers of a pool with that many connects in flight wait
+in the same queue (which requires ``max_waiters``) and get either the next
+released connection or the next free connect slot, whichever comes first, so
+a burst of callers on an empty pool does not open a burst of sockets.
+
+Pools created with ``probe_idle`` check connections that have been idle for
+longer than that many seconds before handing them out (see
+`Connection.is_alive`), and silently drop the ones the remote end has closed.
+
+Pools with ``min_idle`` set are topped up to that many idle connections by a
+background task of the ConnectionManager, so traffic resuming after a quiet
+period does not have to wait for new connections.  Pre-warming opens at most
+``warm_rate`` connections per second across all pools, stays within
+``max_connections`` and the manager's socket budget, and backs off
+exponentially from a pool whose connects fail.  Such pools are kept by the
+manager even when they have no connections left.
+
+Pools and the manager count what they do (hits and misses of the idle lists,
+connects, errors raised) and keep `Histogram` objects of connect times, wait
+times and connection lifetimes.  Recording costs a few additions, so this is
+always on.  ``snapshot()`` returns all of it as plain dictionaries.
+
+Usage::
+
+    class SMTPPool(ConnectionPool):
+        conn_class = SMTPConnection
+
+    manager = ConnectionManager(SMTPPool, max_pools=5000, max_sockets=20000)
+    manager.start()
+    conn = manager.get_connection(host, 25, (bind_ipv4, bind_ipv6))
+
 """
 
-# How long to not use a socket before we decide to close it
-sock_timeout = 40
+# How long to not use a socket before we decide to close it.  This is the
+# default for pools created without a sock_timeout.
+DEFAULT_SOCK_TIMEOUT = 40
+# The old name, kept for code that reads it.  Set DEFAULT_SOCK_TIMEOUT to
+# change the default.
+sock_timeout = DEFAULT_SOCK_TIMEOUT
+
+# The longest pre-warming of a pool waits after failed connects.
+warm_backoff_max = 60
+
+def _is_readable(fd):
+    """Return True if reading `fd` would not block, without waiting."""
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        # POLLHUP and POLLERR are reported even though not asked for.
+        return bool(poller.poll(0))
+    readable, unused, unused = select.select([fd], [], [], 0)
+    return bool(readable)
+
+class Histogram(object):
+
+    """Counts of durations in power-of-two buckets.
+
+    A value ``v`` is counted in the bucket with the smallest bound ``b`` such
+    that ``v < b``, where the bounds are ``2 ** MIN_EXP`` (about a
+    microsecond) to ``2 ** MAX_EXP`` seconds.  Values outside that range are
+    counted in the first or last bucket.
+
+    :IVariables:
+        - `counts`: The count of each bucket, smallest bound first.
+        - `count`: The number of values recorded.
+        - `total`: The sum of the values recorded.
+        - `max`: The largest value recorded.
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    MIN_EXP = -20
+    MAX_EXP = 12
+
+    def __init__(self):
+        self.counts = [0] * (self.MAX_EXP - self.MIN_EXP + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        """Add a value in seconds."""
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        exp = math.frexp(value)[1]
+        if exp < self.MIN_EXP or value <= 0:
+            exp = self.MIN_EXP
+        elif exp > self.MAX_EXP:
+            exp = self.MAX_EXP
+        self.counts[exp - self.MIN_EXP] += 1
+
+    def snapshot(self):
+        """Get the histogram as a dictionary.
+
+        :Return:
+            Returns a dictionary with the keys ``count``, ``total``, ``max``
+            and ``buckets``, a dictionary of the bound of each bucket that is
+            not empty to its count.
+        """
+        buckets = {}
+        for i, n in enumerate(self.counts):
+            if n:
+                buckets[2.0 ** (i + self.MIN_EXP)] = n
+        return {'count': self.count,
+                'total': self.total,
+                'max': self.max,
+                'buckets': buckets,
+               }
 
 class MaxConnectionsLimit(Exception):
 
@@ -56,6 +187,14 @@ class MaxConnectionsLimit(Exception):
         self.host = host
         self.port = port
 
+class MaxPoolsLimit(Exception):
+
+    """Max pools limit exceeded for a connection manager."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
 class IfaceNotCompatible(Exception):
 
     """IP family of the interface to bind to and remote host do not match."""
@@ -65,18 +204,33 @@ class IfaceNotCompatible(Exception):
         self.port = port
 
 class Connection(object):
-    __slots__ = ('host', 'port', 'bind_address', 'last_used_time', 'in_use',
-                 'sock')
+    __slots__ = ('host', 'port', 'bind_address', 'created_time',
+                 'last_used_time', '_in_use', 'sock', 'pool')
     def __init__(self, host, port, bind_address):
         self.host = host
         self.port = port
         self.bind_address = bind_address
-        self.last_used_time = time.time()
-        self.in_use = False
+        self.created_time = self.last_used_time = time.time()
+        self._in_use = False
         self.sock = None
+        # The ConnectionPool this connection belongs to, if any.
+        self.pool = None
 
         self.init_socket()
 
+    def _get_in_use(self):
+        return self._in_use
+
+    def _set_in_use(self, in_use):
+        if self._in_use and not in_use and self.pool is not None:
+            self.pool._checkin(self)
+        else:
+            self._in_use = in_use
+
+    in_use = property(_get_in_use, _set_in_use, doc="""
+        Whether the connection is checked out.  Setting this to False on a
+        pooled connection returns it to the pool's idle list.""")
+
     def init_socket(self):
         """Initialize socket.  This method MUST be implemented by child
         classes."""
@@ -87,6 +241,8 @@ class Connection(object):
         if self.sock is not None:
             self.sock.close()
             self.sock = None
+            if self.pool is not None:
+                self.pool.lifetimes.record(time.time() - self.created_time)
 
     def is_usable(self):
         """
@@ -94,97 +250,1002 @@ class Connection(object):
         False otherwise.
         """
         if self.sock is not None:
-            conn_old = time.time() - self.last_used_time > sock_timeout
-            if self.in_use or not conn_old:
+            if self.pool is not None:
+                timeout = self.pool.sock_timeout
+            else:
+                timeout = DEFAULT_SOCK_TIMEOUT
+            conn_old = time.time() - self.last_used_time > timeout
+            if self._in_use or not conn_old:
                 return True
 
         return False
 
+    def is_alive(self):
+        """Check that an idle connection has not been closed by the remote
+        end.
+
+        An idle connection should have nothing to read, so if its socket is
+        readable the remote end has closed or reset it, or has sent
+        something unsolicited such as a shutdown notice.  Either way it can
+        not be used for a new request.  This does not block.
+
+        :Return:
+            Returns False if the connection is closed or should not be used.
+        """
+        if self.sock is None:
+            return False
+        try:
+            return not _is_readable(self.sock.fileno())
+        except (select.error, ValueError):
+            return False
+
     def is_ready(self):
         """
         Return True if the connection is ready.
         False otherwise.
         """
-        if self.sock is not None and not self.in_use:
+        if self.sock is not None and not self._in_use:
             return True
         else:
             return False
 
     def mark_used(self):
         """Mark the connection used."""
-        self.in_use = True
+        self._in_use = True
         self.last_used_time = time.time()
 
+class _Waiter(object):
+
+    """A caller waiting for a connection from a pool."""
+
+    __slots__ = ('bind_ip', 'thread', 'connection', 'reserved')
+
+    def __init__(self, bind_ip):
+        self.bind_ip = bind_ip
+        # The coro thread to wake up.
+        self.thread = None
+        # The connection handed over, or None if woken up to try again.
+        self.connection = None
+        # Whether a free slot is held for this waiter.
+        self.reserved = False
+
+    def wake(self):
+        if self.thread is not None:
+            self.thread.schedule()
+
 class ConnectionPool(object):
 
+    """A pool of connections to one host and port.
+
+    Idle connections are kept in a LIFO list per bind address, so the most
+    recently used connection is handed out first, and connections in use are
+    kept in a set.  Checking a connection out or in does not look at any
+    other connection.
+
+    The idle lists are in the order the connections were returned, so the
+    ones that have been idle longer than `sock_timeout` are found at the
+    front of the lists by `expire_idle`.
+
+    :IVariables:
+        - `max_waiters`: The maximum number of callers waiting for a
+          connection when the pool is full.  0 (the default) disables
+          waiting.
+        - `wait_timeout`: The default number of seconds to wait.
+        - `max_connecting`: The maximum number of connections being
+          established at once, or 0 for no limit.
+        - `connecting`: The number of connections being established.
+        - `probe_idle`: Check connections idle for longer than this many
+          seconds with `Connection.is_alive` before handing them out, or
+          None to never check.
+        - `dead_connections`: The number of idle connections dropped
+          because the check found them closed.
+        - `min_idle`: The number of idle connections `warm` keeps open.
+        - `warm_failures`: The number of pre-warming connects that failed
+          in a row.
+        - `waits`: The number of callers that waited.
+        - `wait_timeouts`: The number of waits that timed out.
+        - `waits_rejected`: The number of callers refused because the wait
+          queue was full.
+        - `hits`: The number of `get_connection` calls that got an idle
+          connection.
+        - `misses`: The number of `get_connection` calls that found no idle
+          connection.
+        - `connects`: The number of connections established.
+        - `connect_failures`: The number of connects that raised.
+        - `limit_errors`: The number of `MaxConnectionsLimit` raised.
+        - `iface_errors`: The number of `IfaceNotCompatible` raised.
+        - `connect_times`: `Histogram` of the seconds taken to connect.
+        - `wait_times`: `Histogram` of the seconds callers waited.
+        - `lifetimes`: `Histogram` of the seconds connections were open.
+    """
+
     conn_class = None
     """This must be set by child class."""
 
-    __slots__ = ('host', 'port', 'connections', 'max_connections',
-                 'no_of_connections')
+    __slots__ = ('host', 'port', 'max_connections', 'no_of_connections',
+                 'sock_timeout', 'manager', '_ipv6', '_idle', '_busy',
+                 '_expiry_scheduled', 'max_waiters', 'wait_timeout',
+                 '_waiters', 'waits', 'wait_timeouts', 'waits_rejected',
+                 '_reserved', 'max_connecting', 'connecting', 'probe_idle',
+                 'dead_connections', 'min_idle', 'warm_failures',
+                 '_warm_after', '_warm_bind_address', 'hits', 'misses',
+                 'connects', 'connect_failures', 'limit_errors',
+                 'iface_errors', 'connect_times', 'wait_times', 'lifetimes')
 
-    def __init__(self, host, port, max_connections=10):
+    def __init__(self, host, port, max_connections=10, sock_timeout=None,
+                 max_waiters=0, wait_timeout=1.0, max_connecting=0,
+                 probe_idle=None, min_idle=0):
         self.host = host
         self.port = port
-        self.connections = []
         self.no_of_connections = 0
         self.max_connections = max_connections
+        if sock_timeout is None:
+            sock_timeout = DEFAULT_SOCK_TIMEOUT
+        self.sock_timeout = sock_timeout
+        # The ConnectionManager that owns this pool, if any.
+        self.manager = None
+        self._ipv6 = ip.is_ipv6(host)
+        # bind address -> deque of idle connections, most recently used last.
+        self._idle = {}
+        self._busy = set()
+        # Whether the manager has this pool in its expiry heap.
+        self._expiry_scheduled = False
+        self.max_waiters = max_waiters
+        self.wait_timeout = wait_timeout
+        self._waiters = collections.deque()
+        # Free slots held for woken waiters that have not run yet.
+        self._reserved = 0
+        self.waits = 0
+        self.wait_timeouts = 0
+        self.waits_rejected = 0
+        self.max_connecting = max_connecting
+        self.connecting = 0
+        self.probe_idle = probe_idle
+        self.dead_connections = 0
+        self.min_idle = min_idle
+        self.warm_failures = 0
+        # No pre-warming before this time.
+        self._warm_after = 0
+        # The bind address of the last new connection, used to pre-warm.
+        self._warm_bind_address = None
+        self.hits = 0
+        self.misses = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.limit_errors = 0
+        self.iface_errors = 0
+        self.connect_times = Histogram()
+        self.wait_times = Histogram()
+        self.lifetimes = Histogram()
+
+    @property
+    def connections(self):
+        """A list of all the connections of the pool, idle and in use."""
+        result = list(self._busy)
+        for idle in self._idle.itervalues():
+            result.extend(idle)
+        return result
+
+    def _bind_ip(self, bind_address):
+        if self._ipv6:
+            return bind_address[1]
+        return bind_address[0]
+
+    def _forget(self, count):
+        """Account for connections that were closed or dropped."""
+        self.no_of_connections -= count
+        if self.manager is not None:
+            self.manager.no_of_sockets -= count
+        # Each free slot lets a waiter open a new connection.
+        while count > 0 and self._waiters:
+            self._wake_next()
+            count -= 1
+
+    def _wake_next(self):
+        """Wake the first waiter to use a free slot.
+
+        The slot is held for the waiter until it runs, so a caller that
+        arrives in between cannot take it.
+        """
+        waiter = self._waiters.popleft()
+        waiter.reserved = True
+        self._reserved += 1
+        waiter.wake()
+
+    def _release_reservation(self, waiter):
+        if waiter.reserved:
+            waiter.reserved = False
+            self._reserved -= 1
+
+    def _can_connect(self):
+        """Return True if this pool may start a new connection now."""
+        if self.no_of_connections + self._reserved >= self.max_connections:
+            return False
+        return not self.max_connecting or \
+            self.connecting + self._reserved < self.max_connecting
+
+    def _checkin(self, connection):
+        """Return a connection to the idle list."""
+        connection._in_use = False
+        # Idle time counts from when the connection was returned.
+        connection.last_used_time = time.time()
+        self._busy.discard(connection)
+        if connection.sock is None:
+            connection.pool = None
+            self._forget(1)
+        elif not self._handoff(connection):
+            idle = self._idle.get(connection.bind_address)
+            if idle is None:
+                idle = self._idle[connection.bind_address] = \
+                    collections.deque()
+            idle.append(connection)
+            if self.manager is not None and not self._expiry_scheduled:
+                self.manager._schedule_expiry(
+                    self, connection.last_used_time + self.sock_timeout)
+
+    def _handoff(self, connection):
+        """Give a returned connection to the first waiter that can use it."""
+        for waiter in self._waiters:
+            if waiter.bind_ip == connection.bind_address:
+                self._waiters.remove(waiter)
+                connection.mark_used()
+                self._busy.add(connection)
+                waiter.connection = connection
+                waiter.wake()
+                return True
+        return False
+
+    def _wait(self, waiter, timeout):
+        """Block the current coro thread until `waiter` is woken up or the
+        timeout expires."""
+        import coro
+        waiter.thread = coro.current()
+        try:
+            coro.with_timeout(timeout, coro.Yield)
+        except coro.TimeoutError:
+            pass
+
+    def _wait_for_connection(self, bind_address, timeout):
+        """Queue for a connection of a full pool."""
+        if len(self._waiters) >= self.max_waiters:
+            self.waits_rejected += 1
+            self.limit_errors += 1
+            raise MaxConnectionsLimit(self.host, self.port)
+        bind_ip = self._bind_ip(bind_address)
+        if bind_ip is None:
+            self.iface_errors += 1
+            raise IfaceNotCompatible(self.host, self.port)
+        if timeout is None:
+            timeout = self.wait_timeout
+        waiter = _Waiter(bind_ip)
+        start = time.time()
+        deadline = start + timeout
+        self.waits += 1
+        self._waiters.append(waiter)
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining > 0:
+                    self._wait(waiter, remaining)
+                connection = waiter.connection
+                if waiter.reserved:
+                    # A slot was freed for us.
+                    self._release_reservation(waiter)
+                    connection = self.get_ready_connection(bind_address)
+                    if connection is None and self._can_connect():
+                        connection = self.get_new_connection(bind_address)
+                if connection is not None:
+                    return connection
+                if time.time() >= deadline:
+                    self.wait_timeouts += 1
+                    self.limit_errors += 1
+                    raise MaxConnectionsLimit(self.host, self.port)
+                if waiter not in self._waiters:
+                    # Someone else got the slot, keep our place in line.
+                    self._waiters.appendleft(waiter)
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if waiter.reserved:
+                # Interrupted before using the slot, pass it on.
+                self._release_reservation(waiter)
+                if self._waiters and self._can_connect():
+                    self._wake_next()
+            self.wait_times.record(time.time() - start)
+
+    def wait_stats(self):
+        """Get the wait queue counters.
+
+        :Return:
+            Returns a dictionary of counter name to value.
+        """
+        return {'waiting': len(self._waiters),
+                'max_waiters': self.max_waiters,
+                'waits': self.waits,
+                'wait_timeouts': self.wait_timeouts,
+                'waits_rejected': self.waits_rejected,
+                'wait_time_total': self.wait_times.total,
+                'wait_time_max': self.wait_times.max,
+               }
+
+    def snapshot(self):
+        """Get the state and counters of the pool.
+
+        :Return:
+            Returns a dictionary of plain values.  The histograms are given
+            as returned by `Histogram.snapshot`.
+        """
+        idle = 0
+        for connections in self._idle.itervalues():
+            idle += len(connections)
+        return {'host': self.host,
+                'port': self.port,
+                'connections': self.no_of_connections,
+                'max_connections': self.max_connections,
+                'idle': idle,
+                'busy': len(self._busy),
+                'connecting': self.connecting,
+                'waiting': len(self._waiters),
+                'hits': self.hits,
+                'misses': self.misses,
+                'connects': self.connects,
+                'connect_failures': self.connect_failures,
+                'limit_errors': self.limit_errors,
+                'iface_errors': self.iface_errors,
+                'dead_connections': self.dead_connections,
+                'waits': self.waits,
+                'wait_timeouts': self.wait_timeouts,
+                'waits_rejected': self.waits_rejected,
+                'warm_failures': self.warm_failures,
+                'connect_times': self.connect_times.snapshot(),
+                'wait_times': self.wait_times.snapshot(),
+                'lifetimes': self.lifetimes.snapshot(),
+               }
+
+    def release(self, connection, reusable=True):
+        """Return a connection obtained from `get_connection`.
+
+        :Parameters:
+            - `connection`: The connection.
+            - `reusable`: If False the connection is closed instead of being
+              kept for reuse.  Pass False if an error left it in an unknown
+              state.
+
+        :Exceptions:
+            - `ValueError`: The connection is already idle in this pool, or
+              it belongs to another pool.
+        """
+        if connection not in self._busy:
+            if connection.pool is self:
+                raise ValueError('connection is not checked out')
+            if connection.pool is not None:
+                raise ValueError('connection belongs to another pool')
+            # Dropped by clean_connections while in use.
+            connection._in_use = False
+            connection.close()
+            return
+        if not reusable:
+            connection.close()
+        self._checkin(connection)
+
+    @contextlib.contextmanager
+    def connection(self, bind_address, timeout=None):
+        """Check out a connection for the duration of a with statement.
+
+        The connection is released when the block ends.  If the block raises
+        an exception the connection is closed instead of reused::
+
+            with pool.connection(bind_address) as conn:
+                conn.send(data)
+
+        :Parameters:
+            - `bind_address`: See `get_connection`.
+            - `timeout`: See `get_connection`.
+        """
+        connection = self.get_connection(bind_address, timeout)
+        try:
+            yield connection
+        except:
+            self.release(connection, False)
+            raise
+        self.release(connection)
 
     def clean_connections(self):
-        conns_to_keep = []
+        closed = 0
         conns_to_orphan = self.no_of_connections - self.max_connections
-        for connection in self.connections:
-            if conns_to_orphan > 0 and not connection.in_use:
+        for bind_ip, idle in self._idle.items():
+            conns_to_keep = []
+            # Oldest first.
+            for connection in idle:
+                if conns_to_orphan > 0:
+                    conns_to_orphan -= 1
+                elif connection.is_usable():
+                    conns_to_keep.append(connection)
+                    continue
                 connection.close()
-                conns_to_orphan -= 1
-                continue
-
-            if connection.is_usable():
-                conns_to_keep.append(connection)
+                connection.pool = None
+                closed += 1
+            if conns_to_keep:
+                self._idle[bind_ip] = collections.deque(conns_to_keep)
             else:
-                connection.close()
+                del self._idle[bind_ip]
+        for connection in list(self._busy):
+            if not connection.is_usable():
+                self._busy.discard(connection)
+                connection.pool = None
+                closed += 1
+        self._forget(closed)
 
-        self.connections = conns_to_keep
-        self.no_of_connections = len(conns_to_keep)
+    def expire_idle(self, now=None):
+        """Close the connections that have been idle too long.
 
-    def get_connection(self, bind_address):
+        Only the expired connections, which are at the front of the idle
+        lists, are looked at.
+
+        :Parameters:
+            - `now`: The current time.  Defaults to ``time.time()``.
+
+        :Return:
+            Returns the number of connections closed.
+        """
+        if now is None:
+            now = time.time()
+        deadline = now - self.sock_timeout
+        closed = 0
+        for bind_ip, idle in self._idle.items():
+            while idle and idle[0].last_used_time < deadline:
+                connection = idle.popleft()
+                if connection.sock is not None:
+                    connection.close()
+                connection.pool = None
+                closed += 1
+            if not idle:
+                del self._idle[bind_ip]
+        self._forget(closed)
+        return closed
+
+    def _evict_oldest(self):
+        """Close the idle connection that has been idle the longest."""
+        oldest = None
+        for bind_ip, idle in self._idle.iteritems():
+            if idle and (oldest is None or
+                         idle[0].last_used_time < oldest[0].last_used_time):
+                oldest = idle
+                oldest_bind_ip = bind_ip
+        connection = oldest.popleft()
+        if not oldest:
+            del self._idle[oldest_bind_ip]
+        connection.close()
+        connection.pool = None
+        self._forget(1)
+
+    def next_expiry(self):
+        """Return when the oldest idle connection expires, or None."""
+        oldest = None
+        for idle in self._idle.itervalues():
+            if idle and (oldest is None or
+                         idle[0].last_used_time < oldest):
+                oldest = idle[0].last_used_time
+        if oldest is None:
+            return None
+        return oldest + self.sock_timeout
+
+    def warm(self, limit=None, now=None):
+        """Open connections until `min_idle` are idle.
+
+        The connections are opened with the bind address of the last
+        connection the pool created, so nothing is done before the pool has
+        been used once.  After a failed connect (any exception from the
+        connection class), pre-warming is suspended for 1 second, doubling
+        for each further failure up to `warm_backoff_max`.
+
+        :Parameters:
+            - `limit`: The maximum number of connections to open, or None
+              for no limit.
+            - `now`: The current time.  Defaults to ``time.time()``.
+
+        :Return:
+            Returns the number of connections opened.
+        """
+        bind_address = self._warm_bind_address
+        if not self.min_idle or bind_address is None:
+            return 0
+        if now is None:
+            now = time.time()
+        if now < self._warm_after:
+            return 0
+        bind_ip = self._bind_ip(bind_address)
+        opened = 0
+        while (len(self._idle.get(bind_ip, ())) < self.min_idle and
+               (limit is None or opened < limit) and self._can_connect()):
+            if (self.manager is not None and
+                not self.manager.has_socket_budget()):
+                break
+            try:
+                connection = self.get_new_connection(bind_address)
+            except Exception:
+                # Whatever conn_class raises (socket, SSL or timeout
+                # errors), it is a failed connect.
+                self.warm_failures += 1
+                self._warm_after = now + min(
+                    warm_backoff_max, 2 ** (self.warm_failures - 1))
+                break
+            self.warm_failures = 0
+            self._checkin(connection)
+            opened += 1
+        return opened
+
+    def get_connection(self, bind_address, timeout=None):
         """Get a connection if already available in connections or create a new
-        one and return."""
+        one and return.
+
+        If the pool is full, or `max_connecting` connects are in flight,
+        and `max_waiters` is set, wait for a connection to be released or
+        for a chance to connect.  Callers are served in order: while others
+        are waiting, a new caller queues behind them.
 
-        return self.get_ready_connection(bind_address) or \
-            self.get_new_connection(bind_address)
+        :Parameters:
+            - `bind_address`: A ``(ipv4_address, ipv6_address)`` tuple of the
+              local addresses to bind to.
+            - `timeout`: The longest to wait in seconds.  Defaults to
+              `wait_timeout`.
+
+        :Exceptions:
+            - `MaxConnectionsLimit`: The pool is full (or too many
+              connects are in flight) and waiting is disabled, the wait
+              queue is full, or the wait timed out.
+            - `IfaceNotCompatible`: No bind address of the right family.
+        """
+        connection = self.get_ready_connection(bind_address)
+        if connection is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if self.max_waiters and (self._waiters or
+                                     not self._can_connect()):
+                return self._wait_for_connection(bind_address, timeout)
+            connection = self.get_new_connection(bind_address)
+        return connection
 
     def get_ready_connection(self, bind_address):
         """Return a ready connection"""
-        for connection in self.connections:
-            if connection.is_ready() and \
-               connection.bind_address in bind_address:
-                connection.mark_used()
-                return connection
+        idle = self._idle.get(self._bind_ip(bind_address))
+        if self.probe_idle is None:
+            probe_before = None
         else:
-            return None
+            probe_before = time.time() - self.probe_idle
+        while idle:
+            connection = idle.pop()
+            if connection.sock is not None:
+                if (probe_before is None or
+                    connection.last_used_time >= probe_before or
+                    connection.is_alive()):
+                    connection.mark_used()
+                    self._busy.add(connection)
+                    return connection
+                # Closed by the remote end while idle.
+                connection.close()
+                self.dead_connections += 1
+            # Closed while idle.
+            connection.pool = None
+            self._forget(1)
+        return None
 
     def get_new_connection(self, bind_address):
         """Return a new connection"""
-        if len(self.connections) >= self.max_connections:
+        if not self._can_connect():
+            self.limit_errors += 1
+            raise MaxConnectionsLimit(self.host, self.port)
+        elif (self.manager is not None and
+              not self.manager.has_socket_budget() and
+              not self.manager.evict_idle(self)):
+            self.limit_errors += 1
             raise MaxConnectionsLimit(self.host, self.port)
         else:
+            bind_ip = self._bind_ip(bind_address)
+            if bind_ip is None:
+                self.iface_errors += 1
+                raise IfaceNotCompatible(self.host, self.port)
+            self._warm_bind_address = bind_address
+            # Count the connection while it is being established, so other
+            # callers see the slot and the socket as taken.
+            self.no_of_connections += 1
+            if self.manager is not None:
+                self.manager.no_of_sockets += 1
+            self.connecting += 1
+            start = time.time()
             try:
-                self.no_of_connections += 1
-                if ip.is_ipv6(self.host):
-                    bind_ip = bind_address[1]
-                else:
-                    bind_ip = bind_address[0]
-
-                if bind_ip is None:
-                    raise IfaceNotCompatible(self.host, self.port)
                 new_connection = self.conn_class(self.host, self.port,
                                                  bind_ip)
             except:
-                self.no_of_connections -= 1
+                self.connecting -= 1
+                self.connect_failures += 1
+                self._forget(1)
                 raise
+            self.connecting -= 1
+            self.connects += 1
+            self.connect_times.record(time.time() - start)
 
             new_connection.mark_used()
-            self.connections.append(new_connection)
+            new_connection.pool = self
+            self._busy.add(new_connection)
+            if self._waiters and self.max_connecting and self._can_connect():
+                # A connect slot is free again.
+                self._wake_next()
 
         return new_connection
+
+class ConnectionManager(object):
+
+    """Owner of the ConnectionPools of a process.
+
+    Pools are created on demand and found by ``(host, port, family)`` with a
+    single dictionary lookup, where family is the address family (4 or 6) of
+    the host, which decides which of the bind addresses is used.  Create one
+    manager per pool class and share it so all callers share the pools.
+
+    :IVariables:
+        - `pool_class`: The ConnectionPool subclass to create pools with.
+        - `max_pools`: The maximum number of pools.
+        - `max_sockets`: The maximum number of connections across all pools,
+          or None for no limit.  Idle connections are closed to stay
+          within it, see `evict_idle`.
+        - `max_connections`: The `max_connections` of new pools.
+        - `sock_timeout`: The `sock_timeout` of new pools, or None for
+          `DEFAULT_SOCK_TIMEOUT`.
+        - `max_waiters`: The `max_waiters` of new pools.
+        - `wait_timeout`: The `wait_timeout` of new pools.
+        - `max_connecting`: The `max_connecting` of new pools.
+        - `probe_idle`: The `probe_idle` of new pools.
+        - `min_idle`: The `min_idle` of new pools.
+        - `warm_rate`: The most connections per second the background
+          pre-warming opens, across all pools.
+        - `clean_interval`: The longest the background sweeper sleeps
+          between sweeps.
+        - `pools`: Dictionary of ``(host, port, family)`` to pool.
+        - `no_of_sockets`: The number of connections across all pools.
+        - `pools_created`: The number of pools created.
+        - `pools_removed`: The number of empty pools removed.
+        - `pool_limit_errors`: The number of `MaxPoolsLimit` raised.
+        - `evictions`: The number of idle connections closed to make room
+          for new ones.
+    """
+
+    # Pool counters summed up by `snapshot`.
+    _POOL_COUNTERS = ('hits', 'misses', 'connects', 'connect_failures',
+                      'limit_errors', 'iface_errors', 'dead_connections',
+                      'waits', 'wait_timeouts', 'waits_rejected')
+
+    def __init__(self, pool_class, max_pools=1000, max_sockets=None,
+                 max_connections=10, clean_interval=30, sock_timeout=None,
+                 max_waiters=0, wait_timeout=1.0, max_connecting=0,
+                 probe_idle=None, min_idle=0, warm_rate=10):
+        self.pool_class = pool_class
+        self.max_pools = max_pools
+        self.max_sockets = max_sockets
+        self.max_connections = max_connections
+        self.clean_interval = clean_interval
+        self.sock_timeout = sock_timeout
+        self.max_waiters = max_waiters
+        self.wait_timeout = wait_timeout
+        self.max_connecting = max_connecting
+        self.probe_idle = probe_idle
+        self.min_idle = min_idle
+        self.warm_rate = warm_rate
+        # (deadline, sequence, pool) for pools with idle connections.
+        self._expiry_heap = []
+        self._sequence = 0
+        self.pools = {}
+        self.no_of_sockets = 0
+        self._sweeper = None
+        self._warmer = None
+        # Where the next limited `warm` starts in the list of pools.
+        self._warm_next = 0
+        self.pools_created = 0
+        self.pools_removed = 0
+        self.pool_limit_errors = 0
+        self.evictions = 0
+
+    def has_socket_budget(self):
+        """Return True if another connection may be opened."""
+        return self.max_sockets is None or self.no_of_sockets < self.max_sockets
+
+    def get_pool(self, host, port):
+        """Get the pool for a host and port, creating it if needed.
+
+        :Parameters:
+            - `host`: The remote IP address as a string.
+            - `port`: The remote port.
+
+        :Return:
+            Returns the ConnectionPool.
+
+        :Exceptions:
+            - `MaxPoolsLimit`: A new pool is needed but `max_pools` pools
+              exist.
+        """
+        if ip.is_ipv6(host):
+            key = (host, port, 6)
+        else:
+            key = (host, port, 4)
+        pool = self.pools.get(key)
+        if pool is None:
+            if len(self.pools) >= self.max_pools:
+                # Pools that no longer hold any connections can go.
+                self.remove_empty_pools()
+                if len(self.pools) >= self.max_pools:
+                    self.pool_limit_errors += 1
+                    raise MaxPoolsLimit(host, port)
+            pool = self.pool_class(host, port, self.max_connections,
+                                   self.sock_timeout, self.max_waiters,
+                                   self.wait_timeout, self.max_connecting,
+                                   self.probe_idle, self.min_idle)
+            pool.manager = self
+            self.pools[key] = pool
+            self.pools_created += 1
+        return pool
+
+    def get_connection(self, host, port, bind_address, timeout=None):
+        """Get a connection from the pool for a host and port.
+
+        :Parameters:
+            - `host`: The remote IP address as a string.
+            - `port`: The remote port.
+            - `bind_address`: A ``(ipv4_address, ipv6_address)`` tuple of
+              the local addresses to bind to.
+            - `timeout`: See `ConnectionPool.get_connection`.
+
+        :Return:
+            Returns a Connection marked as in use.
+
+        :Exceptions:
+            - `MaxPoolsLimit`: Too many pools.
+            - `MaxConnectionsLimit`: The pool or the manager is out of
+              connections.
+            - `IfaceNotCompatible`: No bind address of the right family.
+        """
+        return self.get_pool(host, port).get_connection(bind_address, timeout)
+
+    def connection(self, host, port, bind_address, timeout=None):
+        """Check out a connection for the duration of a with statement.
+
+        See `ConnectionPool.connection`.
+        """
+        return self.get_pool(host, port).connection(bind_address, timeout)
+
+    def remove_empty_pools(self):
+        """Forget the pools that have no connections.
+
+        Pools with `min_idle` set are kept.
+
+        :Return:
+            Returns the number of pools removed.
+        """
+        empty = [key for key, pool in self.pools.iteritems()
+                 if not pool.no_of_connections and not pool.min_idle]
+        for key in empty:
+            self.pools[key].manager = None
+            del self.pools[key]
+        self.pools_removed += len(empty)
+        return len(empty)
+
+    def _schedule_expiry(self, pool, deadline):
+        self._sequence += 1
+        heapq.heappush(self._expiry_heap, (deadline, self._sequence, pool))
+        pool._expiry_scheduled = True
+
+    def expire(self, now=None):
+        """Close idle connections that have expired, in every pool.
+
+        Only pools with an expired connection are visited.  Pools left
+        without connections are removed.
+
+        :Parameters:
+            - `now`: The current time.  Defaults to ``time.time()``.
+
+        :Return:
+            Returns the number of connections closed.
+        """
+        if now is None:
+            now = time.time()
+        heap = self._expiry_heap
+        closed = 0
+        while heap and heap[0][0] <= now:
+            unused, unused, pool = heapq.heappop(heap)
+            pool._expiry_scheduled = False
+            closed += pool.expire_idle(now)
+            deadline = pool.next_expiry()
+            if deadline is not None:
+                self._schedule_expiry(pool, deadline)
+            elif not pool.no_of_connections and not pool.min_idle:
+                self._remove_pool(pool)
+        return closed
+
+    def evict_idle(self, keep=None):
+        """Close one idle connection to make room for a new connection.
+
+        The connection closed is the one closest to expiring, which is the
+        least recently used one when all pools have the same
+        `sock_timeout`.  It is found with the expiry heap, whose entries are
+        refreshed as they come up, so this does not visit every pool.
+
+        :Parameters:
+            - `keep`: A pool that must not be removed even if this leaves
+              it empty, normally the pool the room is made for.
+
+        :Return:
+            Returns True if a connection was closed, False if there are no
+            idle connections.
+        """
+        heap = self._expiry_heap
+        while heap:
+            deadline, unused, pool = heap[0]
+            current = pool.next_expiry()
+            if current is None:
+                heapq.heappop(heap)
+                pool._expiry_scheduled = False
+            elif current != deadline:
+                # The connection the entry was made for is gone.
+                self._sequence += 1
+                heapq.heapreplace(heap, (current, self._sequence, pool))
+            else:
+                heapq.heappop(heap)
+                pool._expiry_scheduled = False
+                pool._evict_oldest()
+                self.evictions += 1
+                deadline = pool.next_expiry()
+                if deadline is not None:
+                    self._schedule_expiry(pool, deadline)
+                elif (not pool.no_of_connections and not pool.min_idle and
+                      pool is not keep):
+                    self._remove_pool(pool)
+                return True
+        return False
+
+    def _remove_pool(self, pool):
+        if pool._ipv6:
+            key = (pool.host, pool.port, 6)
+        else:
+            key = (pool.host, pool.port, 4)
+        if self.pools.get(key) is pool:
+            del self.pools[key]
+            pool.manager = None
+            self.pools_removed += 1
+
+    def clean(self):
+        """Clean the connections of every pool and remove empty pools.
+
+        This looks at every connection.  `expire` is cheaper, and is what
+        the background sweeper uses.
+        """
+        for pool in self.pools.values():
+            pool.clean_connections()
+        self.remove_empty_pools()
+
+    def warm(self, limit=None, now=None):
+        """Top up the pools that have `min_idle` set.
+
+        With a `limit`, the connections are handed out one per pool at a
+        time, and each call starts with the pool after the last one the
+        previous call got to, so every pool gets its turn even when there
+        are more pools than `limit`.
+
+        :Parameters:
+            - `limit`: The maximum number of connections to open, or None
+              for no limit.
+            - `now`: The current time.  Defaults to ``time.time()``.
+
+        :Return:
+            Returns the number of connections opened.
+        """
+        pools = [pool for pool in self.pools.values() if pool.min_idle]
+        if limit is None:
+            opened = 0
+            for pool in pools:
+                opened += pool.warm(None, now)
+            return opened
+        if not pools:
+            return 0
+        start = self._warm_next % len(pools)
+        pools = pools[start:] + pools[:start]
+        # The pools the first round does not reach go first next time.
+        self._warm_next = start
+        opened = 0
+        first_round = True
+        while pools and opened < limit:
+            wanting = []
+            for pool in pools:
+                if opened >= limit:
+                    break
+                if first_round:
+                    self._warm_next += 1
+                if pool.warm(1, now):
+                    opened += 1
+                    wanting.append(pool)
+            first_round = False
+            pools = wanting
+        return opened
+
+    def snapshot(self, per_pool=False):
+        """Get the state and counters of the manager.
+
+        The pool counters (``hits``, ``connects``, and so on) are summed
+        over the current pools, so counts of removed pools are not
+        included.
+
+        :Parameters:
+            - `per_pool`: Also include the `ConnectionPool.snapshot` of
+              every pool, under ``'pool_stats'`` keyed like `pools`.
+
+        :Return:
+            Returns a dictionary of plain values.
+        """
+        result = {'pools': len(self.pools),
+                  'max_pools': self.max_pools,
+                  'sockets': self.no_of_sockets,
+                  'max_sockets': self.max_sockets,
+                  'pools_created': self.pools_created,
+                  'pools_removed': self.pools_removed,
+                  'pool_limit_errors': self.pool_limit_errors,
+                  'evictions': self.evictions,
+                 }
+        for name in self._POOL_COUNTERS:
+            result[name] = 0
+        for pool in self.pools.itervalues():
+            for name in self._POOL_COUNTERS:
+                result[name] += getattr(pool, name)
+        if per_pool:
+            result['pool_stats'] = dict(
+                (key, pool.snapshot()) for key, pool in self.pools.iteritems())
+        return result
+
+    def start(self):
+        """Start the background sweeper and pre-warming.
+
+        The sweeper is a coro thread that calls `expire` when the next idle
+        connection is due to expire, or after `clean_interval` seconds if
+        that is sooner.  Pre-warming is a coro thread that calls `warm`
+        every second, opening at most `warm_rate` connections each time.
+        """
+        import coro
+        if self._sweeper is None:
+            self._sweeper = coro.spawn(self._sweep)
+        if self._warmer is None:
+            self._warmer = coro.spawn(self._warm)
+
+    def stop(self):
+        """Stop the background sweeper and pre-warming."""
+        if self._sweeper is not None:
+            self._sweeper.shutdown()
+            self._sweeper = None
+        if self._warmer is not None:
+            # Clear it first, `_warm` stops once it is no longer current.
+            warmer = self._warmer
+            self._warmer = None
+            warmer.shutdown()
+
+    def _warm(self):
+        import coro
+        while self._warmer is coro.current():
+            coro.sleep_relative(1)
+            try:
+                self.warm(self.warm_rate)
+            except Exception:
+                # Keep pre-warming the other pools.
+                coro.print_stderr('ConnectionManager pre-warming failed: %s\n'
+                                  % (aplib.tb.traceback_string(),))
+
+    def _sweep(self):
+        import coro
+        while True:
+            delay = self.clean_interval
+            if self._expiry_heap:
+                delay = min(delay,
+                            max(0, self._expiry_heap[0][0] - time.time()))
+            coro.sleep_relative(delay)
+            try:
+                self.expire()
+            except Exception:
+                # Keep sweeping, or idle connections would never expire.
+                coro.print_stderr('ConnectionManager sweep failed: %s\n' %
+                                  (aplib.tb.traceback_string(),))
@@ -0,0 +1,322 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/aggregate.py#1 $
+
+"""Streaming per-prefix aggregation of addresses in logs.
+
+Introduction
+============
+This module is a pipeline of small stages for the usual "which networks are
+hitting us" question.  Each stage is a generator that consumes the output of
+the previous one::
+
+    source      read_chunks     strings of whole lines
+    extract     extract         (version, addresses) batches
+    normalize   normalize       (version, addresses) batches
+    bucket      bucket          (version, prefixlen, networks, counts)
+    aggregate   aggregate       {(version, prefixlen): {network: count}}
+    sink        format_top      lines of text
+
+The stages pass batches of integers (``array.array('I')``) for IPv4 and
+strings of packed addresses for IPv6 rather than IP objects, and the
+extraction, unmapping, filtering and bucketing of addresses is done in C.
+Memory use depends on the chunk size and the number of distinct networks,
+not on the size of the input.
+
+Usage
+=====
+::
+
+    chunks = read_chunks([open('/var/log/maillog')])
+    batches = normalize(extract(chunks), exclude=ADDRESS_FLAGS.NOT_GLOBAL)
+    totals = aggregate(bucket(batches, {4: (16, 24), 6: (48, 64)}))
+    for line in format_top(totals, 10):
+        print line
+
+The same is available from the command line; it reads the named files or
+standard input::
+
+    python -m aplib.net.aggregate -4 16,24 -6 48,64 -n 10 /var/log/maillog
+"""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import optparse
+import sys
+
+from aplib.net import _net
+from aplib.net.mask import Mask4, Mask6
+from aplib.net.special import (ADDRESS_FLAGS, classify_ipv4_array,
+                               filter_ipv6_buffer)
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+DEFAULT_PREFIXLENS = {4: (24,), 6: (64,)}
+
+_MASK = {4: Mask4, 6: Mask6}
+
+def read_chunks(files, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Read files in chunks of whole lines.
+
+    :Parameters:
+        - `files`: An iterable of file objects.
+        - `chunk_size`: The number of bytes to read at a time.  A chunk is
+          longer than this if it ends in the middle of a long line.
+
+    :Return:
+        Returns an iterator of strings.  Every string but the last of each
+        file ends with a newline.
+    """
+    for fileobj in files:
+        rest = ''
+        while True:
+            data = fileobj.read(chunk_size)
+            if not data:
+                break
+            cut = data.rfind('\n') + 1
+            if not cut:
+                rest += data
+                continue
+            yield rest + data[:cut]
+            rest = data[cut:]
+        if rest:
+            yield rest
+
+def extract(chunks, versions=(4, 6)):
+    """Find the addresses in chunks of text.
+
+    :Parameters:
+        - `chunks`: An iterable of strings, such as from `read_chunks`.
+        - `versions`: The address versions to look for.
+
+    :Return:
+        Returns an iterator of ``(version, addresses)`` tuples, one per
+        chunk and version.  ``addresses`` is an ``array.array('I')`` for
+        IPv4 and a string of packed addresses, 16 bytes each in network byte
+        order, for IPv6.
+    """
+    for chunk in chunks:
+        for version in versions:
+            if version == 4:
+                yield 4, _net.extract_ipv4(chunk)
+            else:
+                yield 6, _net.extract_ipv6(chunk)
+
+def normalize(batches, unmap=True, exclude=0):
+    """Clean up batches of addresses.
+
+    :Parameters:
+        - `batches`: An iterable of ``(version, addresses)`` tuples, such as
+          from `extract`.
+        - `unmap`: If true, IPv4-mapped IPv6 addresses (``::ffff:0:0/96``)
+          are turned into IPv4 addresses.
+        - `exclude`: A mask of `ADDRESS_FLAGS`.  Addresses with any of these
+          flags are dropped.  For example ``ADDRESS_FLAGS.NOT_GLOBAL`` keeps
+          only globally reachable addresses.
+
+    :Return:
+        Returns an iterator of ``(version, addresses)`` tuples.
+    """
+    for version, addresses in batches:
+        if version == 6 and (unmap or exclude):
+            mapped, addresses = filter_ipv6_buffer(addresses, unmap, exclude)
+            if mapped:
+                for batch in normalize([(4, mapped)], False, exclude):
+                    yield batch
+        elif version == 4 and exclude:
+            flags = classify_ipv4_array(addresses)
+            addresses = array.array('I', [
+                value for value, value_flags in zip(addresses, flags)
+                if not value_flags & exclude])
+        if addresses:
+            yield version, addresses
+
+def bucket(batches, prefixlens=DEFAULT_PREFIXLENS):
+    """Count the addresses of each batch per network.
+
+    :Parameters:
+        - `batches`: An iterable of ``(version, addresses)`` tuples.
+        - `prefixlens`: Dictionary of address version to a sequence of
+          prefix lengths.  Batches of other versions are dropped.
+
+    :Return:
+        Returns an iterator of ``(version, prefixlen, networks, counts)``
+        tuples, one per batch and prefix length.  ``networks`` holds the
+        distinct network addresses of the batch as integers in ascending
+        order and ``counts`` the number of addresses in each.
+    """
+    for version, addresses in batches:
+        for prefixlen in prefixlens.get(version, ()):
+            if version == 4:
+                networks, counts = _net.count_ipv4_buffer(addresses,
+                                                          prefixlen)
+            else:
+                networks, counts = _net.count_ipv6_buffer(addresses,
+                                                          prefixlen)
+            yield version, prefixlen, networks, counts
+
+def aggregate(buckets):
+    """Add up bucketed counts.
+
+    :Parameters:
+        - `buckets`: An iterable of ``(version, prefixlen, networks,
+          counts)`` tuples, such as from `bucket`.
+
+    :Return:
+        Returns a dictionary of ``(version, prefixlen)`` to a dictionary of
+        network address to count.
+    """
+    totals = {}
+    for version, prefixlen, networks, counts in buckets:
+        table = totals.get((version, prefixlen))
+        if table is None:
+            table = totals[(version, prefixlen)] = {}
+        get = table.get
+        for network, count in zip(networks, counts):
+            table[network] = get(network, 0) + count
+    return totals
+
+def format_top(totals, n=10):
+    """Format the busiest networks of each prefix length.
+
+    :Parameters:
+        - `totals`: The result of `aggregate`.
+        - `n`: The number of networks to list per prefix length, or None
+          for all of them.
+
+    :Return:
+        Returns an iterator of lines (without newlines).  Each prefix length
+        starts with a header line of the form ``# IPv4 /24: 12 networks, 345
+        addresses``, followed by lines of the form ``<count> <network>``,
+        largest count first.
+    """
+    for version, prefixlen in sorted(totals):
+        table = totals[(version, prefixlen)]
+        yield '# IPv%i /%i: %i networks, %i addresses' % (
+            version, prefixlen, len(table), sum(table.itervalues()))
+        entries = sorted(table.iteritems(),
+                         key=lambda item: (-item[1], item[0]))
+        if n is not None:
+            entries = entries[:n]
+        if not entries:
+            continue
+        networks = [network for network, unused in entries]
+        text = _net.format_many(networks, version, '\n').split('\n')
+        for (network, count), network_text in zip(entries, text):
+            yield '%i %s/%i' % (count, network_text, prefixlen)
+
+def _open_files(paths):
+    for path in paths:
+        fileobj = open(path, 'rb')
+        try:
+            yield fileobj
+        finally:
+            fileobj.close()
+
+def _parse_prefixlens(option, opt_str, value, parser, version):
+    try:
+        lengths = tuple(int(item) for item in value.split(',') if item)
+    except ValueError:
+        raise optparse.OptionValueError('%s: bad prefix lengths %r' %
+                                        (opt_str, value))
+    for prefixlen in lengths:
+        if prefixlen < 0 or prefixlen > _MASK[version].WIDTH:
+            raise optparse.OptionValueError('%s: bad prefix length %i' %
+                                            (opt_str, prefixlen))
+    parser.values.prefixlens[version] = lengths
+
+def main(argv=None, stdin=None, stdout=None):
+    """Command line entry point.
+
+    :Parameters:
+        - `argv`: The arguments, not including the program name.  Defaults
+          to ``sys.argv[1:]``.
+        - `stdin`: The file to read when no files are named.
+        - `stdout`: The file to write the results to.
+
+    :Return:
+        Returns the exit status, 1 if a file could not be opened or read.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if stdin is None:
+        stdin = sys.stdin
+    if stdout is None:
+        stdout = sys.stdout
+    parser = optparse.OptionParser(
+        usage='python -m aplib.net.aggregate [options] [file ...]',
+        description='Count the IP addresses in text files (or standard '
+                    'input) per network and print the busiest networks.')
+    parser.set_defaults(prefixlens=dict(DEFAULT_PREFIXLENS))
+    parser.add_option('-4', type='string', action='callback',
+                      callback=_parse_prefixlens, callback_args=(4,),
+                      metavar='LENGTHS',
+                      help='IPv4 prefix lengths, comma separated, or empty '
+                           'to skip IPv4 (default 24)')
+    parser.add_option('-6', type='string', action='callback',
+                      callback=_parse_prefixlens, callback_args=(6,),
+                      metavar='LENGTHS',
+                      help='IPv6 prefix lengths (default 64)')
+    parser.add_option('-n', '--top', type='int', default=10,
+                      help='networks to print per prefix length, 0 for all '
+                           '(default 10)')
+    parser.add_option('-g', '--global-only', action='store_true',
+                      default=False,
+                      help='ignore addresses that are not globally reachable')
+    parser.add_option('--no-unmap', dest='unmap', action='store_false',
+                      default=True,
+                      help='count IPv4-mapped IPv6 addresses as IPv6')
+    options, args = parser.parse_args(argv)
+    prefixlens = dict((version, lengths) for version, lengths
+                      in options.prefixlens.iteritems() if lengths)
+    if args:
+        files = _open_files(args)
+    else:
+        files = [stdin]
+    if options.global_only:
+        exclude = ADDRESS_FLAGS.NOT_GLOBAL
+    else:
+        exclude = 0
+    # Mapped addresses are found by the IPv6 scan, so keep scanning for
+    # IPv6 when unmapping even if no IPv6 prefix lengths were asked for.
+    versions = sorted(prefixlens)
+    if options.unmap and 4 in prefixlens and 6 not in prefixlens:
+        versions.append(6)
+    batches = normalize(extract(read_chunks(files), versions),
+                        options.unmap, exclude)
+    try:
+        totals = aggregate(bucket(batches, prefixlens))
+    except EnvironmentError, e:
+        if e.filename is not None:
+            sys.stderr.write('%s: %s\n' % (e.filename, e.strerror))
+        else:
+            sys.stderr.write('%s\n' % (e,))
+        return 1
+    for version in prefixlens:
+        for prefixlen in prefixlens[version]:
+            totals.setdefault((version, prefixlen), {})
+    for line in format_top(totals, options.top or None):
+        stdout.write(line + '\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,375 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/allocator.py#1 $
+
+"""Address allocator.
+
+Introduction
+============
+`AddressAllocator` hands out addresses, and aligned networks, from a pool
+given as a `Prefix` or `IPRange`::
+
+    >>> pool = AddressAllocator(Prefix('10.0.0.0/24'),
+    ...                         reserved=[IPGlob('10.0.0.0-9')])
+    >>> pool.allocate()
+    IPv4('10.0.0.10')
+    >>> pool.allocate_prefix(28)
+    Prefix('10.0.0.16/28')
+    >>> pool.free(IP('10.0.0.10'))
+
+Implementation
+==============
+The pool is a binary tree of aligned blocks, the root being the smallest
+aligned block that holds the whole pool.  Every node records how many
+addresses in its block are free and the size (as a power of two) of the
+largest aligned block below it that is completely free.  Allocating a single
+address or a network walks down from the root to a block that fits, and
+updates the nodes on the way back up, so every operation takes time
+proportional to the address width, no matter how full the pool is.
+
+Nodes are only stored while their block is partly used.  The children of a
+completely free or completely used block are implied, and are created when
+an allocation or free splits it, so memory depends on how fragmented the
+pool is rather than its size.  This means that pools as large as an IPv6
+``/64`` are fine.
+"""
+
+__version__ = '$Revision: #1 $'
+
+from aplib.net.exceptions import AllocatorFullError
+from aplib.net.mask import Mask4, Mask6
+
+_MASK = {4: Mask4, 6: Mask6}
+
+class AddressAllocator(object):
+
+    """Allocator of addresses and aligned networks from a pool.
+
+    :IVariables:
+        - `version`: The address version of the pool.
+        - `first`: The first address of the pool as an integer.
+        - `last`: The last address of the pool as an integer.
+    """
+
+    def __init__(self, pool, reserved=()):
+        """Create an allocator with every address of the pool free.
+
+        :Parameters:
+            - `pool`: A `Prefix` or other `IPRange`.
+            - `reserved`: An iterable of IP objects and `IPRange` objects to
+              mark as allocated.  See `reserve`.
+        """
+        self.version = pool.first.version
+        self.first = pool.first.ip
+        self.last = pool.last.ip
+        self._order = (self.first ^ self.last).bit_length()
+        self._base = self.first >> self._order << self._order
+        size = 1 << self._order
+        # node -> (largest free order or -1, free count).  Node 1 is the
+        # root, the children of node n are 2n and 2n + 1.
+        self._nodes = {1: (self._order, size)}
+        if self.first > self._base:
+            self._set(self._base, self.first - 1, False)
+        if self.last < self._base + size - 1:
+            self._set(self.last + 1, self._base + size - 1, False)
+        for item in reserved:
+            self.reserve(item)
+
+    def available(self):
+        """Get the number of free addresses.
+
+        :Return:
+            Returns the number of free addresses.
+        """
+        return self._nodes[1][1]
+
+    def _split(self, node, order):
+        """Make sure the children of a node are stored."""
+        best, count = self._nodes[node]
+        if count == 0:
+            child = (-1, 0)
+        elif count == 1 << order:
+            child = (order - 1, count >> 1)
+        else:
+            return
+        self._nodes[2 * node] = self._nodes[2 * node + 1] = child
+
+    def _drop_children(self, node):
+        """Forget the descendants of a completely free or used node."""
+        nodes = self._nodes
+        stack = [node]
+        while stack:
+            parent = stack.pop()
+            for child in (2 * parent, 2 * parent + 1):
+                if child in nodes:
+                    del nodes[child]
+                    stack.append(child)
+
+    def _join(self, node, order):
+        """Update a node from its children."""
+        nodes = self._nodes
+        left_best, left_count = nodes[2 * node]
+        right_best, right_count = nodes[2 * node + 1]
+        count = left_count + right_count
+        if count == 0 or count == 1 << order:
+            if count:
+                nodes[node] = (order, count)
+            else:
+                nodes[node] = (-1, 0)
+            self._drop_children(node)
+        else:
+            nodes[node] = (max(left_best, right_best), count)
+
+    def _set(self, first, last, free, node=1, order=None, start=None):
+        """Mark a range of addresses as free or allocated.
+
+        :Return:
+            Returns the number of addresses whose state changed.
+        """
+        if order is None:
+            order = self._order
+            start = self._base
+        end = start + (1 << order) - 1
+        if last < start or first > end:
+            return 0
+        best, count = self._nodes[node]
+        if first <= start and end <= last:
+            if free:
+                self._nodes[node] = (order, 1 << order)
+                self._drop_children(node)
+                return (1 << order) - count
+            self._nodes[node] = (-1, 0)
+            self._drop_children(node)
+            return count
+        if (free and count == 1 << order) or (not free and count == 0):
+            return 0
+        self._split(node, order)
+        half = 1 << (order - 1)
+        changed = (self._set(first, last, free, 2 * node, order - 1, start) +
+                   self._set(first, last, free, 2 * node + 1, order - 1,
+                             start + half))
+        self._join(node, order)
+        return changed
+
+    def _check_range(self, first, last):
+        if first > last or first < self.first or last > self.last:
+            raise ValueError((first, last))
+
+    def _ip(self, value, prefixlen=None):
+        if self.version == 4:
+            cls = aplib.net.ip.IPv4
+        else:
+            cls = aplib.net.ip.IPv6
+        if prefixlen is None:
+            return cls(value)
+        return cls(value, _MASK[self.version].prefixlen_to_mask(prefixlen))
+
+    def _bounds(self, item):
+        if isinstance(item, aplib.net.range.IPRange):
+            return item.first.ip, item.last.ip
+        return item.ip, item.ip
+
+    def allocate_prefix_int(self, prefixlen):
+        """Allocate an aligned network.
+
+        The smallest free block that can hold the network is used, so that
+        large blocks are kept free for as long as possible.  Among equally
+        good blocks the lowest is used.
+
+        :Parameters:
+            - `prefixlen`: The prefix length of the network.
+
+        :Return:
+            Returns the network address as an integer.
+
+        :Exceptions:
+            - `AllocatorFullError`: There is no free network of that size.
+        """
+        wanted = _MASK[self.version].WIDTH - prefixlen
+        if wanted < 0 or wanted > self._order:
+            raise ValueError(prefixlen)
+        nodes = self._nodes
+        if nodes[1][0] < wanted:
+            raise AllocatorFullError(prefixlen)
+        node = 1
+        order = self._order
+        start = self._base
+        path = []
+        while order > wanted:
+            self._split(node, order)
+            path.append((node, order))
+            left = nodes[2 * node][0]
+            right = nodes[2 * node + 1][0]
+            order -= 1
+            if left >= wanted and (right < wanted or left <= right):
+                node = 2 * node
+            else:
+                node = 2 * node + 1
+                start += 1 << order
+        nodes[node] = (-1, 0)
+        for node, order in reversed(path):
+            self._join(node, order)
+        return start
+
+    def allocate_prefix(self, prefixlen):
+        """Allocate an aligned network.
+
+        See `allocate_prefix_int`.
+
+        :Return:
+            Returns a `Prefix`.
+        """
+        return aplib.net.range.Prefix(
+            self._ip(self.allocate_prefix_int(prefixlen), prefixlen))
+
+    def allocate_int(self):
+        """Allocate one address.
+
+        :Return:
+            Returns the address as an integer.
+
+        :Exceptions:
+            - `AllocatorFullError`: The pool is full.
+        """
+        return self.allocate_prefix_int(_MASK[self.version].WIDTH)
+
+    def allocate(self):
+        """Allocate one address.
+
+        :Return:
+            Returns an IP object.
+
+        :Exceptions:
+            - `AllocatorFullError`: The pool is full.
+        """
+        return self._ip(self.allocate_int())
+
+    def free_range_int(self, first, last):
+        """Mark a range of addresses as free.
+
+        Addresses in the range that are already free are left alone.
+
+        :Parameters:
+            - `first`: The first address of the range.
+            - `last`: The last address of the range.
+
+        :Return:
+            Returns the number of addresses that were freed.
+        """
+        self._check_range(first, last)
+        return self._set(first, last, True)
+
+    def free_int(self, value):
+        """Free one address.
+
+        :Parameters:
+            - `value`: The address as an integer.
+
+        :Exceptions:
+            - `ValueError`: The address is outside the pool or is not
+              allocated.
+        """
+        if not self.free_range_int(value, value):
+            raise ValueError(value)
+
+    def free(self, item):
+        """Free an address or a network.
+
+        :Parameters:
+            - `item`: An IP object (a single address) or an `IPRange` such
+              as a `Prefix` returned by `allocate_prefix`.
+
+        :Exceptions:
+            - `ValueError`: The item is outside the pool, or a single address
+              is not allocated.
+        """
+        first, last = self._bounds(item)
+        if isinstance(item, aplib.net.range.IPRange):
+            self.free_range_int(first, last)
+        else:
+            self.free_int(first)
+
+    def reserve_range_int(self, first, last):
+        """Mark a range of addresses as allocated.
+
+        Addresses in the range that are already allocated are left alone.
+
+        :Parameters:
+            - `first`: The first address of the range.
+            - `last`: The last address of the range.
+
+        :Return:
+            Returns the number of addresses that were reserved.
+        """
+        self._check_range(first, last)
+        return self._set(first, last, False)
+
+    def reserve(self, item):
+        """Mark an address or a range as allocated.
+
+        Reserved addresses are never handed out until they are freed.
+
+        :Parameters:
+            - `item`: An IP object (a single address) or an `IPRange`.
+
+        :Return:
+            Returns the number of addresses that were reserved.
+        """
+        return self.reserve_range_int(*self._bounds(item))
+
+    def is_free_int(self, value):
+        """Check whether an address is free.
+
+        :Parameters:
+            - `value`: The address as an integer.
+
+        :Return:
+            Returns True if the address is in the pool and free.
+        """
+        if value < self.first or value > self.last:
+            return False
+        nodes = self._nodes
+        node = 1
+        order = self._order
+        while True:
+            count = nodes[node][1]
+            if count == 0:
+                return False
+            if count == 1 << order:
+                return True
+            order -= 1
+            node = 2 * node + ((value - self._base) >> order & 1)
+
+    def is_free(self, ip):
+        """Check whether an address is free.
+
+        :Parameters:
+            - `ip`: An IP object.
+
+        :Return:
+            Returns True if the address is in the pool and free.
+        """
+        return ip.version == self.version and self.is_free_int(ip.ip)
+
+# Putting this at the bottom is a bit of a hack to work around cyclical
+# import issues.
+import aplib.net.ip
+import aplib.net.range
@@ -0,0 +1,288 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/aplib.net._ip.pyx#1 $
+
+"""Pyrex-optimized storage for IP address objects.
+
+This provides `IPCore`, the base class of `aplib.net.ip.BaseIP` when this
+extension is built.  You should never need to access this module directly.
+"""
+
+__version__ = '$Revision: #1 $'
+
+from libc cimport uint32_t, uint64_t
+include "python.pxi"
+include "pyrex_helpers.pyx"
+include "u128.pxi"
+
+import copy_reg
+
+# aplib.net.range.Prefix, imported on first use to avoid an import cycle.
+cdef object _prefix_class
+
+cdef class IPCore:
+
+    """Storage, comparison and hashing for IP objects.
+
+    The address and netmask are kept as C integers (the low 32 bits of the
+    low half for IPv4, two 64-bit halves for IPv6), so comparing and hashing
+    do not touch any Python objects.  The `network` and `broadcast` objects
+    are created on first use and cached.
+
+    The address version is taken from the ``version`` attribute of the
+    subclass.
+    """
+
+    cdef uint64_t _hi, _lo
+    cdef uint64_t _mask_hi, _mask_lo
+    cdef int _prefixlen
+    cdef int _version, _width
+    cdef object _network_cache, _broadcast_cache
+
+    def __cinit__(self, *args, **kwargs):
+        version = type(self).version
+        if version == 4:
+            self._version = 4
+            self._width = 32
+        else:
+            # BaseIP itself has no version, it can't be instantiated anyway.
+            self._version = 6
+            self._width = 128
+
+    cdef void _clear_cache(self):
+        self._network_cache = None
+        self._broadcast_cache = None
+
+    cdef void _set_mask_from_prefixlen(self):
+        cdef int bits
+        if self._width == 32:
+            self._mask_hi = 0
+            if self._prefixlen == 0:
+                self._mask_lo = 0
+            else:
+                self._mask_lo = (0xffffffffU << (32 - self._prefixlen)) & \
+                                0xffffffffU
+        elif self._prefixlen <= 64:
+            bits = self._prefixlen
+            self._mask_lo = 0
+            if bits == 0:
+                self._mask_hi = 0
+            else:
+                self._mask_hi = 0xffffffffffffffffULL << (64 - bits)
+        else:
+            bits = self._prefixlen - 64
+            self._mask_hi = 0xffffffffffffffffULL
+            self._mask_lo = 0xffffffffffffffffULL << (64 - bits)
+
+    def __reduce__(self):
+        """Pickle as the `aplib.net.codec.encode_ip` form of the address.
+
+        ``copy_reg.__newobj__`` lets protocol 2 create the object with
+        ``cls.__new__`` directly, and `__setstate__` decodes the address.
+        """
+        cdef unsigned char buf[17]
+        cdef Py_ssize_t size
+        cdef int i
+        if self._width == 32:
+            buf[0] = self._prefixlen
+            for i from 4 >= i >= 1:
+                buf[i] = (self._lo >> (8 * (4 - i))) & 0xff
+            size = 5
+        else:
+            buf[0] = 0x40 + self._prefixlen
+            _store_u64(buf + 1, self._hi)
+            _store_u64(buf + 9, self._lo)
+            size = 17
+        state = PyString_FromStringAndSize(<char *> buf, size)
+        instance_dict = getattr(self, '__dict__', None)
+        if instance_dict:
+            state = (state, instance_dict)
+        return (copy_reg.__newobj__, (type(self),), state)
+
+    def __setstate__(self, state):
+        """Restore a pickled object.
+
+        The state is the `aplib.net.codec.encode_ip` form of the address,
+        which is decoded here without creating any Python integers.  A
+        ``(encoded, dict)`` tuple also restores the instance dictionary of a
+        subclass, and the ``(ip, prefixlen, netmask)`` tuple of old pickles
+        is accepted too.
+        """
+        cdef unsigned char *data
+        cdef Py_ssize_t length
+        cdef unsigned int tag
+        if not PyString_CheckExact(state):
+            if len(state) == 2:
+                self.__setstate__(state[0])
+                self.__dict__.update(state[1])
+            else:
+                self.ip, self.prefixlen, self._netmask = state
+            return
+        data = <unsigned char *> PyString_AS_STRING(state)
+        length = PyString_GET_SIZE(state)
+        if length == 0:
+            raise ValueError(state)
+        tag = data[0]
+        if self._width == 32:
+            if length != 5 or tag > 32:
+                raise ValueError(state)
+            self._hi = 0
+            self._lo = ((<uint64_t> data[1] << 24) |
+                        (<uint64_t> data[2] << 16) |
+                        (<uint64_t> data[3] << 8) | <uint64_t> data[4])
+            self._prefixlen = tag
+        else:
+            if length != 17 or tag < 0x40 or tag > 0xc0:
+                raise ValueError(state)
+            self._hi = _load_u64(data + 1)
+            self._lo = _load_u64(data + 9)
+            self._prefixlen = tag - 0x40
+        self._set_mask_from_prefixlen()
+        self._clear_cache()
+
+    property ip:
+
+        """The IP address as an integer in host-byte order."""
+
+        def __get__(self):
+            return _u128_to_value(self._version, self._hi, self._lo)
+
+        def __set__(self, value):
+            _value_to_u128(self._version, value, &self._hi, &self._lo)
+            self._clear_cache()
+
+    property prefixlen:
+
+        """The prefix length of the network."""
+
+        def __get__(self):
+            return self._prefixlen
+
+        def __set__(self, int value):
+            if value < 0 or value > self._width:
+                raise OverflowError(value)
+            self._prefixlen = value
+            self._clear_cache()
+
+    property _netmask:
+
+        """The netmask as an integer."""
+
+        def __get__(self):
+            return _u128_to_value(self._version, self._mask_hi,
+                                  self._mask_lo)
+
+        def __set__(self, value):
+            _value_to_u128(self._version, value, &self._mask_hi,
+                           &self._mask_lo)
+            self._clear_cache()
+
+    property network:
+
+        """The network for this IP.
+
+        The value is an `aplib.net.range.Prefix` instance that represents the
+        network for this IP.
+        """
+
+        def __get__(self):
+            global _prefix_class
+            if self._network_cache is None:
+                if _prefix_class is None:
+                    import aplib.net.range
+                    _prefix_class = aplib.net.range.Prefix
+                self._network_cache = _prefix_class(self)
+            return self._network_cache
+
+    property broadcast:
+
+        """The broadcast address for this IP.
+
+        IPv6 doesn't really have a concept of a "broadcast address". However,
+        it is sometimes convenient to get the last IP address in a network
+        range, and the terminology is in common use to represent the last IP,
+        so for IPv6 it just returns the last IP in the network.
+
+        The value is a `BaseIP` instance that represents the "broadcast"
+        address for this IP.
+        """
+
+        def __get__(self):
+            cdef IPCore result
+            if self._broadcast_cache is None:
+                cls = type(self)
+                result = cls.__new__(cls)
+                result._hi = self._hi | ~self._mask_hi
+                result._lo = self._lo | ~self._mask_lo
+                result._mask_hi = 0xffffffffffffffffULL
+                result._mask_lo = 0xffffffffffffffffULL
+                if self._width == 32:
+                    result._hi = 0
+                    result._lo = result._lo & 0xffffffffU
+                    result._mask_hi = 0
+                    result._mask_lo = 0xffffffffU
+                result._prefixlen = self._width
+                self._broadcast_cache = result
+            return self._broadcast_cache
+
+    def __hash__(self):
+        cdef uint64_t h
+        cdef long result
+        h = self._hi * 0x9e3779b97f4a7c15ULL
+        h = (h ^ self._lo) * 0x100000001b3ULL
+        h = h ^ <uint64_t> (self._prefixlen << 8 | self._version)
+        result = <long> (h ^ (h >> 32))
+        if result == -1:
+            result = -2
+        return result
+
+    def __richcmp__(IPCore self, other, int op):
+        cdef IPCore b
+        cdef int c
+        if not isinstance(other, IPCore):
+            # Some other IP-like object.
+            try:
+                return PyObject_RichCompare(
+                    (self._version, self.ip, self._prefixlen),
+                    (other.version, other.ip, other.prefixlen), op)
+            except AttributeError:
+                return NotImplemented
+        b = other
+        if self._version != b._version:
+            c = self._version - b._version
+        elif self._hi != b._hi:
+            c = (self._hi > b._hi) * 2 - 1
+        elif self._lo != b._lo:
+            c = (self._lo > b._lo) * 2 - 1
+        else:
+            c = self._prefixlen - b._prefixlen
+        if op == 0:
+            return c < 0
+        elif op == 1:
+            return c <= 0
+        elif op == 2:
+            return c == 0
+        elif op == 3:
+            return c != 0
+        elif op == 4:
+            return c > 0
+        else:
+            return c >= 0
@@ -28,11 +28,14 @@ should never need to access this module directly.
 
 __version__ = '$Revision: #4 $'
 
-from libc cimport uint32_t
+from libc cimport uint32_t, uint64_t
 cimport libc
 from stdio cimport sprintf
 include "python.pxi"
 include "pyrex_helpers.pyx"
+include "u128.pxi"
+
+import array
 
 cdef extern from "sys/socket.h":
     enum: AF_INET6
@@ -76,8 +79,20 @@ cdef extern from "arpa/inet.h":
     enum: INET_ADDRSTRLEN
     enum: INET6_ADDRSTRLEN
 
-    cdef char * inet_ntop(int, void *, char *, int)
-    cdef int inet_pton(int, char *, void *)
+    cdef char * inet_ntop(int, void *, char *, int) nogil
+    cdef int inet_pton(int, char *, void *) nogil
+
+# The libc declarations are not marked nogil.
+cdef extern from "stdlib.h":
+    void *_realloc_nogil "realloc" (void *, libc.size_t) nogil
+    void _free_nogil "free" (void *) nogil
+    void _qsort_nogil "qsort" (void *, libc.size_t, libc.size_t,
+                               int (*)(const void *, const void *) nogil) nogil
+
+cdef extern from "string.h":
+    void *_memcpy_nogil "memcpy" (void *, void *, libc.size_t) nogil
+    libc.size_t _strlen_nogil "strlen" (char *) nogil
+    int _memcmp_nogil "memcmp" (const void *, const void *, libc.size_t) nogil
 
 class ND:
     """For IPv6's Neighbor discovery protocol."""
@@ -393,3 +408,1611 @@ def if_name_to_index(if_name):
 
     return idx
 
+
+##############################################################################
+# Binary encoding of addresses.
+#
+# An address is encoded as a tag byte followed by the address in network
+# byte order (4 bytes for IPv4, 16 bytes for IPv6).  The tag holds the
+# version and the prefix length:
+#
+#   0x00 - 0x20     IPv4, prefix length 0 - 32
+#   0x40 - 0xc0     IPv6, prefix length 0 - 128
+##############################################################################
+
+cdef enum:
+    _TAG_IPV6 = 0x40
+    _PACKED_IPV4_SIZE = 5
+    _PACKED_IPV6_SIZE = 17
+
+cdef int _read_buffer(object data, unsigned char **ptr, Py_ssize_t *length) except -1:
+    """Get a pointer to the contents of an object supporting the buffer
+    interface."""
+    cdef void *buf
+    PyObject_AsReadBuffer(data, &buf, length)
+    ptr[0] = <unsigned char *> buf
+    return 0
+
+cdef Py_ssize_t _pack_address(unsigned char *out, int version, object ip,
+                              unsigned int prefixlen) except -1:
+    """Encode an address into `out`, which must have room for 17 bytes.
+
+    :Return:
+        Returns the number of bytes written.
+    """
+    cdef uint32_t value
+    cdef uint64_t hi, lo
+    if version == 4:
+        if prefixlen > 32:
+            raise ValueError(prefixlen)
+        value = ip
+        out[0] = prefixlen
+        out[1] = value >> 24
+        out[2] = value >> 16
+        out[3] = value >> 8
+        out[4] = value
+        return _PACKED_IPV4_SIZE
+    elif version == 6:
+        if prefixlen > 128:
+            raise ValueError(prefixlen)
+        _long_to_u128(ip, &hi, &lo)
+        out[0] = _TAG_IPV6 + prefixlen
+        _store_u64(out + 1, hi)
+        _store_u64(out + 9, lo)
+        return _PACKED_IPV6_SIZE
+    else:
+        raise ValueError(version)
+
+cdef object _unpack_address(unsigned char *data, Py_ssize_t length,
+                            int *version, unsigned int *prefixlen,
+                            Py_ssize_t *used):
+    """Decode an address encoded with `_pack_address`.
+
+    :Return:
+        Returns the address as an integer.  The number of bytes consumed is
+        stored in `used`.
+    """
+    cdef unsigned int tag
+    if length < 1:
+        raise ValueError('truncated address')
+    tag = data[0]
+    if tag <= 32:
+        if length < _PACKED_IPV4_SIZE:
+            raise ValueError('truncated address')
+        version[0] = 4
+        prefixlen[0] = tag
+        used[0] = _PACKED_IPV4_SIZE
+        return minimal_ulong((<uint32_t> data[1] << 24) |
+                             (<uint32_t> data[2] << 16) |
+                             (<uint32_t> data[3] << 8) |
+                             <uint32_t> data[4])
+    elif tag >= _TAG_IPV6 and tag <= _TAG_IPV6 + 128:
+        if length < _PACKED_IPV6_SIZE:
+            raise ValueError('truncated address')
+        version[0] = 6
+        prefixlen[0] = tag - _TAG_IPV6
+        used[0] = _PACKED_IPV6_SIZE
+        return _u128_to_long(_load_u64(data + 1), _load_u64(data + 9))
+    else:
+        raise ValueError('bad address tag %d' % (tag,))
+
+cdef object _netmask_int(int version, unsigned int prefixlen):
+    cdef uint64_t hi, lo
+    if version == 4:
+        if prefixlen == 0:
+            return 0
+        return minimal_ulong(<uint32_t> (0xffffffffU << (32 - prefixlen)))
+    if prefixlen == 0:
+        hi = 0
+        lo = 0
+    elif prefixlen <= 64:
+        hi = 0xffffffffffffffffULL << (64 - prefixlen)
+        lo = 0
+    else:
+        hi = 0xffffffffffffffffULL
+        lo = 0xffffffffffffffffULL << (128 - prefixlen)
+    return _u128_to_long(hi, lo)
+
+def pack_ip(int version, ip, unsigned int prefixlen):
+    """Encode an address in binary form.
+
+    :Parameters:
+        - `version`: The address version, 4 or 6.
+        - `ip`: The address as an integer.
+        - `prefixlen`: The prefix length.
+
+    :Return:
+        Returns a string of 5 bytes for IPv4 or 17 bytes for IPv6.
+
+    :Exceptions:
+        - `ValueError`: The version or prefix length is invalid.
+        - `OverflowError`: The address is out of range.
+    """
+    cdef unsigned char out[_PACKED_IPV6_SIZE]
+    cdef Py_ssize_t size
+    size = _pack_address(out, version, ip, prefixlen)
+    return PyString_FromStringAndSize(<char *> out, size)
+
+def unpack_ip(data, Py_ssize_t offset=0):
+    """Decode an address encoded with `pack_ip`.
+
+    :Parameters:
+        - `data`: A string or other object supporting the buffer interface.
+        - `offset`: Where in `data` the address starts.
+
+    :Return:
+        Returns a tuple ``(version, ip, prefixlen, next_offset)`` where
+        ``next_offset`` is the offset of the byte following the address.
+
+    :Exceptions:
+        - `ValueError`: The data is not a valid encoded address.
+    """
+    cdef unsigned char *ptr
+    cdef Py_ssize_t length, used
+    cdef int version
+    cdef unsigned int prefixlen
+    cdef object ip
+    _read_buffer(data, &ptr, &length)
+    if offset < 0 or offset > length:
+        raise ValueError(offset)
+    ip = _unpack_address(ptr + offset, length - offset, &version,
+                         &prefixlen, &used)
+    return (version, ip, prefixlen, offset + used)
+
+def pack_ips(ips):
+    """Encode a sequence of IP objects in binary form.
+
+    :Parameters:
+        - `ips`: A sequence of IP objects (anything with ``version``, ``ip``
+          and ``prefixlen`` attributes).
+
+    :Return:
+        Returns a string holding the encoded addresses back to back.
+    """
+    cdef Py_ssize_t i, n, used
+    cdef unsigned char *buf
+    cdef object result
+    ips = PySequence_Fast(ips, 'expected a sequence')
+    n = PySequence_Fast_GET_SIZE(ips)
+    buf = <unsigned char *> Pyrex_Malloc_SAFE(n * _PACKED_IPV6_SIZE + 1)
+    try:
+        used = 0
+        for i from 0 <= i < n:
+            ip = PySequence_Fast_GET_ITEM_SAFE(ips, i)
+            used = used + _pack_address(buf + used, ip.version, ip.ip,
+                                        ip.prefixlen)
+        result = PyString_FromStringAndSize(<char *> buf, used)
+    finally:
+        Pyrex_Free_SAFE(buf)
+    return result
+
+def unpack_ips(data, ipv4_class, ipv6_class):
+    """Decode addresses encoded with `pack_ips`.
+
+    The objects are created without calling ``__init__``; the ``ip``,
+    ``prefixlen`` and ``_netmask`` attributes are set directly.
+
+    :Parameters:
+        - `data`: A string or other object supporting the buffer interface.
+        - `ipv4_class`: The class to use for IPv4 addresses.
+        - `ipv6_class`: The class to use for IPv6 addresses.
+
+    :Return:
+        Returns a list of IP objects.
+
+    :Exceptions:
+        - `ValueError`: The data is not a valid list of encoded addresses.
+    """
+    cdef unsigned char *ptr
+    cdef Py_ssize_t length, offset, used
+    cdef int version
+    cdef unsigned int prefixlen
+    cdef object ip, obj, cls
+    _read_buffer(data, &ptr, &length)
+    result = []
+    offset = 0
+    while offset < length:
+        ip = _unpack_address(ptr + offset, length - offset, &version,
+                             &prefixlen, &used)
+        offset = offset + used
+        if version == 4:
+            cls = ipv4_class
+        else:
+            cls = ipv6_class
+        obj = cls.__new__(cls)
+        obj.ip = ip
+        obj.prefixlen = prefixlen
+        obj._netmask = _netmask_int(version, prefixlen)
+        result.append(obj)
+    return result
+
+##############################################################################
+# Delta encoding of sorted addresses.
+#
+# Each address is stored as the unsigned LEB128 varint of its difference from
+# the previous address.  IPv6 addresses are handled as two 64-bit halves.
+# Prefix lengths, if present, follow each address as the zig-zag varint of
+# their difference from the previous prefix length.
+##############################################################################
+
+cdef enum:
+    # Longest varint of a 128-bit value.
+    _MAX_VARINT_SIZE = 19
+
+cdef Py_ssize_t _write_varint(unsigned char *out, uint64_t hi, uint64_t lo):
+    cdef Py_ssize_t n
+    n = 0
+    while hi or lo >= 0x80:
+        out[n] = (lo & 0x7f) | 0x80
+        n = n + 1
+        lo = (lo >> 7) | (hi << 57)
+        hi = hi >> 7
+    out[n] = <unsigned char> lo
+    return n + 1
+
+cdef Py_ssize_t _read_varint(unsigned char *data, Py_ssize_t length,
+                             uint64_t *hi, uint64_t *lo) except -1:
+    """Read a varint of up to 128 bits.
+
+    :Return:
+        Returns the number of bytes consumed.
+    """
+    cdef Py_ssize_t i
+    cdef unsigned int shift
+    cdef uint64_t part, h, l
+    h = 0
+    l = 0
+    shift = 0
+    for i from 0 <= i < length:
+        part = data[i] & 0x7f
+        if shift < 64:
+            l = l | (part << shift)
+            if shift > 57:
+                h = h | (part >> (64 - shift))
+        else:
+            if shift == 126 and part > 3:
+                raise ValueError('varint out of range')
+            h = h | (part << (shift - 64))
+        if not data[i] & 0x80:
+            hi[0] = h
+            lo[0] = l
+            return i + 1
+        shift = shift + 7
+        if shift > 126:
+            raise ValueError('varint out of range')
+    raise ValueError('truncated varint')
+
+def encode_deltas(int version, values, base=0, prefixlens=None):
+    """Delta encode a sorted sequence of addresses.
+
+    :Parameters:
+        - `version`: The address version, 4 or 6.
+        - `values`: A sequence of addresses as integers in ascending order.
+        - `base`: The value the first delta is taken from.  It must not be
+          greater than the first value.
+        - `prefixlens`: An optional sequence of prefix lengths, one for each
+          value.
+
+    :Return:
+        Returns the encoded string.
+
+    :Exceptions:
+        - `ValueError`: The values are not sorted, or a prefix length is out
+          of range.
+        - `OverflowError`: A value is out of range for the version.
+    """
+    cdef Py_ssize_t i, n, used
+    cdef uint64_t hi, lo, prev_hi, prev_lo, delta_hi, delta_lo
+    cdef int prefixlen, prev_prefixlen, diff, width
+    cdef unsigned int zigzag
+    cdef unsigned char *buf
+    cdef object result
+
+    if version == 4:
+        width = 32
+    else:
+        width = 128
+    values = PySequence_Fast(values, 'expected a sequence')
+    n = PySequence_Fast_GET_SIZE(values)
+    if prefixlens is not None:
+        prefixlens = PySequence_Fast(prefixlens, 'expected a sequence')
+        if PySequence_Fast_GET_SIZE(prefixlens) != n:
+            raise ValueError('values and prefixlens differ in length')
+    _value_to_u128(version, base, &prev_hi, &prev_lo)
+    prev_prefixlen = width
+    buf = <unsigned char *> Pyrex_Malloc_SAFE(n * (_MAX_VARINT_SIZE + 2) + 1)
+    try:
+        used = 0
+        for i from 0 <= i < n:
+            _value_to_u128(version, PySequence_Fast_GET_ITEM_SAFE(values, i),
+                           &hi, &lo)
+            if hi < prev_hi or (hi == prev_hi and lo < prev_lo):
+                raise ValueError('values are not sorted')
+            delta_lo = lo - prev_lo
+            delta_hi = hi - prev_hi - (lo < prev_lo)
+            used = used + _write_varint(buf + used, delta_hi, delta_lo)
+            prev_hi = hi
+            prev_lo = lo
+            if prefixlens is not None:
+                prefixlen = PySequence_Fast_GET_ITEM_SAFE(prefixlens, i)
+                if prefixlen < 0 or prefixlen > width:
+                    raise ValueError(prefixlen)
+                diff = prefixlen - prev_prefixlen
+                zigzag = (diff << 1) ^ (diff >> 31)
+                used = used + _write_varint(buf + used, 0, zigzag)
+                prev_prefixlen = prefixlen
+        result = PyString_FromStringAndSize(<char *> buf, used)
+    finally:
+        Pyrex_Free_SAFE(buf)
+    return result
+
+def decode_deltas(data, int version, Py_ssize_t count, base=0,
+                  int with_prefixlens=0, Py_ssize_t offset=0):
+    """Decode addresses encoded with `encode_deltas`.
+
+    :Parameters:
+        - `data`: A string or other object supporting the buffer interface.
+        - `version`: The address version, 4 or 6.
+        - `count`: The number of addresses to decode.
+        - `base`: The base that was given to `encode_deltas`.
+        - `with_prefixlens`: Whether prefix lengths were encoded.
+        - `offset`: Where in `data` the encoded addresses start.
+
+    :Return:
+        Returns a tuple ``(values, prefixlens, next_offset)``.  ``values``
+        is a list of integers.  ``prefixlens`` is a list of integers, or None
+        if `with_prefixlens` is false.  ``next_offset`` is the offset of the
+        byte following the decoded data.
+
+    :Exceptions:
+        - `ValueError`: The data is invalid.
+    """
+    cdef unsigned char *ptr
+    cdef Py_ssize_t length, i
+    cdef uint64_t hi, lo, delta_hi, delta_lo, zigzag
+    cdef int prefixlen, width
+
+    if version == 4:
+        width = 32
+    else:
+        width = 128
+    _read_buffer(data, &ptr, &length)
+    if offset < 0 or offset > length or count < 0:
+        raise ValueError(offset)
+    _value_to_u128(version, base, &hi, &lo)
+    prefixlen = width
+    values = PyList_New(count)
+    if with_prefixlens:
+        prefixlens = PyList_New(count)
+    else:
+        prefixlens = None
+    for i from 0 <= i < count:
+        offset = offset + _read_varint(ptr + offset, length - offset,
+                                       &delta_hi, &delta_lo)
+        lo = lo + delta_lo
+        delta_hi = delta_hi + (lo < delta_lo)
+        if hi + delta_hi < hi or (version == 4 and (hi or lo > 0xffffffffU)):
+            raise ValueError('address out of range')
+        hi = hi + delta_hi
+        PyList_SET_ITEM_SAFE(values, i, _u128_to_value(version, hi, lo))
+        if with_prefixlens:
+            offset = offset + _read_varint(ptr + offset, length - offset,
+                                           &delta_hi, &zigzag)
+            prefixlen = prefixlen + <int> ((zigzag >> 1) ^ (-(zigzag & 1)))
+            if delta_hi or prefixlen < 0 or prefixlen > width:
+                raise ValueError('prefix length out of range')
+            PyList_SET_ITEM_SAFE(prefixlens, i, prefixlen)
+    return (values, prefixlens, offset)
+
+##############################################################################
+# Bulk formatting.
+##############################################################################
+
+cdef enum:
+    # "255.255.255.255/32" and "ffff:...:ffff/128"
+    _MAX_IPV4_TEXT = 18
+    _MAX_IPV6_TEXT = 43
+
+cdef Py_ssize_t _fmt_decimal(char *out, unsigned int value, int digits) nogil:
+    """Write a value below 1000 in decimal.
+
+    If `digits` is non-zero, the value is zero-padded to that many digits.
+    """
+    cdef Py_ssize_t n
+    if not digits:
+        if value >= 100:
+            digits = 3
+        elif value >= 10:
+            digits = 2
+        else:
+            digits = 1
+    for n from digits > n >= 0:
+        out[n] = c'0' + value % 10
+        value = value / 10
+    return digits
+
+cdef Py_ssize_t _fmt_ipv4(char *out, uint32_t ip, int fixed_width) nogil:
+    cdef Py_ssize_t n
+    cdef int i, digits
+    if fixed_width:
+        digits = 3
+    else:
+        digits = 0
+    n = 0
+    for i from 24 >= i >= 0 by 8:
+        n = n + _fmt_decimal(out + n, (ip >> i) & 0xff, digits)
+        if i:
+            out[n] = c'.'
+            n = n + 1
+    return n
+
+cdef Py_ssize_t _fmt_ipv6(char *out, uint64_t hi, uint64_t lo,
+                          int fixed_width) nogil:
+    cdef unsigned char packed[16]
+    cdef char text[INET6_ADDRSTRLEN]
+    cdef Py_ssize_t n, length
+    cdef int i
+    cdef uint64_t half
+    if fixed_width:
+        n = 0
+        for i from 0 <= i < 8:
+            if i < 4:
+                half = hi >> (48 - 16 * i)
+            else:
+                half = lo >> (48 - 16 * (i - 4))
+            out[n] = lower_hex_nums[(half >> 12) & 0xf]
+            out[n + 1] = lower_hex_nums[(half >> 8) & 0xf]
+            out[n + 2] = lower_hex_nums[(half >> 4) & 0xf]
+            out[n + 3] = lower_hex_nums[half & 0xf]
+            n = n + 4
+            if i < 7:
+                out[n] = c':'
+                n = n + 1
+        return n
+    _store_u64(packed, hi)
+    _store_u64(packed + 8, lo)
+    inet_ntop(AF_INET6, packed, text, INET6_ADDRSTRLEN)
+    length = _strlen_nogil(text)
+    _memcpy_nogil(out, text, length)
+    return length
+
+cdef Py_ssize_t _format_into(char *out, int version, uint32_t *values4,
+                             uint64_t *values6, unsigned char *prefixlens,
+                             Py_ssize_t n, char *sep, Py_ssize_t sep_len,
+                             int always_prefix, int fixed_width) nogil:
+    """Format addresses into a buffer.
+
+    IPv4 addresses are read from `values4`, IPv6 addresses from `values6`
+    as pairs of 64-bit halves.  `prefixlens` may be NULL for full-width
+    prefixes.
+
+    :Return:
+        Returns the number of bytes written.
+    """
+    cdef Py_ssize_t i, used
+    cdef unsigned int prefixlen, width
+    if version == 4:
+        width = 32
+    else:
+        width = 128
+    prefixlen = width
+    used = 0
+    for i from 0 <= i < n:
+        if i:
+            _memcpy_nogil(out + used, sep, sep_len)
+            used = used + sep_len
+        if version == 4:
+            used = used + _fmt_ipv4(out + used, values4[i], fixed_width)
+        else:
+            used = used + _fmt_ipv6(out + used, values6[2 * i],
+                                    values6[2 * i + 1], fixed_width)
+        if prefixlens != NULL:
+            prefixlen = prefixlens[i]
+        if always_prefix or prefixlen != width:
+            out[used] = c'/'
+            used = used + 1
+            used = used + _fmt_decimal(out + used, prefixlen, 0)
+    return used
+
+def format_many(ints, int version, sep='\n', int always_prefix=0,
+                prefixlens=None, int fixed_width=0):
+    """Format many addresses into one string.
+
+    This gives the same text as formatting each address with
+    ``aplib.net.ip.BaseIP.format`` and joining the results with `sep`, but
+    the addresses are written straight into a single buffer.
+
+    :Parameters:
+        - `ints`: A sequence of addresses as integers.
+        - `version`: The address version, 4 or 6.
+        - `sep`: The string written between addresses.
+        - `always_prefix`: If true, always include the network prefix.
+          Otherwise it is only included if it is not the full width.
+        - `prefixlens`: An optional sequence of prefix lengths, one for each
+          address.  Defaults to the full width.
+        - `fixed_width`: If true, every address is written with the same
+          number of characters so that the output sorts lexically: IPv4
+          octets are zero-padded to 3 digits, and IPv6 addresses are written
+          without ``::`` compression and with all 4 digits of every group.
+
+    :Return:
+        Returns the formatted string.
+
+    :Exceptions:
+        - `ValueError`: A prefix length is out of range, or `prefixlens`
+          has a different length.
+        - `OverflowError`: An address is out of range for the version.
+    """
+    cdef Py_ssize_t i, n, used, sep_len, item_size
+    cdef uint64_t hi, lo
+    cdef int prefixlen, width
+    cdef char *buf
+    cdef char *sep_ptr
+    cdef uint32_t *values4
+    cdef uint64_t *values6
+    cdef unsigned char *plens
+    cdef object result
+
+    if version == 4:
+        width = 32
+        item_size = _MAX_IPV4_TEXT
+    elif version == 6:
+        width = 128
+        item_size = _MAX_IPV6_TEXT
+    else:
+        raise ValueError(version)
+    ints = PySequence_Fast(ints, 'expected a sequence')
+    n = PySequence_Fast_GET_SIZE(ints)
+    if prefixlens is not None:
+        prefixlens = PySequence_Fast(prefixlens, 'expected a sequence')
+        if PySequence_Fast_GET_SIZE(prefixlens) != n:
+            raise ValueError('ints and prefixlens differ in length')
+    sep_ptr = sep
+    sep_len = len(sep)
+    buf = NULL
+    values4 = NULL
+    values6 = NULL
+    plens = NULL
+    try:
+        # Convert everything to C values first, then format without the
+        # GIL.
+        if version == 4:
+            values4 = <uint32_t *> Pyrex_Malloc_SAFE(n * 4 + 1)
+        else:
+            values6 = <uint64_t *> Pyrex_Malloc_SAFE(n * 16 + 1)
+        for i from 0 <= i < n:
+            _value_to_u128(version, PySequence_Fast_GET_ITEM_SAFE(ints, i),
+                           &hi, &lo)
+            if version == 4:
+                values4[i] = <uint32_t> lo
+            else:
+                values6[2 * i] = hi
+                values6[2 * i + 1] = lo
+        if prefixlens is not None:
+            plens = <unsigned char *> Pyrex_Malloc_SAFE(n + 1)
+            for i from 0 <= i < n:
+                prefixlen = PySequence_Fast_GET_ITEM_SAFE(prefixlens, i)
+                if prefixlen < 0 or prefixlen > width:
+                    raise ValueError(prefixlen)
+                plens[i] = prefixlen
+        buf = <char *> Pyrex_Malloc_SAFE(n * (item_size + sep_len) + 1)
+        with nogil:
+            used = _format_into(buf, version, values4, values6, plens, n,
+                                sep_ptr, sep_len, always_prefix, fixed_width)
+        result = PyString_FromStringAndSize(buf, used)
+    finally:
+        Pyrex_Free_SAFE(buf)
+        Pyrex_Free_SAFE(values4)
+        Pyrex_Free_SAFE(values6)
+        Pyrex_Free_SAFE(plens)
+    return result
+
+##############################################################################
+# Buffer operations.
+#
+# These work on raw buffers (strings, mmaps, array.array and NumPy arrays)
+# and run their inner loops without the GIL, so several threads can work on
+# different parts of the same data at once.  The buffers must not be resized
+# or closed by another thread while a call is running.
+##############################################################################
+
+cdef int _is_digit(unsigned char ch) nogil:
+    return ch >= c'0' and ch <= c'9'
+
+cdef int _is_hex(unsigned char ch) nogil:
+    return ((ch >= c'0' and ch <= c'9') or
+            (ch >= c'a' and ch <= c'f') or
+            (ch >= c'A' and ch <= c'F'))
+
+cdef int _is_word(unsigned char ch) nogil:
+    return ((ch >= c'0' and ch <= c'9') or
+            (ch >= c'a' and ch <= c'z') or
+            (ch >= c'A' and ch <= c'Z') or
+            ch == c'_')
+
+cdef int _parse_ipv4_span(unsigned char *data, Py_ssize_t length,
+                          uint32_t *result) nogil:
+    """Parse a dotted quad that must fill exactly `length` bytes.
+
+    This accepts the same syntax as `parse_ipv4`.
+
+    :Return:
+        Returns 0 on success, -1 on error.
+    """
+    cdef Py_ssize_t i
+    cdef int octets, digits
+    cdef unsigned int octet
+    cdef uint32_t value
+    i = 0
+    value = 0
+    for octets from 0 <= octets < 4:
+        if octets:
+            if i >= length or data[i] != c'.':
+                return -1
+            i = i + 1
+        octet = 0
+        digits = 0
+        while i < length and _is_digit(data[i]):
+            octet = octet * 10 + (data[i] - c'0')
+            if octet > 255:
+                return -1
+            digits = digits + 1
+            i = i + 1
+        if not digits:
+            return -1
+        value = (value << 8) | octet
+    if i != length:
+        return -1
+    result[0] = value
+    return 0
+
+cdef int _grow(void **buf, Py_ssize_t *capacity, Py_ssize_t needed,
+               Py_ssize_t item_size) nogil:
+    """Make sure a realloc'd buffer has room for `needed` items.
+
+    :Return:
+        Returns 0 on success, -1 if out of memory.
+    """
+    cdef Py_ssize_t new_capacity
+    cdef void *new_buf
+    if needed <= capacity[0]:
+        return 0
+    new_capacity = capacity[0] * 2 + 64
+    if new_capacity < needed:
+        new_capacity = needed
+    new_buf = _realloc_nogil(buf[0], new_capacity * item_size)
+    if new_buf == NULL:
+        return -1
+    buf[0] = new_buf
+    capacity[0] = new_capacity
+    return 0
+
+cdef Py_ssize_t _scan_ipv4(unsigned char *data, Py_ssize_t length,
+                           uint32_t **out) nogil:
+    """Find the IPv4 addresses in text.
+
+    :Return:
+        Returns the number of addresses stored in `out` (which must be freed
+        with free()), or -1 if out of memory.
+    """
+    cdef Py_ssize_t i, start, end, count, capacity
+    cdef uint32_t value
+    i = 0
+    count = 0
+    capacity = 0
+    while i < length:
+        if not _is_digit(data[i]):
+            i = i + 1
+            continue
+        start = i
+        while i < length and (_is_digit(data[i]) or data[i] == c'.'):
+            i = i + 1
+        end = i
+        # Skip numbers that are part of a word or an IPv6 address.
+        if start > 0 and (_is_word(data[start - 1]) or
+                          data[start - 1] == c'.' or
+                          data[start - 1] == c':'):
+            continue
+        if end < length and _is_word(data[end]):
+            continue
+        # A trailing dot ends a sentence or a domain name.
+        while end > start and data[end - 1] == c'.':
+            end = end - 1
+        if _parse_ipv4_span(data + start, end - start, &value) == 0:
+            if _grow(<void **> out, &capacity, count + 1, 4) == -1:
+                return -1
+            out[0][count] = value
+            count = count + 1
+    return count
+
+cdef Py_ssize_t _scan_ipv6(unsigned char *data, Py_ssize_t length,
+                           unsigned char **out) nogil:
+    """Find the IPv6 addresses in text.
+
+    :Return:
+        Returns the number of packed addresses stored in `out` (which must be
+        freed with free()), or -1 if out of memory.
+    """
+    cdef Py_ssize_t i, start, end, count, capacity
+    cdef int colons, hex_digits
+    cdef char text[INET6_ADDRSTRLEN]
+    i = 0
+    count = 0
+    capacity = 0
+    while i < length:
+        if not (_is_hex(data[i]) or data[i] == c':'):
+            i = i + 1
+            continue
+        start = i
+        colons = 0
+        hex_digits = 0
+        while i < length and (_is_hex(data[i]) or data[i] == c':' or
+                              data[i] == c'.'):
+            if data[i] == c':':
+                colons = colons + 1
+            elif data[i] != c'.':
+                hex_digits = hex_digits + 1
+            i = i + 1
+        end = i
+        if colons < 2 or not hex_digits:
+            continue
+        if start > 0 and _is_word(data[start - 1]):
+            continue
+        if end < length and _is_word(data[end]):
+            continue
+        while end > start and data[end - 1] == c'.':
+            end = end - 1
+        if end - start >= INET6_ADDRSTRLEN:
+            continue
+        _memcpy_nogil(text, data + start, end - start)
+        text[end - start] = 0
+        if _grow(<void **> out, &capacity, count + 1, 16) == -1:
+            return -1
+        if inet_pton(AF_INET6, text, out[0] + count * 16) == 1:
+            count = count + 1
+    return count
+
+cdef int _buffer_range(object data, Py_ssize_t start, Py_ssize_t end,
+                       unsigned char **ptr, Py_ssize_t *length) except -1:
+    """Get a pointer to part of a buffer.
+
+    A negative `end` means the end of the buffer.
+    """
+    cdef Py_ssize_t total
+    _read_buffer(data, ptr, &total)
+    if end < 0 or end > total:
+        end = total
+    if start < 0 or start > end:
+        raise ValueError(start)
+    ptr[0] = ptr[0] + start
+    length[0] = end - start
+    return 0
+
+cdef Py_ssize_t _u32_count(object data, uint32_t **ptr) except -1:
+    """Get a pointer to a buffer of native uint32 values."""
+    cdef unsigned char *bytes
+    cdef Py_ssize_t length
+    _read_buffer(data, &bytes, &length)
+    if length % 4:
+        raise ValueError('buffer size is not a multiple of 4')
+    ptr[0] = <uint32_t *> bytes
+    return length / 4
+
+def extract_ipv4(data, Py_ssize_t start=0, Py_ssize_t end=-1):
+    """Find all IPv4 addresses in text.
+
+    Addresses are dotted quads as accepted by `parse_ipv4` that are not part
+    of a longer word, number or IPv6 address.  The scan runs without the GIL.
+
+    :Parameters:
+        - `data`: A string or other object supporting the buffer interface,
+          such as an mmap.
+        - `start`: The offset to start scanning at.
+        - `end`: The offset to stop scanning at.  Defaults to the end of the
+          data.
+
+    :Return:
+        Returns an ``array.array('I')`` of the addresses in the order found.
+    """
+    cdef unsigned char *ptr
+    cdef Py_ssize_t length, count
+    cdef uint32_t *found
+    _buffer_range(data, start, end, &ptr, &length)
+    found = NULL
+    with nogil:
+        count = _scan_ipv4(ptr, length, &found)
+    try:
+        if count == -1:
+            raise MemoryError
+        result = array.array('I')
+        result.fromstring(PyString_FromStringAndSize(<char *> found,
+                                                     count * 4))
+    finally:
+        _free_nogil(found)
+    return result
+
+def extract_ipv6(data, Py_ssize_t start=0, Py_ssize_t end=-1):
+    """Find all IPv6 addresses in text.
+
+    Addresses are tokens of hex digits and colons (with an optional dotted
+    quad at the end) that are not part of a longer word and that parse as
+    an IPv6 address.  The scan runs without the GIL.
+
+    :Parameters:
+        - `data`: A string or other object supporting the buffer interface.
+        - `start`: The offset to start scanning at.
+        - `end`: The offset to stop scanning at.  Defaults to the end of the
+          data.
+
+    :Return:
+        Returns a string of the packed addresses, 16 bytes each in network
+        byte order.
+    """
+    cdef unsigned char *ptr
+    cdef Py_ssize_t length, count
+    cdef unsigned char *found
+    _buffer_range(data, start, end, &ptr, &length)
+    found = NULL
+    with nogil:
+        count = _scan_ipv6(ptr, length, &found)
+    try:
+        if count == -1:
+            raise MemoryError
+        result = PyString_FromStringAndSize(<char *> found, count * 16)
+    finally:
+        _free_nogil(found)
+    return result
+
+def format_ipv4_buffer(data, sep='\n', int always_prefix=0,
+                       int fixed_width=0):
+    """Format a buffer of IPv4 addresses.
+
+    This is the same as `format_many` for IPv4, but the addresses are read
+    from a buffer of native uint32 values (such as ``array.array('I')`` or a
+    NumPy ``uint32`` array), and all the work is done without the GIL.
+
+    :Parameters:
+        - `data`: The buffer of addresses.
+        - `sep`: The string written between addresses.
+        - `always_prefix`: If true, append ``/32`` to every address.
+        - `fixed_width`: See `format_many`.
+
+    :Return:
+        Returns the formatted string.
+    """
+    cdef uint32_t *values
+    cdef Py_ssize_t n, used, sep_len
+    cdef char *sep_ptr
+    cdef char *buf
+    n = _u32_count(data, &values)
+    sep_ptr = sep
+    sep_len = len(sep)
+    buf = <char *> Pyrex_Malloc_SAFE(n * (_MAX_IPV4_TEXT + sep_len) + 1)
+    try:
+        with nogil:
+            used = _format_into(buf, 4, values, NULL, NULL, n, sep_ptr,
+                                sep_len, always_prefix, fixed_width)
+        result = PyString_FromStringAndSize(buf, used)
+    finally:
+        Pyrex_Free_SAFE(buf)
+    return result
+
+cdef Py_ssize_t _bisect_u32(uint32_t *starts, Py_ssize_t n,
+                            uint32_t value) nogil:
+    """The index of the last start not greater than `value`, or -1."""
+    cdef Py_ssize_t lo, hi, mid
+    lo = 0
+    hi = n
+    while lo < hi:
+        mid = (lo + hi) / 2
+        if value < starts[mid]:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo - 1
+
+def classify_ipv4_buffer(data, starts, flags):
+    """Look up IPv4 addresses in an interval table.
+
+    :Parameters:
+        - `data`: A buffer of native uint32 addresses.
+        - `starts`: A buffer of native uint32 interval starts, sorted.
+        - `flags`: A buffer of native uint32 values, one per interval.
+
+    :Return:
+        Returns an ``array.array('I')`` with the value of the interval each
+        address falls in, or 0 for addresses before the first interval.
+    """
+    cdef uint32_t *values
+    cdef uint32_t *starts_ptr
+    cdef uint32_t *flags_ptr
+    cdef uint32_t *out
+    cdef void *out_buf
+    cdef Py_ssize_t n, nstarts, i, index, length
+    n = _u32_count(data, &values)
+    nstarts = _u32_count(starts, &starts_ptr)
+    if _u32_count(flags, &flags_ptr) != nstarts:
+        raise ValueError('starts and flags differ in length')
+    result = array.array('I', [0]) * n
+    PyObject_AsWriteBuffer(result, &out_buf, &length)
+    out = <uint32_t *> out_buf
+    with nogil:
+        for i from 0 <= i < n:
+            index = _bisect_u32(starts_ptr, nstarts, values[i])
+            if index >= 0:
+                out[i] = flags_ptr[index]
+    return result
+
+def contains_ipv4_buffer(data, starts, ends):
+    """Check IPv4 addresses against a set of ranges.
+
+    :Parameters:
+        - `data`: A buffer of native uint32 addresses.
+        - `starts`: A buffer of native uint32 range starts, sorted.
+        - `ends`: A buffer of native uint32 range ends (inclusive).  The
+          ranges must not overlap.
+
+    :Return:
+        Returns an ``array.array('B')`` with 1 for each address inside one of
+        the ranges and 0 otherwise.
+    """
+    cdef uint32_t *values
+    cdef uint32_t *starts_ptr
+    cdef uint32_t *ends_ptr
+    cdef unsigned char *out
+    cdef void *out_buf
+    cdef Py_ssize_t n, nstarts, i, index, length
+    n = _u32_count(data, &values)
+    nstarts = _u32_count(starts, &starts_ptr)
+    if _u32_count(ends, &ends_ptr) != nstarts:
+        raise ValueError('starts and ends differ in length')
+    result = array.array('B', [0]) * n
+    PyObject_AsWriteBuffer(result, &out_buf, &length)
+    out = <unsigned char *> out_buf
+    with nogil:
+        for i from 0 <= i < n:
+            index = _bisect_u32(starts_ptr, nstarts, values[i])
+            if index >= 0 and values[i] <= ends_ptr[index]:
+                out[i] = 1
+    return result
+
+##############################################################################
+# Counting.
+##############################################################################
+
+cdef int _cmp_u32(const void *a, const void *b) nogil:
+    cdef uint32_t x, y
+    x = (<uint32_t *> a)[0]
+    y = (<uint32_t *> b)[0]
+    return (x > y) - (x < y)
+
+cdef int _cmp_ipv6(const void *a, const void *b) nogil:
+    # Network byte order sorts the same as the integer value.
+    return _memcmp_nogil(a, b, 16)
+
+cdef Py_ssize_t _count_runs(unsigned char *items, Py_ssize_t n,
+                            Py_ssize_t size, uint32_t *counts) nogil:
+    """Collapse runs of equal sorted items in place.
+
+    Returns the number of distinct items.  ``counts[i]`` is set to the
+    length of the run of the i'th distinct item.
+    """
+    cdef Py_ssize_t i, used
+    used = 0
+    for i from 0 <= i < n:
+        if used and _memcmp_nogil(items + (used - 1) * size, items + i * size,
+                                  size) == 0:
+            counts[used - 1] = counts[used - 1] + 1
+        else:
+            if used != i:
+                _memcpy_nogil(items + used * size, items + i * size, size)
+            counts[used] = 1
+            used = used + 1
+    return used
+
+cdef void _mask_ipv6(unsigned char *items, Py_ssize_t n,
+                     int prefixlen) nogil:
+    cdef Py_ssize_t i
+    cdef int j, bits
+    for i from 0 <= i < n:
+        for j from 0 <= j < 16:
+            bits = prefixlen - j * 8
+            if bits <= 0:
+                items[j] = 0
+            elif bits < 8:
+                items[j] = items[j] & (0xff << (8 - bits))
+        items = items + 16
+
+def count_ipv4_buffer(data, int prefixlen=32):
+    """Count how many times each IPv4 address or network occurs.
+
+    The addresses are sorted and counted without the GIL.
+
+    :Parameters:
+        - `data`: A buffer of native uint32 addresses, such as the result of
+          `extract_ipv4`.
+        - `prefixlen`: Count networks of this prefix length instead of
+          single addresses.
+
+    :Return:
+        Returns a tuple ``(addresses, counts)`` of ``array.array('I')``
+        objects.  ``addresses`` holds the distinct addresses (with the host
+        bits cleared) in ascending order and ``counts`` the number of times
+        each one occurred.
+    """
+    cdef uint32_t *values
+    cdef uint32_t *items
+    cdef uint32_t *counts
+    cdef uint32_t mask
+    cdef Py_ssize_t n, used, i
+    if prefixlen < 0 or prefixlen > 32:
+        raise ValueError(prefixlen)
+    if prefixlen == 0:
+        mask = 0
+    else:
+        mask = 0xffffffffU << (32 - prefixlen)
+    n = _u32_count(data, &values)
+    items = <uint32_t *> Pyrex_Malloc_SAFE(n * 4 + 1)
+    counts = NULL
+    try:
+        counts = <uint32_t *> Pyrex_Malloc_SAFE(n * 4 + 1)
+        with nogil:
+            _memcpy_nogil(items, values, n * 4)
+            if mask != 0xffffffffU:
+                for i from 0 <= i < n:
+                    items[i] = items[i] & mask
+            _qsort_nogil(items, n, 4, _cmp_u32)
+            used = _count_runs(<unsigned char *> items, n, 4, counts)
+        addresses = array.array('I')
+        addresses.fromstring(PyString_FromStringAndSize(<char *> items,
+                                                        used * 4))
+        result = array.array('I')
+        result.fromstring(PyString_FromStringAndSize(<char *> counts,
+                                                     used * 4))
+    finally:
+        Pyrex_Free_SAFE(items)
+        Pyrex_Free_SAFE(counts)
+    return (addresses, result)
+
+def count_ipv6_buffer(data, int prefixlen=128):
+    """Count how many times each IPv6 address or network occurs.
+
+    The addresses are sorted and counted without the GIL.
+
+    :Parameters:
+        - `data`: A buffer of packed addresses, 16 bytes each in network byte
+          order, such as the result of `extract_ipv6`.
+        - `prefixlen`: Count networks of this prefix length instead of
+          single addresses.
+
+    :Return:
+        Returns a tuple ``(addresses, counts)``.  ``addresses`` is a list of
+        the distinct addresses (with the host bits cleared) as integers in
+        ascending order, and
+        ``counts`` is an ``array.array('I')`` of the number of times each
+        one occurred.
+    """
+    cdef unsigned char *ptr
+    cdef unsigned char *items
+    cdef uint32_t *counts
+    cdef Py_ssize_t length, n, used, i
+    if prefixlen < 0 or prefixlen > 128:
+        raise ValueError(prefixlen)
+    _read_buffer(data, &ptr, &length)
+    if length % 16:
+        raise ValueError('buffer size is not a multiple of 16')
+    n = length / 16
+    items = <unsigned char *> Pyrex_Malloc_SAFE(length + 1)
+    counts = NULL
+    try:
+        counts = <uint32_t *> Pyrex_Malloc_SAFE(n * 4 + 1)
+        with nogil:
+            _memcpy_nogil(items, ptr, length)
+            if prefixlen != 128:
+                _mask_ipv6(items, n, prefixlen)
+            _qsort_nogil(items, n, 16, _cmp_ipv6)
+            used = _count_runs(items, n, 16, counts)
+        addresses = PyList_New(used)
+        for i from 0 <= i < used:
+            PyList_SET_ITEM_SAFE(addresses, i, _u128_to_long(
+                _load_u64(items + i * 16), _load_u64(items + i * 16 + 8)))
+        result = array.array('I')
+        result.fromstring(PyString_FromStringAndSize(<char *> counts,
+                                                     used * 4))
+    finally:
+        Pyrex_Free_SAFE(items)
+        Pyrex_Free_SAFE(counts)
+    return (addresses, result)
+
+cdef Py_ssize_t _bisect_u128(unsigned char *starts, Py_ssize_t n,
+                             unsigned char *value) nogil:
+    """`_bisect_u32` for packed IPv6 addresses."""
+    cdef Py_ssize_t lo, hi, mid
+    lo = 0
+    hi = n
+    while lo < hi:
+        mid = (lo + hi) / 2
+        if _memcmp_nogil(value, starts + mid * 16, 16) < 0:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo - 1
+
+cdef int _is_mapped_ipv6(unsigned char *address) nogil:
+    """Whether a packed address is in ::ffff:0:0/96."""
+    cdef int i
+    for i from 0 <= i < 10:
+        if address[i]:
+            return 0
+    return address[10] == 0xff and address[11] == 0xff
+
+def filter_ipv6_buffer(data, int unmap, starts, flags, uint32_t exclude):
+    """Split off IPv4-mapped addresses and drop unwanted IPv6 addresses.
+
+    The work is done without the GIL.
+
+    :Parameters:
+        - `data`: A buffer of packed addresses, 16 bytes each in network byte
+          order, such as the result of `extract_ipv6`.
+        - `unmap`: If true, addresses in ``::ffff:0:0/96`` are taken out and
+          returned as IPv4 addresses.
+        - `starts`: A buffer of packed interval starts, 16 bytes each,
+          sorted.
+        - `flags`: A buffer of native uint32 values, one per interval.
+        - `exclude`: Addresses whose interval value has any of these bits
+          set are dropped.  Mapped addresses are not checked.
+
+    :Return:
+        Returns a tuple ``(mapped, others)``.  ``mapped`` is an
+        ``array.array('I')`` of the IPv4 addresses of the mapped addresses,
+        and ``others`` a string of the remaining packed addresses, in their
+        original order.
+    """
+    cdef unsigned char *ptr
+    cdef unsigned char *starts_ptr
+    cdef unsigned char *address
+    cdef unsigned char *kept
+    cdef uint32_t *flags_ptr
+    cdef uint32_t *mapped
+    cdef Py_ssize_t length, starts_length, nstarts, n, i, index
+    cdef Py_ssize_t nkept, nmapped
+    _read_buffer(data, &ptr, &length)
+    if length % 16:
+        raise ValueError('buffer size is not a multiple of 16')
+    _read_buffer(starts, &starts_ptr, &starts_length)
+    if starts_length % 16:
+        raise ValueError('starts size is not a multiple of 16')
+    nstarts = starts_length / 16
+    if _u32_count(flags, &flags_ptr) != nstarts:
+        raise ValueError('starts and flags differ in length')
+    n = length / 16
+    kept = <unsigned char *> Pyrex_Malloc_SAFE(length + 1)
+    mapped = NULL
+    try:
+        mapped = <uint32_t *> Pyrex_Malloc_SAFE(n * 4 + 1)
+        nkept = 0
+        nmapped = 0
+        with nogil:
+            for i from 0 <= i < n:
+                address = ptr + i * 16
+                if unmap and _is_mapped_ipv6(address):
+                    mapped[nmapped] = ((<uint32_t> address[12] << 24) |
+                                       (<uint32_t> address[13] << 16) |
+                                       (<uint32_t> address[14] << 8) |
+                                       <uint32_t> address[15])
+                    nmapped = nmapped + 1
+                    continue
+                if exclude:
+                    index = _bisect_u128(starts_ptr, nstarts, address)
+                    if index >= 0 and flags_ptr[index] & exclude:
+                        continue
+                _memcpy_nogil(kept + nkept * 16, address, 16)
+                nkept = nkept + 1
+        if nkept == n and PyString_CheckExact(data):
+            others = data
+        else:
+            others = PyString_FromStringAndSize(<char *> kept, nkept * 16)
+        result = array.array('I')
+        result.fromstring(PyString_FromStringAndSize(<char *> mapped,
+                                                     nmapped * 4))
+    finally:
+        Pyrex_Free_SAFE(kept)
+        Pyrex_Free_SAFE(mapped)
+    return (result, others)
+
+##############################################################################
+# Sharding.
+##############################################################################
+
+cdef uint64_t _mix64(uint64_t x) nogil:
+    """The SplitMix64 finalizer."""
+    x = (x ^ (x >> 30)) * 0xbf58476d1ce4e5b9ULL
+    x = (x ^ (x >> 27)) * 0x94d049bb133111ebULL
+    return x ^ (x >> 31)
+
+cdef uint64_t _prefix_key(uint64_t hi, uint64_t lo, int version,
+                          int prefixlen, uint64_t seed) nogil:
+    return _mix64(_mix64(hi ^ seed ^ <uint64_t> (version << 8 | prefixlen))
+                  ^ lo)
+
+cdef int _jump(uint64_t key, int buckets) nogil:
+    """Jump consistent hash (Lamping and Veach)."""
+    cdef libc.int64_t b, j
+    b = -1
+    j = 0
+    while j < buckets:
+        b = j
+        key = key * 2862933555777941757ULL + 1
+        j = <libc.int64_t> ((b + 1) * (<double> (1LL << 31) /
+                                       <double> ((key >> 33) + 1)))
+    return <int> b
+
+cdef int _rendezvous(uint64_t key, uint64_t *node_keys, Py_ssize_t n) nogil:
+    """The index of the node with the highest score for a key."""
+    cdef Py_ssize_t i, best
+    cdef uint64_t score, best_score
+    best = 0
+    best_score = 0
+    for i from 0 <= i < n:
+        score = _mix64(key ^ node_keys[i])
+        if i == 0 or score > best_score:
+            best = i
+            best_score = score
+    return <int> best
+
+cdef Py_ssize_t _u64_count(object data, uint64_t **ptr) except -1:
+    """Get a pointer to a buffer of native uint64 values."""
+    cdef unsigned char *bytes
+    cdef Py_ssize_t length
+    _read_buffer(data, &bytes, &length)
+    if length % 8:
+        raise ValueError('buffer size is not a multiple of 8')
+    ptr[0] = <uint64_t *> bytes
+    return length / 8
+
+cdef int _check_prefixlen(int version, int prefixlen) except -1:
+    if version == 4:
+        if prefixlen < 0 or prefixlen > 32:
+            raise ValueError(prefixlen)
+    elif version == 6:
+        if prefixlen < 0 or prefixlen > 128:
+            raise ValueError(prefixlen)
+    else:
+        raise ValueError(version)
+    return 0
+
+cdef uint64_t _netmask_u64(int prefixlen) nogil:
+    """The first 64 bits of a netmask (negative lengths give 0)."""
+    if prefixlen <= 0:
+        return 0
+    if prefixlen >= 64:
+        return 0xffffffffffffffffULL
+    return 0xffffffffffffffffULL << (64 - prefixlen)
+
+cdef void _mask_u128(int version, int prefixlen, uint64_t *hi,
+                     uint64_t *lo) nogil:
+    """Clear the host bits of an address."""
+    if version == 4:
+        lo[0] = lo[0] & (_netmask_u64(prefixlen + 32) & 0xffffffffU)
+    else:
+        hi[0] = hi[0] & _netmask_u64(prefixlen)
+        lo[0] = lo[0] & _netmask_u64(prefixlen - 64)
+
+def prefix_key(int version, value, int prefixlen, seed=0):
+    """Hash the network an address belongs to.
+
+    :Parameters:
+        - `version`: The address version, 4 or 6.
+        - `value`: The address as an integer.
+        - `prefixlen`: The prefix length of the network to hash.  All the
+          addresses of a network have the same key.
+        - `seed`: A 64-bit integer to vary the hash with.
+
+    :Return:
+        Returns the key as a 64-bit integer.
+    """
+    cdef uint64_t hi, lo, seed64
+    _check_prefixlen(version, prefixlen)
+    _value_to_u128(version, value, &hi, &lo)
+    seed64 = seed
+    _mask_u128(version, prefixlen, &hi, &lo)
+    return minimal_ulonglong(_prefix_key(hi, lo, version, prefixlen, seed64))
+
+def jump_hash(key, int buckets):
+    """Map a 64-bit key to a bucket with jump consistent hashing.
+
+    When the number of buckets grows from n to n + 1, only 1/(n + 1) of the
+    keys move, all of them to the new bucket.
+
+    :Parameters:
+        - `key`: The key, a 64-bit integer.
+        - `buckets`: The number of buckets.
+
+    :Return:
+        Returns the bucket number, from 0 to ``buckets - 1``.
+    """
+    cdef uint64_t key64
+    if buckets < 1:
+        raise ValueError(buckets)
+    key64 = key
+    return _jump(key64, buckets)
+
+def rendezvous_hash(key, node_keys):
+    """Map a 64-bit key to a node with rendezvous (highest random weight)
+    hashing.
+
+    Removing a node only moves the keys that were on it, and adding a node
+    only moves keys to it.
+
+    :Parameters:
+        - `key`: The key, a 64-bit integer.
+        - `node_keys`: A buffer of native uint64 values, one per node.
+
+    :Return:
+        Returns the index of the chosen node.
+    """
+    cdef uint64_t *nodes
+    cdef Py_ssize_t n
+    cdef uint64_t key64
+    n = _u64_count(node_keys, &nodes)
+    if not n:
+        raise ValueError('no nodes')
+    key64 = key
+    return _rendezvous(key64, nodes, n)
+
+def shard_ipv4_buffer(data, int prefixlen, int buckets=0, node_keys=None,
+                      seed=0):
+    """Map many IPv4 addresses to shards by their network.
+
+    This is `prefix_key` followed by `jump_hash` (if `buckets` is given) or
+    `rendezvous_hash` (if `node_keys` is given) for every address.  The work
+    is done without the GIL.
+
+    :Parameters:
+        - `data`: A buffer of native uint32 addresses.
+        - `prefixlen`: The prefix length of the networks to shard by.
+        - `buckets`: The number of buckets for jump hashing.
+        - `node_keys`: A buffer of native uint64 node keys for rendezvous
+          hashing.
+        - `seed`: See `prefix_key`.
+
+    :Return:
+        Returns an ``array.array('I')`` of shard numbers.
+    """
+    cdef uint32_t *values
+    cdef uint32_t *out
+    cdef uint64_t *nodes
+    cdef uint64_t seed64, key
+    cdef uint32_t mask
+    cdef void *out_buf
+    cdef Py_ssize_t n, nnodes, i, length
+    _check_prefixlen(4, prefixlen)
+    nnodes = 0
+    nodes = NULL
+    if node_keys is None:
+        if buckets < 1:
+            raise ValueError(buckets)
+    else:
+        nnodes = _u64_count(node_keys, &nodes)
+        if not nnodes:
+            raise ValueError('no nodes')
+    n = _u32_count(data, &values)
+    seed64 = seed
+    mask = _netmask_u64(prefixlen + 32) & 0xffffffffU
+    result = array.array('I', [0]) * n
+    PyObject_AsWriteBuffer(result, &out_buf, &length)
+    out = <uint32_t *> out_buf
+    with nogil:
+        for i from 0 <= i < n:
+            key = _prefix_key(0, values[i] & mask, 4, prefixlen, seed64)
+            if nnodes:
+                out[i] = _rendezvous(key, nodes, nnodes)
+            else:
+                out[i] = _jump(key, buckets)
+    return result
+
+##############################################################################
+# Filters.
+#
+# The probing of aplib.net.ipfilter tables.  A key is an address with the
+# host bits of its network cleared, hashed to two 64-bit values with
+# _mix64.  A Bloom filter table is an array of bits, probed by double
+# hashing.  A cuckoo filter table is an array of buckets of 4 fingerprints,
+# each 1, 2 or 4 bytes in network byte order.
+##############################################################################
+
+cdef enum:
+    _CUCKOO_BUCKET_SIZE = 4
+
+cdef int _filter_hash(int version, object value, int prefixlen,
+                      uint64_t *h1, uint64_t *h2) except -1:
+    cdef uint64_t hi, lo
+    _check_prefixlen(version, prefixlen)
+    _value_to_u128(version, value, &hi, &lo)
+    _mask_u128(version, prefixlen, &hi, &lo)
+    h1[0] = _prefix_key(hi, lo, version, prefixlen, 0)
+    h2[0] = _mix64(h1[0] ^ 0x9e3779b97f4a7c15ULL)
+    return 0
+
+cdef unsigned char *_filter_table(object table, Py_ssize_t offset,
+                                  Py_ssize_t size, int writable) except NULL:
+    """Get a pointer to a filter table of `size` bytes at `offset`."""
+    cdef void *buf
+    cdef Py_ssize_t length
+    if writable:
+        PyObject_AsWriteBuffer(table, &buf, &length)
+    else:
+        PyObject_AsReadBuffer(table, &buf, &length)
+    if offset < 0 or size < 0 or size > length - offset:
+        raise ValueError('table does not fit in the buffer')
+    return <unsigned char *> buf + offset
+
+cdef uint64_t _bloom_nbits(object nbits) except 0:
+    cdef uint64_t n
+    n = nbits
+    if n == 0 or n % 8:
+        raise ValueError(nbits)
+    return n
+
+def filter_hash(int version, value, int prefixlen):
+    """Hash a filter key.
+
+    :Parameters:
+        - `version`: The address version, 4 or 6.
+        - `value`: The address as an integer.  Host bits are ignored.
+        - `prefixlen`: The prefix length of the key.  Exact addresses use the
+          full width of the address.
+
+    :Return:
+        Returns a tuple of two 64-bit integers.
+    """
+    cdef uint64_t h1, h2
+    _filter_hash(version, value, prefixlen, &h1, &h2)
+    return (minimal_ulonglong(h1), minimal_ulonglong(h2))
+
+def bloom_add(table, Py_ssize_t offset, nbits, int nhashes, int version,
+              value, int prefixlen):
+    """Set the bits of a key in a Bloom filter table.
+
+    :Parameters:
+        - `table`: A writable buffer holding the table, such as a bytearray.
+        - `offset`: The offset of the table in the buffer.
+        - `nbits`: The number of bits in the table, a multiple of 8.
+        - `nhashes`: The number of probes per key.
+        - `version`: See `filter_hash`.
+        - `value`: See `filter_hash`.
+        - `prefixlen`: See `filter_hash`.
+    """
+    cdef unsigned char *bits
+    cdef uint64_t n, h1, h2, bit
+    cdef int i
+    n = _bloom_nbits(nbits)
+    bits = _filter_table(table, offset, n / 8, 1)
+    _filter_hash(version, value, prefixlen, &h1, &h2)
+    for i from 0 <= i < nhashes:
+        bit = (h1 + <uint64_t> i * h2) % n
+        bits[bit >> 3] = bits[bit >> 3] | (1 << (bit & 7))
+
+def bloom_contains(table, Py_ssize_t offset, nbits, int nhashes, int version,
+                   value, int prefixlen):
+    """Check whether all the bits of a key are set in a Bloom filter table.
+
+    See `bloom_add` for the parameters.  The table may be read-only, such as
+    an mmap.
+
+    :Return:
+        Returns True if all the bits are set.
+    """
+    cdef unsigned char *bits
+    cdef uint64_t n, h1, h2, bit
+    cdef int i
+    n = _bloom_nbits(nbits)
+    bits = _filter_table(table, offset, n / 8, 0)
+    _filter_hash(version, value, prefixlen, &h1, &h2)
+    for i from 0 <= i < nhashes:
+        bit = (h1 + <uint64_t> i * h2) % n
+        if not bits[bit >> 3] & (1 << (bit & 7)):
+            return False
+    return True
+
+cdef uint64_t _cuckoo_nbuckets(object nbuckets) except 0:
+    cdef uint64_t n
+    n = nbuckets
+    if n == 0 or n & (n - 1):
+        raise ValueError(nbuckets)
+    return n
+
+cdef uint64_t _cuckoo_alt(uint64_t index, uint64_t fingerprint,
+                          uint64_t nbuckets) nogil:
+    return (index ^ ((fingerprint * 0xc6a4a7935bd1e995ULL) >> 17)) & \
+           (nbuckets - 1)
+
+cdef int _cuckoo_find(unsigned char *table, int entry, uint64_t index,
+                      uint64_t fingerprint) nogil:
+    """Check whether a bucket holds a fingerprint."""
+    cdef unsigned char *slot
+    cdef uint64_t found
+    cdef int i, j
+    slot = table + index * _CUCKOO_BUCKET_SIZE * entry
+    for i from 0 <= i < _CUCKOO_BUCKET_SIZE:
+        found = 0
+        for j from 0 <= j < entry:
+            found = (found << 8) | slot[j]
+        if found == fingerprint:
+            return 1
+        slot = slot + entry
+    return 0
+
+cdef int _cuckoo_key(int version, object value, uint64_t nbuckets,
+                     int fingerprint_bits, uint64_t *fingerprint,
+                     uint64_t *index1, uint64_t *index2) except -1:
+    cdef uint64_t h1, h2
+    if (fingerprint_bits != 8 and fingerprint_bits != 16 and
+        fingerprint_bits != 32):
+        raise ValueError(fingerprint_bits)
+    if version == 4:
+        _filter_hash(version, value, 32, &h1, &h2)
+    else:
+        _filter_hash(version, value, 128, &h1, &h2)
+    fingerprint[0] = h2 % ((1ULL << fingerprint_bits) - 1) + 1
+    index1[0] = h1 & (nbuckets - 1)
+    index2[0] = _cuckoo_alt(index1[0], fingerprint[0], nbuckets)
+    return 0
+
+def cuckoo_locate(int version, value, nbuckets, int fingerprint_bits):
+    """Find where a key goes in a cuckoo filter table.
+
+    :Parameters:
+        - `version`: The address version, 4 or 6.
+        - `value`: The address as an integer.
+        - `nbuckets`: The number of buckets in the table, a power of 2.
+        - `fingerprint_bits`: The size of a fingerprint, 8, 16 or 32.
+
+    :Return:
+        Returns a tuple ``(fingerprint, index1, index2)`` of the fingerprint
+        (never 0) and the two buckets it may be stored in.
+    """
+    cdef uint64_t fingerprint, index1, index2
+    _cuckoo_key(version, value, _cuckoo_nbuckets(nbuckets), fingerprint_bits,
+                &fingerprint, &index1, &index2)
+    return (minimal_ulonglong(fingerprint), minimal_ulonglong(index1),
+            minimal_ulonglong(index2))
+
+def cuckoo_alt_index(index, fingerprint, nbuckets):
+    """Get the other bucket a fingerprint may be stored in.
+
+    :Parameters:
+        - `index`: One of the buckets of the fingerprint.
+        - `fingerprint`: The fingerprint.
+        - `nbuckets`: The number of buckets in the table, a power of 2.
+
+    :Return:
+        Returns the index of the other bucket.
+    """
+    return minimal_ulonglong(_cuckoo_alt(index, fingerprint,
+                                         _cuckoo_nbuckets(nbuckets)))
+
+def cuckoo_contains(table, Py_ssize_t offset, nbuckets, int fingerprint_bits,
+                    int version, value):
+    """Check whether the fingerprint of a key is in a cuckoo filter table.
+
+    See `cuckoo_locate` for the parameters.  The table may be read-only,
+    such as an mmap.
+
+    :Parameters:
+        - `table`: A buffer holding the table.
+        - `offset`: The offset of the table in the buffer.
+
+    :Return:
+        Returns True if either bucket of the key holds its fingerprint.
+    """
+    cdef unsigned char *data
+    cdef uint64_t n, fingerprint, index1, index2
+    cdef int entry
+    n = _cuckoo_nbuckets(nbuckets)
+    _cuckoo_key(version, value, n, fingerprint_bits, &fingerprint, &index1,
+                &index2)
+    entry = fingerprint_bits / 8
+    data = _filter_table(table, offset, n * _CUCKOO_BUCKET_SIZE * entry, 0)
+    return bool(_cuckoo_find(data, entry, index1, fingerprint) or
+                _cuckoo_find(data, entry, index2, fingerprint))
@@ -0,0 +1,232 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/codec.py#1 $
+
+"""Compact binary encoding of IP, Mask and IPRange objects.
+
+Format
+======
+Every value is made of one or more fixed-width address records.  A record is
+a tag byte followed by the address in network byte order, 4 bytes for IPv4
+or 16 bytes for IPv6::
+
+    tag 0x00 - 0x20     IPv4, tag is the prefix length (0 - 32)
+    tag 0x40 - 0xc0     IPv6, tag - 0x40 is the prefix length (0 - 128)
+
+The objects are encoded as follows:
+
+- IP objects: One record with the address and prefix length.
+- `Prefix`: One record with the network address and prefix length.
+- Other `IPRange` objects: Two records, the first and the last address.
+- `Mask` objects: One record with the mask value.  The prefix length field
+  holds the render format instead (see `MASK_FORMATS`).
+
+A sequence of IP objects is encoded as records back to back with
+`encode_ips`, which is done in C.
+
+The IP, Mask and IPRange classes use this module for pickling, so pickles of
+those objects are much smaller and faster to load than the default.
+
+Usage
+=====
+::
+
+    >>> encode_ip(IP('1.2.3.4/24'))
+    '\\x18\\x01\\x02\\x03\\x04'
+    >>> decode_ip(_)
+    IPv4('1.2.3.4/24')
+"""
+
+__version__ = '$Revision: #1 $'
+
+from aplib.net import _net
+from aplib.net.exceptions import IPValidationError, MaskValidationError
+from aplib.net.mask import MASK_FORMAT, Mask4, Mask6
+
+MASK_FORMATS = (MASK_FORMAT.HEX, MASK_FORMAT.DOTTED_QUAD, MASK_FORMAT.PREFIX)
+"""Render formats of Mask objects, indexed by their encoded value."""
+
+_mask_format_codes = dict((format, code)
+                          for code, format in enumerate(MASK_FORMATS))
+
+def _new_ip(version, value, prefixlen):
+    if version == 4:
+        cls = aplib.net.ip.IPv4
+    else:
+        cls = aplib.net.ip.IPv6
+    result = cls.__new__(cls)
+    result.ip = value
+    result.prefixlen = prefixlen
+    result._netmask = cls._mask.prefixlen_to_mask(prefixlen)
+    return result
+
+def _decode_one(data):
+    try:
+        version, value, prefixlen, end = _net.unpack_ip(data)
+    except ValueError:
+        raise IPValidationError(data)
+    if end != len(data):
+        raise IPValidationError(data)
+    return version, value, prefixlen
+
+def encode_ip(ip):
+    """Encode an IP object.
+
+    :Parameters:
+        - `ip`: The `aplib.net.ip.BaseIP` object to encode.
+
+    :Return:
+        Returns a string of 5 bytes for IPv4 or 17 bytes for IPv6.
+    """
+    return _net.pack_ip(ip.version, ip.ip, ip.prefixlen)
+
+def decode_ip(data):
+    """Decode an IP object.
+
+    :Parameters:
+        - `data`: A string produced by `encode_ip`.
+
+    :Return:
+        Returns an `IPv4` or `IPv6` object.
+
+    :Exceptions:
+        - `IPValidationError`: The data is not a valid encoded IP.
+    """
+    return _new_ip(*_decode_one(data))
+
+def encode_ips(ips):
+    """Encode a sequence of IP objects.
+
+    :Parameters:
+        - `ips`: A sequence of `aplib.net.ip.BaseIP` objects.
+
+    :Return:
+        Returns a string.
+    """
+    return _net.pack_ips(ips)
+
+def decode_ips(data):
+    """Decode a sequence of IP objects.
+
+    :Parameters:
+        - `data`: A string (or mmap, bytearray, etc.) produced by
+          `encode_ips`.
+
+    :Return:
+        Returns a list of `IPv4` and `IPv6` objects.
+
+    :Exceptions:
+        - `IPValidationError`: The data is not a valid encoded sequence.
+    """
+    try:
+        return _net.unpack_ips(data, aplib.net.ip.IPv4, aplib.net.ip.IPv6)
+    except ValueError:
+        raise IPValidationError(data)
+
+def encode_mask(mask):
+    """Encode a Mask object.
+
+    :Parameters:
+        - `mask`: The `aplib.net.mask.Mask` object to encode.
+
+    :Return:
+        Returns a string of 5 bytes for IPv4 or 17 bytes for IPv6.
+    """
+    return _net.pack_ip(mask.version, mask.mask,
+                        _mask_format_codes[mask.render_format])
+
+def decode_mask(data, cls=None):
+    """Decode a Mask object.
+
+    :Parameters:
+        - `data`: A string produced by `encode_mask`.
+        - `cls`: The Mask class to create.  Defaults to `Mask4` or `Mask6`
+          depending on the encoded version.
+
+    :Return:
+        Returns a `Mask4` or `Mask6` object.
+
+    :Exceptions:
+        - `MaskValidationError`: The data is not a valid encoded mask.
+    """
+    try:
+        version, value, code = _decode_one(data)
+        render_format = MASK_FORMATS[code]
+    except (IPValidationError, IndexError):
+        raise MaskValidationError(data)
+    if cls is None:
+        if version == 4:
+            cls = Mask4
+        else:
+            cls = Mask6
+    elif cls.version != version:
+        raise MaskValidationError(data)
+    result = cls(value)
+    result.render_format = render_format
+    return result
+
+def encode_range(ip_range):
+    """Encode an IPRange object.
+
+    :Parameters:
+        - `ip_range`: The `aplib.net.range.IPRange` object to encode.
+
+    :Return:
+        Returns a string.
+    """
+    if isinstance(ip_range, aplib.net.range.Prefix):
+        return _net.pack_ip(ip_range.first.version, ip_range.first.ip,
+                            ip_range.prefixlen)
+    return encode_ips((ip_range.first, ip_range.last))
+
+def decode_range(data, cls=None):
+    """Decode an IPRange object.
+
+    :Parameters:
+        - `data`: A string produced by `encode_range`.
+        - `cls`: The IPRange class to create.  Defaults to `Prefix` for a
+          one-address encoding and to `IPRange` for a two-address encoding.
+
+    :Return:
+        Returns an `IPRange` object.
+
+    :Exceptions:
+        - `IPValidationError`: The data is not a valid encoded range.
+    """
+    ips = decode_ips(data)
+    if len(ips) == 1:
+        if cls is None:
+            return aplib.net.range.Prefix(ips[0])
+        result = cls.__new__(cls)
+        aplib.net.range.Prefix.__init__(result, ips[0])
+        return result
+    if len(ips) != 2 or ips[0].version != ips[1].version:
+        raise IPValidationError(data)
+    if cls is None:
+        cls = aplib.net.range.IPRange
+    result = cls.__new__(cls)
+    aplib.net.range.IPRange.__init__(result, ips[0], ips[1])
+    return result
+
+# Putting this at the bottom is a bit of a hack to work around cyclical
+# import issues.
+import aplib.net.ip
+import aplib.net.range
@@ -62,3 +62,63 @@ class MaskValidationError(Error):
 
     def __repr__(self):
         return '<MaskValidationError %s>' % (self.mask,)
+
+class FilterFormatError(Error):
+
+    """Serialized filter data is invalid.
+
+    :IVariables:
+        - `reason`: A string describing what is wrong with the data.
+    """
+
+    def __init__(self, reason):
+        Exception.__init__(self)
+        self.reason = reason
+
+    def __repr__(self):
+        return '<FilterFormatError %s>' % (self.reason,)
+
+class FilterFullError(Error):
+
+    """A filter has no room left for another item.
+
+    :IVariables:
+        - `capacity`: The capacity the filter was created with.
+    """
+
+    def __init__(self, capacity):
+        Exception.__init__(self)
+        self.capacity = capacity
+
+    def __repr__(self):
+        return '<FilterFullError capacity=%s>' % (self.capacity,)
+
+class IPListFormatError(Error):
+
+    """The data is not a valid address list.
+
+    :IVariables:
+        - `reason`: A string describing what is wrong with the data.
+    """
+
+    def __init__(self, reason):
+        Exception.__init__(self)
+        self.reason = reason
+
+    def __repr__(self):
+        return '<IPListFormatError %s>' % (self.reason,)
+
+class AllocatorFullError(Error):
+
+    """An address allocator has no free block of the requested size.
+
+    :IVariables:
+        - `prefixlen`: The prefix length that was requested.
+    """
+
+    def __init__(self, prefixlen):
+        Exception.__init__(self)
+        self.prefixlen = prefixlen
+
+    def __repr__(self):
+        return '<AllocatorFullError prefixlen=%s>' % (self.prefixlen,)
@@ -0,0 +1,139 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# $Header: //prod/main/ap/aplib/aplib/net/extract.py#1 $
+
+"""Extract IP addresses from text such as log files.
+
+The scanning is done in C without holding the GIL, so a large file can be
+processed by several threads at once.  `split_lines` divides a buffer into
+chunks on line boundaries, and `extract_parallel` scans the chunks with a
+thread pool::
+
+    f = open('maillog', 'rb')
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    addresses = extract_parallel(data, 4, threads=8)
+    flags = aplib.net.special.classify_ipv4_array(addresses)
+
+See `aplib.net._net.extract_ipv4` and `aplib.net._net.extract_ipv6` for
+exactly what is recognized as an address.
+"""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import struct
+
+from aplib.net import _net
+
+def extract_ipv4(data, start=0, end=-1):
+    """Find all IPv4 addresses in text.
+
+    :Parameters:
+        - `data`: A string or other object supporting the buffer interface,
+          such as an mmap.
+        - `start`: The offset to start scanning at.
+        - `end`: The offset to stop scanning at.  Defaults to the end.
+
+    :Return:
+        Returns an ``array.array('I')`` of the addresses as integers.
+    """
+    return _net.extract_ipv4(data, start, end)
+
+def extract_ipv6(data, start=0, end=-1):
+    """Find all IPv6 addresses in text.
+
+    :Parameters:
+        - `data`: A string or other object supporting the buffer interface,
+          such as an mmap.
+        - `start`: The offset to start scanning at.
+        - `end`: The offset to stop scanning at.  Defaults to the end.
+
+    :Return:
+        Returns a list of the addresses as integers.
+    """
+    packed = _net.extract_ipv6(data, start, end)
+    halves = struct.unpack('!%iQ' % (len(packed) // 8,), packed)
+    return [halves[i] << 64 | halves[i + 1]
+            for i in xrange(0, len(halves), 2)]
+
+def split_lines(data, count):
+    """Divide a buffer into chunks that start and end on line boundaries.
+
+    :Parameters:
+        - `data`: A string or mmap.
+        - `count`: The number of chunks wanted.  Fewer are returned if the
+          data has too few lines.
+
+    :Return:
+        Returns a list of ``(start, end)`` offsets covering all of the data.
+    """
+    length = len(data)
+    result = []
+    start = 0
+    for i in xrange(1, count):
+        if start >= length:
+            break
+        end = data.find('\n', max(start, length * i // count))
+        if end == -1:
+            break
+        result.append((start, end + 1))
+        start = end + 1
+    if start < length or not result:
+        result.append((start, length))
+    return result
+
+def extract_parallel(data, version, threads=4, pool=None):
+    """Find all addresses in text using several threads.
+
+    :Parameters:
+        - `data`: A string or mmap.
+        - `version`: The address version to look for, 4 or 6.
+        - `threads`: The number of chunks to split the data into.
+        - `pool`: An object with a ``map(function, iterable)`` method to run
+          the chunks with, such as a ``multiprocessing.pool.ThreadPool`` or
+          a ``concurrent.futures.ThreadPoolExecutor``.  By default a
+          `ThreadPool` with `threads` threads is created for the call.
+
+    :Return:
+        Returns the addresses in the order found, as an
+        ``array.array('I')`` for IPv4 or a list of integers for IPv6.
+    """
+    if version == 4:
+        scan = extract_ipv4
+        result = array.array('I')
+    else:
+        scan = extract_ipv6
+        result = []
+    chunks = split_lines(data, threads)
+    work = lambda chunk: scan(data, chunk[0], chunk[1])
+    if pool is None:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(threads)
+        try:
+            parts = pool.map(work, chunks)
+        finally:
+            pool.close()
+    else:
+        parts = pool.map(work, chunks)
+    for part in parts:
+        result.extend(part)
+    return result
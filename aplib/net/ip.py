@@ -115,9 +115,6 @@ Future
 ======
 - Add IPv6 scope information (like fe80::3%eth0), aka "zone index".
 
-- Option to format IPv6 without compression (no ::).  Also, maybe without
-  removing leading zeros for a fixed-width output.
-
 - Add a supernet method to get the next higher network (opposite of subnet).
   The distinction of supernet/subnet methods as they interact with the IP
   and IPRange objects should be clarified.
@@ -129,6 +126,8 @@ from aplib.net import _net
 from aplib.net.mask import Mask4, Mask6
 from aplib.net.exceptions import *
 from aplib.net.range import Prefix
+from aplib.net.special import ADDRESS_FLAGS, classify_int
+import copy_reg
 import struct
 
 cidr_fn = {4 : _net.parse_cidr4, 6: _net.parse_ipv6_prefix}
@@ -256,7 +255,136 @@ def ptoh(address):
         return IPv6.parse_ip(address)
     return result
 
-class BaseIP(object):
+class _PyIPCore(object):
+
+    """Storage, comparison and hashing for IP objects.
+
+    This is the pure Python version of `aplib.net._ip.IPCore`, used when the
+    extension is not built.
+    """
+
+    __slots__ = ('ip', 'prefixlen', '_netmask')
+
+    # See aplib.net._ip.IPCore for the pickle format.
+    def __reduce__(self):
+        state = aplib.net.codec.encode_ip(self)
+        if getattr(self, '__dict__', None):
+            state = (state, self.__dict__)
+        return (copy_reg.__newobj__, (self.__class__,), state)
+
+    def __setstate__(self, state):
+        if not isinstance(state, str):
+            if len(state) == 2:
+                self.__setstate__(state[0])
+                self.__dict__.update(state[1])
+            else:
+                self.ip, self.prefixlen, self._netmask = state
+            return
+        try:
+            version, ip, prefixlen, end = _net.unpack_ip(state)
+        except ValueError:
+            raise ValueError(state)
+        if version != self.version or end != len(state):
+            raise ValueError(state)
+        self.ip = ip
+        self.prefixlen = prefixlen
+        self._netmask = self._mask.prefixlen_to_mask(prefixlen)
+
+    @property
+    def network(self):
+        """The network for this IP.
+
+        The value is an `aplib.net.range.Prefix` instance that represents the
+        network for this IP.
+        """
+        return Prefix(self)
+
+    @property
+    def broadcast(self):
+        """The broadcast address for this IP.
+
+        IPv6 doesn't really have a concept of a "broadcast address". However,
+        it is sometimes convenient to get the last IP address in a network
+        range, and the terminology is in common use to represent the last IP,
+        so for IPv6 it just returns the last IP in the network.
+
+        The value is a `BaseIP` instance that represents the "broadcast"
+        address for this IP.
+        """
+        return self.__class__(self.ip | (self._netmask ^ self.FULL_MASK))
+
+    def __hash__(self):
+        return hash((self.version, self.ip, self.prefixlen))
+
+    def __eq__(self, other):
+        try:
+            return (self.version == other.version and
+                    self.ip == other.ip and
+                    self.prefixlen == other.prefixlen)
+        except AttributeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        try:
+            return (self.version != other.version or
+                    self.ip != other.ip or
+                    self.prefixlen != other.prefixlen)
+        except AttributeError:
+            return NotImplemented
+
+    def __lt__(self, other):
+        try:
+            return ((self.version, self.ip, self.prefixlen) <
+                    (other.version, other.ip, other.prefixlen))
+        except AttributeError:
+            return NotImplemented
+
+    def __le__(self, other):
+        try:
+            return ((self.version, self.ip, self.prefixlen) <=
+                    (other.version, other.ip, other.prefixlen))
+        except AttributeError:
+            return NotImplemented
+
+    def __gt__(self, other):
+        try:
+            return ((self.version, self.ip, self.prefixlen) >
+                    (other.version, other.ip, other.prefixlen))
+        except AttributeError:
+            return NotImplemented
+
+    def __ge__(self, other):
+        try:
+            return ((self.version, self.ip, self.prefixlen) >=
+                    (other.version, other.ip, other.prefixlen))
+        except AttributeError:
+            return NotImplemented
+
+try:
+    from aplib.net._ip import IPCore as _IPCore
+except ImportError:
+    _IPCore = _PyIPCore
+else:
+    _copy_reg_reconstructor = copy_reg._reconstructor
+
+    def _reconstructor(cls, base, state):
+        """Create an object while loading a protocol 0 or 1 pickle.
+
+        Pickles of that kind create IP objects with ``object.__new__``,
+        which refuses subclasses of an extension type, so those are created
+        with ``IPCore.__new__`` instead.  Everything else is passed on to
+        the original ``copy_reg._reconstructor``.
+        """
+        if base is object and issubclass(cls, _IPCore):
+            return _IPCore.__new__(cls)
+        return _copy_reg_reconstructor(cls, base, state)
+
+    # Pickles name the function copy_reg._reconstructor, so this must be
+    # installed there (and pickles written with it still load without it).
+    _reconstructor.__module__ = 'copy_reg'
+    copy_reg._reconstructor = _reconstructor
+
+class BaseIP(_IPCore):
 
     """Base IP class.
 
@@ -287,7 +415,7 @@ class BaseIP(object):
         - `_netmask`: The netmask as an integer (stored for performance).
     """
 
-    __slots__ = ('ip', 'prefixlen', '_netmask')
+    __slots__ = ()
 
     version = None
     WIDTH = None
@@ -401,6 +529,17 @@ class BaseIP(object):
         """
         raise NotImplementedError
 
+    def classify(self):
+        """Classify the address against the special-purpose registries.
+
+        Only the address is considered, not the network prefix.
+
+        :Return:
+            Returns a bitmask of `aplib.net.special.ADDRESS_FLAGS` values.
+            An ordinary global unicast address returns 0.
+        """
+        return classify_int(self.version, self.ip)
+
     def is_private(self):
         """Determine if this is a "private" address.
 
@@ -410,7 +549,7 @@ class BaseIP(object):
         :Return:
             Returns a boolean of whether or not this is a "private" address.
         """
-        raise NotImplementedError
+        return bool(self.classify() & ADDRESS_FLAGS.PRIVATE)
 
     def is_multicast(self):
         """Determine if this is a multicast address.
@@ -418,7 +557,7 @@ class BaseIP(object):
         :Return:
             Returns a boolean of whether or not this is a multicast address.
         """
-        raise NotImplementedError
+        return bool(self.classify() & ADDRESS_FLAGS.MULTICAST)
 
     def is_loopback(self):
         """Determine if this is a loopback address.
@@ -426,7 +565,7 @@ class BaseIP(object):
         :Return:
             Returns a boolean of whether or not this is a loopback address.
         """
-        raise NotImplementedError
+        return bool(self.classify() & ADDRESS_FLAGS.LOOPBACK)
 
     def is_link_local(self):
         """Determine if this is a link-local address.
@@ -436,7 +575,7 @@ class BaseIP(object):
         :Return:
             Returns a boolean of whether or not this is a link-local address.
         """
-        raise NotImplementedError
+        return bool(self.classify() & ADDRESS_FLAGS.LINK_LOCAL)
 
     def is_unspecified(self):
         """Determine if this is the "unspecified" address.
@@ -490,32 +629,29 @@ class BaseIP(object):
         """
         raise NotImplementedError
 
-    def format(self, always_prefix=False):
+    def format(self, always_prefix=False, fixed_width=False):
         """Format the IP to a string.
 
         :Parameters:
             - `always_prefix`: If True, will always include the network prefix.
               If False (the default) then it will exclude the network prefix if
               it is the full width (only 1 IP).
+            - `fixed_width`: If True, format the address with a fixed number
+              of characters (zero-padded IPv4 octets, uncompressed IPv6), so
+              that formatted addresses sort lexically.
 
         :Return:
             Returns a string representation of the IP and network.
         """
+        if fixed_width:
+            return _net.format_many((self.ip,), self.version, '',
+                                    always_prefix, (self.prefixlen,), True)
         if not always_prefix and self.prefixlen == self.WIDTH:
             return self.int_to_str(self.ip)
         else:
             return '%s/%i' % (self.int_to_str(self.ip),
                               self.prefixlen)
 
-    @property
-    def network(self):
-        """The network for this IP.
-
-        The value is an `aplib.net.range.Prefix` instance that represents the
-        network for this IP.
-        """
-        return Prefix(self)
-
     @property
     def netmask(self):
         """The netmask for this IP.
@@ -542,20 +678,6 @@ class BaseIP(object):
         """
         return self._mask(self._netmask ^ self.FULL_MASK)
 
-    @property
-    def broadcast(self):
-        """The broadcast address for this IP.
-
-        IPv6 doesn't really have a concept of a "broadcast address". However,
-        it is sometimes convenient to get the last IP address in a network
-        range, and the terminology is in common use to represent the last IP,
-        so for IPv6 it just returns the last IP in the network.
-
-        The value is a `BaseIP` instance that represents the "broadcast"
-        address for this IP.
-        """
-        return self.__class__(self.ip | (self._netmask ^ self.FULL_MASK))
-
     def subnet(self, prefixlen_diff=1):
         """Return a list of subnets of this IP network.
 
@@ -601,9 +723,6 @@ class BaseIP(object):
     def __long__(self):
         return self.ip
 
-    def __hash__(self):
-        return hash((self.version, self.ip, self.prefixlen))
-
     def __hex__(self):
         return '0x%0*x' % (self.WIDTH/4, self.ip)
 
@@ -613,56 +732,6 @@ class BaseIP(object):
     def __sub__(self, other):
         return self.__class__(self.ip - int(other))
 
-    def __eq__(self, other):
-        try:
-            return (self.version == other.version and
-                    self.ip == other.ip and
-                    self.prefixlen == other.prefixlen)
-        except AttributeError:
-            return NotImplemented
-
-    def __ne__(self, other):
-        try:
-            return (self.version != other.version or
-                    self.ip != other.ip or
-                    self.prefixlen != other.prefixlen)
-        except AttributeError:
-            return NotImplemented
-
-    def __lt__(self, other):
-        try:
-            return ((self.version, self.ip, self.prefixlen) <
-                    (other.version, other.ip, other.prefixlen))
-        except AttributeError:
-            return NotImplemented
-
-    def __le__(self, other):
-        try:
-            return ((self.version, self.ip, self.prefixlen) <=
-                    (other.version, other.ip, other.prefixlen))
-        except AttributeError:
-            return NotImplemented
-
-    def __gt__(self, other):
-        try:
-            return ((self.version, self.ip, self.prefixlen) >
-                    (other.version, other.ip, other.prefixlen))
-        except AttributeError:
-            return NotImplemented
-
-    def __ge__(self, other):
-        try:
-            return ((self.version, self.ip, self.prefixlen) >=
-                    (other.version, other.ip, other.prefixlen))
-        except AttributeError:
-            return NotImplemented
-
-    def __getstate__(self):
-        return (self.ip, self.prefixlen, self._netmask)
-
-    def __setstate__(self, data):
-        self.ip, self.prefixlen, self._netmask = data
-
 class IPv4(BaseIP):
 
     """IPv4 object.
@@ -701,21 +770,6 @@ class IPv4(BaseIP):
             raise IPValidationError(value)
         return _net.ipv4_htop(value)
 
-    def is_private(self):
-        return (self in Prefix('10.0.0.0/8') or
-                self in Prefix('172.16.0.0/12') or
-                self in Prefix('192.168.0.0/16')
-               )
-
-    def is_multicast(self):
-        return self in Prefix('224.0.0.0/4')
-
-    def is_loopback(self):
-        return self in Prefix('127.0.0.0/8')
-
-    def is_link_local(self):
-        return self in Prefix('169.254.0.0/16')
-
     def reverse_dns_pieces(self, to_append=''):
         if to_append:
             to_append = '.' + to_append
@@ -779,18 +833,10 @@ class IPv6(BaseIP):
         return _net.ipv6_ntop(struct.pack('!2Q', value >> 64,
                                                  value & 0xffffffffffffffff))
 
-    def is_private(self):
-        return self in Prefix('fc00::/7')
-
-    def is_multicast(self):
-        return self in Prefix('ff00::/8')
-
     def is_loopback(self):
+        # Unlike the other checks, this one also requires a full-width prefix.
         return self.ip == 1 and self.prefixlen == 128
 
-    def is_link_local(self):
-        return self in Prefix('fe80::/10')
-
     def reverse_dns_pieces(self, to_append=''):
         result = [None]*32
         if to_append:
@@ -814,3 +860,7 @@ def _unpack(address):
     return i << 64 | j
 
 IPv6.localhost = IPv6('::1')
+
+# Putting this at the bottom is a bit of a hack to work around cyclical
+# import issues.
+import aplib.net.codec
@@ -0,0 +1,335 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# $Header: //prod/main/ap/aplib/aplib/net/iparray.py#1 $
+
+"""NumPy arrays of IP addresses.
+
+This module provides vectorized versions of the common IP operations for
+addresses held in NumPy arrays.  It requires NumPy, which is otherwise not a
+dependency of aplib, so it is not imported by any other module.
+
+Representation
+==============
+- IPv4 addresses are ``uint32`` arrays in host-byte order, the same values as
+  ``aplib.net.ip.IPv4.ip``.
+- IPv6 addresses are arrays of the structured `IPV6_DTYPE`, with the high
+  and low 64 bits of the address in the ``hi`` and ``lo`` fields.  Arrays of
+  this type sort (and ``searchsorted``) in address order.
+
+Every function takes the address version as an argument, and gives the same
+results as the equivalent methods of the IP, Mask and Prefix objects.
+
+Usage::
+
+    >>> addrs = from_strings(['10.1.2.3', '192.0.2.1'], 4)
+    >>> to_strings(apply_netmask(addrs, 4, 24), 4)
+    ['10.1.2.0', '192.0.2.0']
+    >>> contains(addrs, 4, [Prefix('10.0.0.0/8')])
+    array([ True, False])
+"""
+
+__version__ = '$Revision: #1 $'
+
+import numpy
+
+from aplib.net import _net
+from aplib.net.exceptions import IPValidationError, MaskValidationError
+from aplib.net.lookup import RangeLookup
+from aplib.net.mask import Mask4, Mask6
+from aplib.net import special
+
+IPV6_DTYPE = numpy.dtype([('hi', numpy.uint64), ('lo', numpy.uint64)])
+"""The NumPy type of IPv6 addresses."""
+
+# Same layout in network byte order, for converting to and from packed form.
+_IPV6_PACKED_DTYPE = numpy.dtype([('hi', '>u8'), ('lo', '>u8')])
+
+_HALF = 0xffffffffffffffff
+
+# Netmasks indexed by prefix length.
+_MASK4 = numpy.array([Mask4.prefixlen_to_mask(i) for i in xrange(33)],
+                     dtype=numpy.uint32)
+_MASK6_HI = numpy.array([Mask6.prefixlen_to_mask(i) >> 64
+                         for i in xrange(129)], dtype=numpy.uint64)
+_MASK6_LO = numpy.array([Mask6.prefixlen_to_mask(i) & _HALF
+                         for i in xrange(129)], dtype=numpy.uint64)
+
+def empty(count, version):
+    """Create an uninitialized address array.
+
+    :Parameters:
+        - `count`: The number of addresses.
+        - `version`: The address version, 4 or 6.
+
+    :Return:
+        Returns a NumPy array.
+    """
+    if version == 4:
+        return numpy.empty(count, dtype=numpy.uint32)
+    return numpy.empty(count, dtype=IPV6_DTYPE)
+
+def from_ints(values, version):
+    """Convert integers to an address array.
+
+    :Parameters:
+        - `values`: A sequence of addresses as integers.
+        - `version`: The address version, 4 or 6.
+
+    :Return:
+        Returns a NumPy array.
+    """
+    if version == 4:
+        return numpy.array(values, dtype=numpy.uint32)
+    return numpy.array([(value >> 64, value & _HALF) for value in values],
+                       dtype=IPV6_DTYPE)
+
+def to_ints(arr, version):
+    """Convert an address array to integers.
+
+    :Parameters:
+        - `arr`: The address array.
+        - `version`: The address version, 4 or 6.
+
+    :Return:
+        Returns a list of integers.
+    """
+    if version == 4:
+        return arr.tolist()
+    return [hi << 64 | lo for hi, lo in arr.tolist()]
+
+def from_strings(strings, version):
+    """Parse IP address strings into an address array.
+
+    Network prefixes are not allowed; use `from_cidr_strings` for those.
+
+    :Parameters:
+        - `strings`: A sequence of strings.
+        - `version`: The address version, 4 or 6.
+
+    :Return:
+        Returns a NumPy array.
+
+    :Exceptions:
+        - `IPValidationError`: One of the strings is not a valid address.
+    """
+    if version == 4:
+        result = numpy.empty(len(strings), dtype=numpy.uint32)
+        for index, address in enumerate(strings):
+            value = _net.parse_ipv4(address)
+            if value is None:
+                raise IPValidationError(address)
+            result[index] = value
+        return result
+    packed = []
+    for address in strings:
+        value = _net.parse_ipv6(address)
+        if value is None:
+            raise IPValidationError(address)
+        packed.append(value)
+    return numpy.frombuffer(''.join(packed),
+                            dtype=_IPV6_PACKED_DTYPE).astype(IPV6_DTYPE)
+
+def from_cidr_strings(strings, version):
+    """Parse IP address strings with optional network prefixes.
+
+    :Parameters:
+        - `strings`: A sequence of strings.
+        - `version`: The address version, 4 or 6.
+
+    :Return:
+        Returns a tuple ``(addresses, prefixlens)``.  ``addresses`` is an
+        address array and ``prefixlens`` is a ``uint8`` array.  Addresses
+        without a prefix get the full width, as with the IP objects.
+
+    :Exceptions:
+        - `IPValidationError`: One of the strings is not valid.
+    """
+    prefixlens = numpy.empty(len(strings), dtype=numpy.uint8)
+    if version == 4:
+        result = numpy.empty(len(strings), dtype=numpy.uint32)
+        for index, address in enumerate(strings):
+            value = _net.parse_cidr4(address)
+            if value is None:
+                raise IPValidationError(address)
+            result[index], prefixlens[index] = value
+        return result, prefixlens
+    packed = []
+    for index, address in enumerate(strings):
+        value = _net.parse_ipv6_prefix(address)
+        if value is None:
+            raise IPValidationError(address)
+        packed.append(value[0])
+        prefixlens[index] = value[1]
+    result = numpy.frombuffer(''.join(packed),
+                              dtype=_IPV6_PACKED_DTYPE).astype(IPV6_DTYPE)
+    return result, prefixlens
+
+def to_strings(arr, version):
+    """Format an address array as text.
+
+    :Parameters:
+        - `arr`: The address array.
+        - `version`: The address version, 4 or 6.
+
+    :Return:
+        Returns a list of strings, formatted as ``str()`` of the IP objects
+        without a prefix.
+    """
+    if version == 4:
+        return map(_net.ipv4_htop, arr.tolist())
+    packed = arr.astype(_IPV6_PACKED_DTYPE).tostring()
+    return [_net.ipv6_ntop(packed[i:i + 16])
+            for i in xrange(0, len(packed), 16)]
+
+def _masks(version, prefixlen):
+    """Get the netmask arrays for a prefix length or array of them."""
+    prefixlen = numpy.asarray(prefixlen)
+    if version == 4:
+        width = 32
+    else:
+        width = 128
+    if prefixlen.dtype.kind not in 'iu':
+        raise MaskValidationError(prefixlen)
+    if prefixlen.size and (prefixlen.min() < 0 or prefixlen.max() > width):
+        raise MaskValidationError(prefixlen)
+    if version == 4:
+        return _MASK4[prefixlen], None
+    return _MASK6_HI[prefixlen], _MASK6_LO[prefixlen]
+
+def apply_netmask(arr, version, prefixlen):
+    """Get the network addresses.
+
+    This is the vectorized form of ``IP.network.first``.
+
+    :Parameters:
+        - `arr`: The address array.
+        - `version`: The address version, 4 or 6.
+        - `prefixlen`: The prefix length, either a single value or an array
+          with one per address.
+
+    :Return:
+        Returns a new address array.
+
+    :Exceptions:
+        - `MaskValidationError`: A prefix length is out of range.
+    """
+    mask, mask_lo = _masks(version, prefixlen)
+    if version == 4:
+        return arr & mask
+    result = numpy.empty(arr.shape, dtype=IPV6_DTYPE)
+    result['hi'] = arr['hi'] & mask
+    result['lo'] = arr['lo'] & mask_lo
+    return result
+
+def broadcast(arr, version, prefixlen):
+    """Get the broadcast (last) addresses.
+
+    This is the vectorized form of ``IP.broadcast``.
+
+    :Parameters:
+        - `arr`: The address array.
+        - `version`: The address version, 4 or 6.
+        - `prefixlen`: The prefix length, either a single value or an array
+          with one per address.
+
+    :Return:
+        Returns a new address array.
+
+    :Exceptions:
+        - `MaskValidationError`: A prefix length is out of range.
+    """
+    mask, mask_lo = _masks(version, prefixlen)
+    if version == 4:
+        return arr | ~mask
+    result = numpy.empty(arr.shape, dtype=IPV6_DTYPE)
+    result['hi'] = arr['hi'] | ~mask
+    result['lo'] = arr['lo'] | ~mask_lo
+    return result
+
+def _bounds(ranges, version):
+    """Convert ``(first, last)`` integer tuples to two address arrays."""
+    firsts = from_ints([first for first, last in ranges], version)
+    lasts = from_ints([last for first, last in ranges], version)
+    return firsts, lasts
+
+_special_tables = {}
+
+def classify(arr, version):
+    """Classify addresses against the special-purpose registries.
+
+    This is the vectorized form of ``IP.classify``.
+
+    :Parameters:
+        - `arr`: The address array.
+        - `version`: The address version, 4 or 6.
+
+    :Return:
+        Returns a ``uint32`` array of `aplib.net.special.ADDRESS_FLAGS`
+        bitmasks.
+    """
+    if version == 4:
+        return numpy.frombuffer(special.classify_ipv4_array(
+            numpy.ascontiguousarray(arr, dtype=numpy.uint32)),
+            dtype=numpy.uint32)
+    try:
+        starts, flags = _special_tables[version]
+    except KeyError:
+        starts, flags = special._tables[version]
+        starts = from_ints(starts, version)
+        flags = numpy.array(flags, dtype=numpy.uint32)
+        _special_tables[version] = starts, flags
+    return flags[numpy.searchsorted(starts, arr, side='right') - 1]
+
+def _less_equal(a, b, version):
+    if version == 4:
+        return a <= b
+    return (a['hi'] < b['hi']) | ((a['hi'] == b['hi']) & (a['lo'] <= b['lo']))
+
+def contains(arr, version, ranges):
+    """Check which addresses are in a set of ranges.
+
+    The ranges are merged and sorted once, then every address is looked up
+    with a binary search.
+
+    :Parameters:
+        - `arr`: The address array.
+        - `version`: The address version, 4 or 6.
+        - `ranges`: A `aplib.net.lookup.RangeLookup`, or an iterable of
+          anything `RangeLookup.add` accepts (Prefix, IPRange, IPGlob or IP
+          objects).  Ranges of the other version are ignored.
+
+    :Return:
+        Returns a boolean array.
+    """
+    if not isinstance(ranges, RangeLookup):
+        ranges = RangeLookup(ranges)
+    if version == 4:
+        found = ranges.contains_ipv4_array(
+            numpy.ascontiguousarray(arr, dtype=numpy.uint32))
+        return numpy.frombuffer(found, dtype=numpy.uint8).astype(bool)
+    firsts, lasts = _bounds(ranges.ranges(version), version)
+    if not len(firsts):
+        return numpy.zeros(arr.shape, dtype=bool)
+    index = numpy.searchsorted(firsts, arr, side='right') - 1
+    found = index >= 0
+    index[~found] = 0
+    return found & _less_equal(arr, lasts[index], version)
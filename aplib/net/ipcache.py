@@ -0,0 +1,382 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/ipcache.py#1 $
+
+"""Per-address verdict cache.
+
+Introduction
+============
+The `IPCache` object caches a value (such as a DNSBL or reputation verdict)
+per IP address.  It is keyed on ``(version, ip_int)`` so no strings or IP
+objects need to be built to use it.
+
+Every entry has its own time-to-live.  Expiry times are kept in a heap so
+that expired entries are purged without scanning the whole cache.  The number
+of entries is capped; when the cache is full the least recently used entry is
+evicted.
+
+Negative results (for example "not listed") can be given a different TTL from
+positive results.
+
+Serving stale entries
+=====================
+If the cache is created with a ``stale_ttl``, an entry remains available for
+that many seconds after it expires.  The first lookup of a stale entry
+returns `CACHE_STATE.REFRESH` to tell the caller to start a refresh; further
+lookups return `CACHE_STATE.STALE` with the old value until the refresh
+stores a new value with `IPCache.set` or gives up with
+`IPCache.refresh_failed`.
+
+Usage
+=====
+::
+
+    cache = IPCache(100000, ttl=3600, negative_ttl=300, stale_ttl=60)
+    state, verdict = cache.lookup(ip)
+    if state is CACHE_STATE.MISS or state is CACHE_STATE.REFRESH:
+        verdict = query_dnsbl(ip)
+        cache.set(ip, verdict, negative=not verdict)
+"""
+
+__version__ = '$Revision: #1 $'
+
+import heapq
+import time
+
+class CACHE_STATE:
+
+    """Static constants for the result of a cache lookup.
+
+    - `MISS`: The address is not in the cache.
+    - `HIT`: A fresh entry was found.
+    - `STALE`: An expired entry was found and a refresh is already pending.
+    - `REFRESH`: An expired entry was found and the caller should refresh
+      it.
+    """
+
+    MISS = 'MISS'
+    HIT = 'HIT'
+    STALE = 'STALE'
+    REFRESH = 'REFRESH'
+
+class _Entry(object):
+
+    """A cache entry, which is also a node in the LRU list."""
+
+    __slots__ = ('prev', 'next', 'version', 'ip', 'value', 'expires',
+                 'stale_until', 'refreshing')
+
+class IPCache(object):
+
+    """Cache of values keyed by IP address.
+
+    :IVariables:
+        - `max_entries`: The maximum number of entries.
+        - `ttl`: The default time-to-live in seconds.
+        - `negative_ttl`: The time-to-live for negative results, or None to
+          use `ttl`.
+        - `stale_ttl`: How long in seconds an expired entry may be served
+          while it is being refreshed.
+        - `hits`: The number of lookups that found a fresh entry.
+        - `misses`: The number of lookups that found nothing.
+        - `stale_hits`: The number of lookups that returned a stale entry.
+        - `evictions`: The number of entries removed to make room.
+        - `expirations`: The number of entries removed because they expired.
+    """
+
+    # Rebuild the heap once it holds this many times more items than the
+    # cache (stale items pile up when entries are overwritten).
+    _HEAP_SLACK = 2
+
+    def __init__(self, max_entries, ttl, negative_ttl=None, stale_ttl=0,
+                 clock=time.time):
+        """Create an empty cache.
+
+        :Parameters:
+            - `max_entries`: The maximum number of entries.
+            - `ttl`: The default time-to-live in seconds.
+            - `negative_ttl`: The time-to-live for entries stored with
+              ``negative=True``.  Defaults to `ttl`.
+            - `stale_ttl`: How long an expired entry may be served while it
+              is refreshed.  Defaults to 0 (never serve stale entries).
+            - `clock`: A function returning the current time in seconds.
+        """
+        if max_entries < 1:
+            raise ValueError(max_entries)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        # version -> {ip_int: _Entry}
+        self._entries = {4: {}, 6: {}}
+        self._count = 0
+        # Sentinel of the circular LRU list.  root.next is the most recently
+        # used entry, root.prev is the least recently used.
+        root = _Entry()
+        root.prev = root.next = root
+        self._root = root
+        # (stale_until, sequence, entry)
+        self._heap = []
+        self._sequence = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return self._count
+
+    def _unlink(self, entry):
+        entry.prev.next = entry.next
+        entry.next.prev = entry.prev
+
+    def _link_front(self, entry):
+        root = self._root
+        entry.prev = root
+        entry.next = root.next
+        root.next.prev = entry
+        root.next = entry
+
+    def _remove(self, entry):
+        self._unlink(entry)
+        entry.prev = entry.next = None
+        del self._entries[entry.version][entry.ip]
+        self._count -= 1
+
+    def lookup(self, ip):
+        """Look up an IP address.
+
+        :Parameters:
+            - `ip`: The IP object to look up.
+
+        :Return:
+            Returns a ``(state, value)`` tuple.  ``state`` is one of the
+            `CACHE_STATE` values.  ``value`` is None for a miss.
+        """
+        return self.lookup_int(ip.version, ip.ip)
+
+    def lookup_int(self, version, value):
+        """Look up an IP address in integer form.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.
+
+        :Return:
+            Returns a ``(state, value)`` tuple.  See `lookup`.
+        """
+        entry = self._entries[version].get(value)
+        if entry is None:
+            self.misses += 1
+            return CACHE_STATE.MISS, None
+        now = self._clock()
+        if now < entry.expires:
+            self.hits += 1
+            self._unlink(entry)
+            self._link_front(entry)
+            return CACHE_STATE.HIT, entry.value
+        if now < entry.stale_until:
+            self.stale_hits += 1
+            self._unlink(entry)
+            self._link_front(entry)
+            if entry.refreshing:
+                return CACHE_STATE.STALE, entry.value
+            entry.refreshing = True
+            return CACHE_STATE.REFRESH, entry.value
+        self._remove(entry)
+        self.expirations += 1
+        self.misses += 1
+        return CACHE_STATE.MISS, None
+
+    def get(self, ip, default=None):
+        """Get the cached value for an IP address.
+
+        Stale entries are returned as well as fresh ones.  Use `lookup` to
+        find out which it is.
+
+        :Parameters:
+            - `ip`: The IP object to look up.
+            - `default`: The value to return on a miss.
+
+        :Return:
+            Returns the cached value or `default`.
+        """
+        return self.get_int(ip.version, ip.ip, default)
+
+    def get_int(self, version, value, default=None):
+        """Get the cached value for an IP address in integer form.
+
+        See `get`.
+        """
+        state, result = self.lookup_int(version, value)
+        if state is CACHE_STATE.MISS:
+            return default
+        return result
+
+    def set(self, ip, value, ttl=None, negative=False):
+        """Store a value for an IP address.
+
+        :Parameters:
+            - `ip`: The IP object.
+            - `value`: The value to cache.
+            - `ttl`: The time-to-live in seconds.  Defaults to the cache's
+              `negative_ttl` or `ttl` depending on `negative`.
+            - `negative`: Whether this is a negative result.
+        """
+        self.set_int(ip.version, ip.ip, value, ttl, negative)
+
+    def set_int(self, version, value, data, ttl=None, negative=False):
+        """Store a value for an IP address in integer form.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.
+            - `data`: The value to cache.
+            - `ttl`: See `set`.
+            - `negative`: See `set`.
+        """
+        now = self._clock()
+        if ttl is None:
+            if negative and self.negative_ttl is not None:
+                ttl = self.negative_ttl
+            else:
+                ttl = self.ttl
+        self._expire(now)
+        entries = self._entries[version]
+        entry = entries.get(value)
+        if entry is None:
+            if self._count >= self.max_entries:
+                self._remove(self._root.prev)
+                self.evictions += 1
+            entry = _Entry()
+            entry.version = version
+            entry.ip = value
+            entries[value] = entry
+            self._count += 1
+        else:
+            self._unlink(entry)
+        self._link_front(entry)
+        entry.value = data
+        entry.expires = now + ttl
+        entry.stale_until = entry.expires + self.stale_ttl
+        entry.refreshing = False
+        self._sequence += 1
+        heapq.heappush(self._heap, (entry.stale_until, self._sequence, entry))
+        if len(self._heap) > self._HEAP_SLACK * self._count + 64:
+            self._rebuild_heap()
+
+    def refresh_failed(self, ip):
+        """Note that refreshing a stale entry failed.
+
+        The entry continues to be served as stale, and the next lookup
+        returns `CACHE_STATE.REFRESH` again so another refresh is attempted.
+
+        :Parameters:
+            - `ip`: The IP object.
+        """
+        self.refresh_failed_int(ip.version, ip.ip)
+
+    def refresh_failed_int(self, version, value):
+        """Note that refreshing a stale entry failed.
+
+        See `refresh_failed`.
+        """
+        entry = self._entries[version].get(value)
+        if entry is not None:
+            entry.refreshing = False
+
+    def delete(self, ip):
+        """Remove an IP address from the cache.
+
+        :Parameters:
+            - `ip`: The IP object.
+
+        :Return:
+            Returns True if an entry was removed.
+        """
+        return self.delete_int(ip.version, ip.ip)
+
+    def delete_int(self, version, value):
+        """Remove an IP address in integer form from the cache.
+
+        See `delete`.
+        """
+        entry = self._entries[version].get(value)
+        if entry is None:
+            return False
+        self._remove(entry)
+        return True
+
+    def clear(self):
+        """Remove all entries.  Counters are not reset."""
+        self._entries = {4: {}, 6: {}}
+        self._count = 0
+        self._root.prev = self._root.next = self._root
+        self._heap = []
+
+    def expire(self):
+        """Remove all entries that can no longer be served.
+
+        This is done automatically as entries are added, but can be called
+        periodically to release memory sooner.
+
+        :Return:
+            Returns the number of entries removed.
+        """
+        return self._expire(self._clock())
+
+    def _expire(self, now):
+        heap = self._heap
+        removed = 0
+        while heap and heap[0][0] <= now:
+            stale_until, unused, entry = heapq.heappop(heap)
+            # Skip items for entries that were since removed or updated.
+            if entry.prev is not None and entry.stale_until == stale_until:
+                self._remove(entry)
+                removed += 1
+        self.expirations += removed
+        return removed
+
+    def _rebuild_heap(self):
+        heap = []
+        for entries in self._entries.itervalues():
+            for entry in entries.itervalues():
+                self._sequence += 1
+                heap.append((entry.stale_until, self._sequence, entry))
+        heapq.heapify(heap)
+        self._heap = heap
+
+    def stats(self):
+        """Get the cache counters.
+
+        :Return:
+            Returns a dictionary of counter name to value.
+        """
+        return {'entries': self._count,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+               }
@@ -0,0 +1,684 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/ipfilter.py#1 $
+
+"""Probabilistic IP address membership filters.
+
+Introduction
+============
+These filters answer the question "could this address possibly be listed?"
+with no false negatives and a tunable rate of false positives.  They are meant
+to sit in front of an expensive check (a full prefix lookup, a DNSBL query)
+so that the vast majority of addresses that cannot be listed are rejected
+after a few hash probes.
+
+There are three filter types:
+
+- `BloomFilter`: Exact IPv4/IPv6 addresses.  Smallest for a given error rate,
+  but items cannot be removed.
+- `PrefixBloomFilter`: A Bloom filter of networks.  A lookup probes once for
+  each prefix length that has been added for the address family.
+- `CuckooFilter`: Exact addresses, with support for removing items.
+
+All of them can be built from an iterable of IP objects (or `Prefix`
+objects for the prefix variant), serialized with ``tostring`` or ``dump``,
+and loaded back with ``fromstring``, ``load``, or ``mmap``.  A filter loaded
+with ``mmap`` reads its table straight out of the mapped file, so several
+processes can share one copy of a large filter.  Mapped filters are
+read-only.
+
+Usage
+=====
+Build a filter and check addresses against it::
+
+    >>> f = BloomFilter.from_ips([IP('1.2.3.4'), IP('2001:db8::1')])
+    >>> IP('1.2.3.4') in f
+    True
+    >>> f.contains_int(4, 0x01020304)
+    True
+
+Sizing
+======
+The size of a filter is derived from its capacity and error rate.  A Bloom
+filter needs about 1.44 * log2(1/error_rate) bits per item, so one million
+addresses at a 0.1% error rate take about 1.8 MB.  A cuckoo filter needs
+about (log2(1/error_rate) + 3) / 0.95 bits per item, rounded up to an 8, 16,
+or 32 bit fingerprint.
+
+Hashing and probing are done in `aplib.net._net` with a 64-bit mix of the
+address (not a cryptographic hash), in a fixed byte order, so a serialized
+filter gives the same answers on every host.
+"""
+
+__version__ = '$Revision: #1 $'
+
+import math
+import mmap as _mmap
+import struct
+
+from aplib.net import _net
+from aplib.net.exceptions import (FilterFormatError, FilterFullError,
+                                  MaskValidationError)
+from aplib.net.mask import Mask4, Mask6
+
+_MAGIC = 'APBF'
+# Version 1 hashed keys with MD5.
+_FORMAT_VERSION = 2
+
+_KIND_BLOOM = 1
+_KIND_PREFIX_BLOOM = 2
+_KIND_CUCKOO = 3
+
+# magic, format version, kind, parameter byte, prefix count, table size,
+# item count.
+_header = struct.Struct('!4sBBBBQQ')
+_prefix_entry = struct.Struct('!BB')
+
+_WIDTH = {4: Mask4.WIDTH, 6: Mask6.WIDTH}
+
+def _read_header(buf, kind):
+    if len(buf) < _header.size:
+        raise FilterFormatError('truncated header')
+    (magic, format_version, found_kind, param, nprefixes, size,
+     count) = _header.unpack_from(buf, 0)
+    if magic != _MAGIC:
+        raise FilterFormatError('bad magic %r' % (magic,))
+    if format_version != _FORMAT_VERSION:
+        raise FilterFormatError('unsupported version %d' % (format_version,))
+    if found_kind != kind:
+        raise FilterFormatError('wrong filter kind %d' % (found_kind,))
+    prefixes = []
+    offset = _header.size
+    for unused in xrange(nprefixes):
+        prefixes.append(_prefix_entry.unpack_from(buf, offset))
+        offset += _prefix_entry.size
+    return param, prefixes, size, count, offset
+
+def _open_mmap(fileobj):
+    return _mmap.mmap(fileobj.fileno(), 0, access=_mmap.ACCESS_READ)
+
+def _ips_and_count(ips, capacity):
+    if capacity is None:
+        ips = list(ips)
+        capacity = len(ips)
+    return ips, max(capacity, 1)
+
+class BloomFilter(object):
+
+    """Bloom filter of exact IP addresses.
+
+    IPv4 and IPv6 addresses can be mixed in the same filter.  The prefix
+    length of IP objects is ignored, only the address is used.
+
+    :IVariables:
+        - `nbits`: The number of bits in the table.
+        - `nhashes`: The number of hash probes per item.
+        - `count`: The number of items that have been added.
+    """
+
+    _kind = _KIND_BLOOM
+
+    def __init__(self, capacity, error_rate=0.01):
+        """Create an empty filter.
+
+        :Parameters:
+            - `capacity`: The number of items the filter is sized for.  Adding
+              more than this works, but the error rate goes up.
+            - `error_rate`: The desired false positive rate when the filter
+              holds `capacity` items.
+        """
+        if capacity < 1:
+            raise ValueError(capacity)
+        if not 0 < error_rate < 1:
+            raise ValueError(error_rate)
+        nbits = int(math.ceil(-capacity * math.log(error_rate) /
+                              (math.log(2) ** 2)))
+        # Round up to a whole number of bytes.
+        nbits = (nbits + 7) & ~7
+        nhashes = max(1, int(round(float(nbits) / capacity * math.log(2))))
+        self._init_table(bytearray(nbits // 8), 0, nbits, nhashes, 0)
+
+    def _init_table(self, buf, offset, nbits, nhashes, count):
+        self._buf = buf
+        self._offset = offset
+        self.nbits = nbits
+        self.nhashes = nhashes
+        self.count = count
+
+    @classmethod
+    def from_ips(cls, ips, error_rate=0.01, capacity=None):
+        """Create a filter holding a collection of IP addresses.
+
+        :Parameters:
+            - `ips`: An iterable of IP objects.
+            - `error_rate`: The desired false positive rate.
+            - `capacity`: The number of items to size the filter for.
+              Defaults to the number of items in `ips`.
+
+        :Return:
+            Returns a new filter.
+        """
+        ips, capacity = _ips_and_count(ips, capacity)
+        result = cls(capacity, error_rate)
+        for ip in ips:
+            result.add(ip)
+        return result
+
+    def __len__(self):
+        return self.count
+
+    def add(self, ip):
+        """Add an IP address to the filter.
+
+        :Parameters:
+            - `ip`: The IP object to add.
+        """
+        self.add_int(ip.version, ip.ip)
+
+    def add_int(self, version, value):
+        """Add an IP address in integer form to the filter.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.
+        """
+        self._add_key(version, _WIDTH[version], value)
+
+    def __contains__(self, ip):
+        return _net.bloom_contains(self._buf, self._offset, self.nbits,
+                                   self.nhashes, ip.version, ip.ip,
+                                   _WIDTH[ip.version])
+
+    def contains_int(self, version, value):
+        """Check whether an IP address in integer form may be in the filter.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.
+
+        :Return:
+            Returns False if the address is definitely not in the filter,
+            True if it probably is.
+        """
+        return _net.bloom_contains(self._buf, self._offset, self.nbits,
+                                   self.nhashes, version, value,
+                                   _WIDTH[version])
+
+    def _add_key(self, version, prefixlen, value):
+        if not isinstance(self._buf, bytearray):
+            raise TypeError('mapped filters are read-only')
+        _net.bloom_add(self._buf, self._offset, self.nbits, self.nhashes,
+                       version, value, prefixlen)
+        self.count += 1
+
+    def _prefix_entries(self):
+        return []
+
+    def tostring(self):
+        """Serialize the filter.
+
+        :Return:
+            Returns a string that can be passed to `fromstring`.
+        """
+        prefixes = self._prefix_entries()
+        parts = [_header.pack(_MAGIC, _FORMAT_VERSION, self._kind,
+                              self.nhashes, len(prefixes), self.nbits,
+                              self.count)]
+        for version, prefixlen in prefixes:
+            parts.append(_prefix_entry.pack(version, prefixlen))
+        nbytes = self.nbits // 8
+        parts.append(str(self._buf[self._offset:self._offset + nbytes]))
+        return ''.join(parts)
+
+    def dump(self, fileobj):
+        """Write the serialized filter to a file object."""
+        fileobj.write(self.tostring())
+
+    @classmethod
+    def fromstring(cls, data):
+        """Create a filter from the output of `tostring`.
+
+        :Parameters:
+            - `data`: A string or any other object supporting the buffer
+              interface.
+
+        :Return:
+            Returns a new filter.
+
+        :Exceptions:
+            - `FilterFormatError`: The data is not a valid filter of this
+              type.
+        """
+        return cls._from_buffer(bytearray(data), True)
+
+    @classmethod
+    def load(cls, fileobj):
+        """Read a filter written with `dump`.
+
+        :Parameters:
+            - `fileobj`: The file object to read from.
+
+        :Return:
+            Returns a new filter.
+        """
+        return cls.fromstring(fileobj.read())
+
+    @classmethod
+    def mmap(cls, fileobj):
+        """Map a filter written with `dump` into memory.
+
+        The table is not copied, it is read directly from the mapped file.
+        The resulting filter is read-only.
+
+        :Parameters:
+            - `fileobj`: A file object opened on the serialized filter.
+
+        :Return:
+            Returns a new filter.
+        """
+        return cls._from_buffer(_open_mmap(fileobj), False)
+
+    @classmethod
+    def _from_buffer(cls, buf, copy):
+        nhashes, prefixes, nbits, count, offset = _read_header(buf,
+                                                               cls._kind)
+        nbytes = nbits // 8
+        if nbits == 0 or nbits % 8 or len(buf) != offset + nbytes:
+            raise FilterFormatError('bad table size')
+        if nhashes < 1:
+            raise FilterFormatError('bad hash count')
+        result = cls.__new__(cls)
+        if copy:
+            buf = buf[offset:]
+            offset = 0
+        result._init_table(buf, offset, nbits, nhashes, count)
+        result._set_prefix_entries(prefixes)
+        return result
+
+    def _set_prefix_entries(self, prefixes):
+        pass
+
+class PrefixBloomFilter(BloomFilter):
+
+    """Bloom filter of networks.
+
+    Networks are added as `aplib.net.range.Prefix` objects (or IP objects,
+    in which case the host bits are stripped).  Checking an address probes
+    the filter once for each prefix length that has been added for that
+    address family, most specific first.
+    """
+
+    _kind = _KIND_PREFIX_BLOOM
+
+    def _init_table(self, buf, offset, nbits, nhashes, count):
+        BloomFilter._init_table(self, buf, offset, nbits, nhashes, count)
+        # version -> list of prefix lengths from longest to shortest.
+        self._prefixes = {4: [], 6: []}
+
+    @classmethod
+    def from_prefixes(cls, prefixes, error_rate=0.01, capacity=None):
+        """Create a filter holding a collection of networks.
+
+        :Parameters:
+            - `prefixes`: An iterable of `Prefix` objects.
+            - `error_rate`: The desired false positive rate of a single
+              probe.  A lookup probes once per distinct prefix length, so the
+              overall rate is correspondingly higher.
+            - `capacity`: The number of items to size the filter for.
+              Defaults to the number of items in `prefixes`.
+
+        :Return:
+            Returns a new filter.
+        """
+        return cls.from_ips(prefixes, error_rate, capacity)
+
+    def add(self, prefix):
+        """Add a network to the filter.
+
+        :Parameters:
+            - `prefix`: A `Prefix` or IP object.
+        """
+        first = prefix.first if hasattr(prefix, 'first') else prefix
+        self.add_int(first.version, first.ip, prefix.prefixlen)
+
+    def add_int(self, version, value, prefixlen):
+        """Add a network in integer form to the filter.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.  Host bits are ignored.
+            - `prefixlen`: The prefix length of the network.
+        """
+        if not 0 <= prefixlen <= _WIDTH[version]:
+            raise MaskValidationError(prefixlen)
+        self._add_prefixlen(version, prefixlen)
+        self._add_key(version, prefixlen, value)
+
+    def _add_prefixlen(self, version, prefixlen):
+        lengths = self._prefixes[version]
+        if prefixlen not in lengths:
+            lengths.append(prefixlen)
+            lengths.sort(reverse=True)
+
+    def __contains__(self, ip):
+        return self.contains_int(ip.version, ip.ip)
+
+    def contains_int(self, version, value):
+        """Check whether an address may be inside a network in the filter.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.
+
+        :Return:
+            Returns False if the address is definitely not covered by the
+            filter, True if it probably is.
+        """
+        for prefixlen in self._prefixes[version]:
+            if _net.bloom_contains(self._buf, self._offset, self.nbits,
+                                   self.nhashes, version, value, prefixlen):
+                return True
+        return False
+
+    def prefixlens(self, version):
+        """Return the prefix lengths that have been added for a version.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+
+        :Return:
+            Returns a list of prefix lengths from longest to shortest.
+        """
+        return list(self._prefixes[version])
+
+    def _prefix_entries(self):
+        return ([(4, p) for p in self.prefixlens(4)] +
+                [(6, p) for p in self.prefixlens(6)])
+
+    def _set_prefix_entries(self, prefixes):
+        for version, prefixlen in prefixes:
+            if version not in _WIDTH or prefixlen > _WIDTH[version]:
+                raise FilterFormatError('bad prefix entry')
+            self._add_prefixlen(version, prefixlen)
+
+class CuckooFilter(object):
+
+    """Cuckoo filter of exact IP addresses.
+
+    This supports the same operations as `BloomFilter`, and also supports
+    removing items with `remove`.  Only remove items that were actually
+    added, removing anything else may remove an unrelated item that shares
+    its fingerprint.
+
+    Each bucket holds 4 fingerprints.  The fingerprint size is chosen from
+    the error rate, and is 8, 16 or 32 bits.
+
+    :IVariables:
+        - `nbuckets`: The number of buckets in the table (a power of 2).
+        - `fingerprint_bits`: The size of each fingerprint in bits.
+        - `count`: The number of items in the filter.
+    """
+
+    BUCKET_SIZE = 4
+    MAX_KICKS = 500
+
+    _fingerprint_formats = {8: 'B', 16: 'H', 32: 'I'}
+
+    def __init__(self, capacity, error_rate=0.001):
+        """Create an empty filter.
+
+        :Parameters:
+            - `capacity`: The number of items the filter must be able to hold.
+            - `error_rate`: The desired false positive rate.
+        """
+        if capacity < 1:
+            raise ValueError(capacity)
+        if not 0 < error_rate < 1:
+            raise ValueError(error_rate)
+        bits = math.log(2.0 * self.BUCKET_SIZE / error_rate, 2)
+        for fingerprint_bits in (8, 16, 32):
+            if fingerprint_bits >= bits:
+                break
+        nbuckets = 1
+        while nbuckets * self.BUCKET_SIZE * 0.95 < capacity:
+            nbuckets <<= 1
+        entry = fingerprint_bits // 8
+        buf = bytearray(nbuckets * self.BUCKET_SIZE * entry)
+        self._init_table(buf, 0, nbuckets, fingerprint_bits, 0)
+
+    def _init_table(self, buf, offset, nbuckets, fingerprint_bits, count):
+        self._buf = buf
+        self._offset = offset
+        self.nbuckets = nbuckets
+        self.fingerprint_bits = fingerprint_bits
+        self.count = count
+        self._entry = struct.Struct(
+            '!' + self._fingerprint_formats[fingerprint_bits])
+        # Item displaced by a failed insert; kept so nothing is lost.
+        self._victim = None
+        self._kick = 0
+
+    @classmethod
+    def from_ips(cls, ips, error_rate=0.001, capacity=None):
+        """Create a filter holding a collection of IP addresses.
+
+        See `BloomFilter.from_ips`.
+        """
+        ips, capacity = _ips_and_count(ips, capacity)
+        result = cls(capacity, error_rate)
+        for ip in ips:
+            result.add(ip)
+        return result
+
+    def __len__(self):
+        return self.count
+
+    def _locate(self, version, value):
+        """Compute the fingerprint and the two candidate buckets for a key."""
+        return _net.cuckoo_locate(version, value, self.nbuckets,
+                                  self.fingerprint_bits)
+
+    def _alt_index(self, index, fingerprint):
+        return _net.cuckoo_alt_index(index, fingerprint, self.nbuckets)
+
+    def _slot_offset(self, index, slot):
+        return (self._offset +
+                (index * self.BUCKET_SIZE + slot) * self._entry.size)
+
+    def _get(self, index, slot):
+        return self._entry.unpack_from(self._buf,
+                                       self._slot_offset(index, slot))[0]
+
+    def _set(self, index, slot, fingerprint):
+        self._entry.pack_into(self._buf, self._slot_offset(index, slot),
+                              fingerprint)
+
+    def _insert_into(self, index, fingerprint):
+        for slot in xrange(self.BUCKET_SIZE):
+            if not self._get(index, slot):
+                self._set(index, slot, fingerprint)
+                return True
+        return False
+
+    def _find(self, index, fingerprint):
+        for slot in xrange(self.BUCKET_SIZE):
+            if self._get(index, slot) == fingerprint:
+                return slot
+        return -1
+
+    def add(self, ip):
+        """Add an IP address to the filter.
+
+        :Parameters:
+            - `ip`: The IP object to add.
+
+        :Exceptions:
+            - `FilterFullError`: The filter is too full to take the item.
+        """
+        self.add_int(ip.version, ip.ip)
+
+    def add_int(self, version, value):
+        """Add an IP address in integer form to the filter.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.
+
+        :Exceptions:
+            - `FilterFullError`: The filter is too full to take the item.
+        """
+        if not isinstance(self._buf, bytearray):
+            raise TypeError('mapped filters are read-only')
+        if self._victim is not None:
+            raise FilterFullError(self.nbuckets * self.BUCKET_SIZE)
+        fingerprint, index1, index2 = self._locate(version, value)
+        self.count += 1
+        if (self._insert_into(index1, fingerprint) or
+            self._insert_into(index2, fingerprint)):
+            return
+        index = index2
+        for unused in xrange(self.MAX_KICKS):
+            # Rotate through the slots so the walk is deterministic.
+            slot = self._kick % self.BUCKET_SIZE
+            self._kick += 1
+            evicted = self._get(index, slot)
+            self._set(index, slot, fingerprint)
+            fingerprint = evicted
+            index = self._alt_index(index, fingerprint)
+            if self._insert_into(index, fingerprint):
+                return
+        self._victim = (index, fingerprint)
+
+    def __contains__(self, ip):
+        return self.contains_int(ip.version, ip.ip)
+
+    def contains_int(self, version, value):
+        """Check whether an IP address in integer form may be in the filter.
+
+        See `BloomFilter.contains_int`.
+        """
+        if self._victim is not None:
+            fingerprint, index1, index2 = self._locate(version, value)
+            index, victim = self._victim
+            if victim == fingerprint and index in (index1, index2):
+                return True
+        return _net.cuckoo_contains(self._buf, self._offset, self.nbuckets,
+                                    self.fingerprint_bits, version, value)
+
+    def remove(self, ip):
+        """Remove an IP address from the filter.
+
+        :Parameters:
+            - `ip`: The IP object to remove.
+
+        :Return:
+            Returns True if a matching fingerprint was removed, False if the
+            address was not in the filter.
+        """
+        return self.remove_int(ip.version, ip.ip)
+
+    def remove_int(self, version, value):
+        """Remove an IP address in integer form from the filter.
+
+        See `remove`.
+        """
+        if not isinstance(self._buf, bytearray):
+            raise TypeError('mapped filters are read-only')
+        fingerprint, index1, index2 = self._locate(version, value)
+        for index in (index1, index2):
+            slot = self._find(index, fingerprint)
+            if slot != -1:
+                self._set(index, slot, 0)
+                self.count -= 1
+                self._reinsert_victim()
+                return True
+        if self._victim is not None:
+            index, victim = self._victim
+            if victim == fingerprint and index in (index1, index2):
+                self._victim = None
+                self.count -= 1
+                return True
+        return False
+
+    def _reinsert_victim(self):
+        if self._victim is not None:
+            index, fingerprint = self._victim
+            if (self._insert_into(index, fingerprint) or
+                self._insert_into(self._alt_index(index, fingerprint),
+                                  fingerprint)):
+                self._victim = None
+
+    def tostring(self):
+        """Serialize the filter.
+
+        :Return:
+            Returns a string that can be passed to `fromstring`.
+        """
+        if self._victim is not None:
+            raise FilterFullError(self.nbuckets * self.BUCKET_SIZE)
+        nbytes = self.nbuckets * self.BUCKET_SIZE * self._entry.size
+        return (_header.pack(_MAGIC, _FORMAT_VERSION, _KIND_CUCKOO,
+                             self.fingerprint_bits, 0, self.nbuckets,
+                             self.count) +
+                str(self._buf[self._offset:self._offset + nbytes]))
+
+    def dump(self, fileobj):
+        """Write the serialized filter to a file object."""
+        fileobj.write(self.tostring())
+
+    @classmethod
+    def fromstring(cls, data):
+        """Create a filter from the output of `tostring`.
+
+        See `BloomFilter.fromstring`.
+        """
+        return cls._from_buffer(bytearray(data), True)
+
+    @classmethod
+    def load(cls, fileobj):
+        """Read a filter written with `dump`."""
+        return cls.fromstring(fileobj.read())
+
+    @classmethod
+    def mmap(cls, fileobj):
+        """Map a filter written with `dump` into memory.
+
+        See `BloomFilter.mmap`.
+        """
+        return cls._from_buffer(_open_mmap(fileobj), False)
+
+    @classmethod
+    def _from_buffer(cls, buf, copy):
+        fingerprint_bits, prefixes, nbuckets, count, offset = _read_header(
+            buf, _KIND_CUCKOO)
+        if fingerprint_bits not in cls._fingerprint_formats:
+            raise FilterFormatError('bad fingerprint size')
+        if nbuckets < 1 or nbuckets & (nbuckets - 1):
+            raise FilterFormatError('bad bucket count')
+        nbytes = nbuckets * cls.BUCKET_SIZE * fingerprint_bits // 8
+        if prefixes or len(buf) != offset + nbytes:
+            raise FilterFormatError('bad table size')
+        result = cls.__new__(cls)
+        if copy:
+            buf = buf[offset:]
+            offset = 0
+        result._init_table(buf, offset, nbuckets, fingerprint_bits, count)
+        return result
@@ -0,0 +1,452 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/iplist.py#1 $
+
+"""Compressed sorted address list files.
+
+Introduction
+============
+This module reads and writes a compact file format for large sorted lists of
+IP addresses or networks, such as blocklists that are shipped to many hosts.
+A list holds addresses of one version only.
+
+The addresses are split into blocks.  Within a block each address is stored
+as a varint of its difference from the previous address, so dense lists take
+only one or two bytes per address.  For lists of networks, each prefix length
+follows its address as a zig-zag varint of its difference from the previous
+prefix length.  The encoding and decoding is done in C (see
+`aplib.net._net.encode_deltas`).
+
+A block index at the end of the file records the first address of every
+block and where the block starts.  This allows random access by position and
+binary search by address while only decoding one block.
+
+File layout
+===========
+All integers are in network byte order::
+
+    header:     magic 'APIL', format version (1 byte), address version
+                (1 byte), flags (1 byte), unused (1 byte), block size
+                (4 bytes)
+    blocks:     delta-encoded addresses, see `encode_deltas`.  The first
+                address of each block is encoded relative to itself (the
+                index holds its actual value), and the prefix length starts
+                from the full width of the address.
+    index:      for each block, its first address (4 or 16 bytes) and the
+                offset of its data from the start of the file (8 bytes)
+    trailer:    item count (8 bytes), block count (4 bytes), index offset
+                (8 bytes), magic 'APIL'
+
+Usage
+=====
+Write a list::
+
+    writer = IPListWriter(open(path, 'wb'), version=4, prefixes=True)
+    for prefix in sorted(prefixes):
+        writer.add_object(prefix)
+    writer.close()
+
+Read it back::
+
+    iplist = IPList.open(path)
+    table = iplist.to_lookup()
+    if IP('1.2.3.4') in table:
+        ...
+"""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import bisect
+import cStringIO
+import mmap
+import struct
+
+from aplib.net import _net
+from aplib.net.exceptions import IPListFormatError
+from aplib.net.lookup import RangeLookup
+from aplib.net.range import IPRange
+
+DEFAULT_BLOCK_SIZE = 1024
+
+_MAGIC = 'APIL'
+_FORMAT_VERSION = 1
+_FLAG_PREFIXES = 1
+
+_header = struct.Struct('!4sBBBxI')
+_trailer = struct.Struct('!QIQ4s')
+_index_offset = struct.Struct('!Q')
+_address = {4: struct.Struct('!I'), 6: struct.Struct('!QQ')}
+_U64 = 0xffffffffffffffff
+
+def _pack_address(version, value):
+    if version == 4:
+        return _address[4].pack(value)
+    return _address[6].pack(value >> 64, value & _U64)
+
+def _unpack_address(version, data, offset):
+    if version == 4:
+        return _address[4].unpack_from(data, offset)[0]
+    hi, lo = _address[6].unpack_from(data, offset)
+    return hi << 64 | lo
+
+class IPListWriter(object):
+
+    """Writer for the address list format.
+
+    Addresses must be added in ascending order.  For lists of networks,
+    networks with the same address may be added in any order of prefix
+    length.
+
+    :IVariables:
+        - `version`: The address version of the list.
+        - `prefixes`: Whether the list holds networks (with prefix lengths).
+        - `count`: The number of items written so far.
+    """
+
+    def __init__(self, fileobj, version, prefixes=False,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        """Start writing a list.
+
+        The file object does not need to be seekable.
+
+        :Parameters:
+            - `fileobj`: The file object to write to.
+            - `version`: The address version, 4 or 6.
+            - `prefixes`: Whether to store prefix lengths.
+            - `block_size`: The number of items per block.  Smaller blocks
+              make random access faster at the cost of a larger index.
+        """
+        if version not in (4, 6):
+            raise ValueError(version)
+        if block_size < 1:
+            raise ValueError(block_size)
+        self._fileobj = fileobj
+        self.version = version
+        self.prefixes = prefixes
+        self.block_size = block_size
+        self.count = 0
+        self._values = []
+        self._prefixlens = []
+        self._index = []
+        self._last = None
+        self._offset = 0
+        flags = 0
+        if prefixes:
+            flags |= _FLAG_PREFIXES
+        self._write(_header.pack(_MAGIC, _FORMAT_VERSION, version, flags,
+                                 block_size))
+
+    def _write(self, data):
+        self._fileobj.write(data)
+        self._offset += len(data)
+
+    def add(self, value, prefixlen=None):
+        """Add an item in integer form.
+
+        :Parameters:
+            - `value`: The address as an integer.
+            - `prefixlen`: The prefix length.  Required for lists of
+              networks, and must be omitted otherwise.
+        """
+        if (prefixlen is None) == self.prefixes:
+            raise ValueError(prefixlen)
+        if self._last is not None and value < self._last:
+            raise ValueError('values are not sorted')
+        self._last = value
+        self._values.append(value)
+        if self.prefixes:
+            self._prefixlens.append(prefixlen)
+        if len(self._values) == self.block_size:
+            self._flush_block()
+
+    def add_object(self, item):
+        """Add an IP or `Prefix` object.
+
+        :Parameters:
+            - `item`: An IP object or a `Prefix`.  For a list of networks,
+              an IP object is stored with its host bits.
+        """
+        if isinstance(item, IPRange):
+            address = item.first
+        else:
+            address = item
+        if address.version != self.version:
+            raise ValueError(item)
+        if self.prefixes:
+            self.add(address.ip, item.prefixlen)
+        else:
+            self.add(address.ip)
+
+    def _flush_block(self):
+        values = self._values
+        if not values:
+            return
+        if self.prefixes:
+            prefixlens = self._prefixlens
+        else:
+            prefixlens = None
+        data = _net.encode_deltas(self.version, values, values[0],
+                                  prefixlens)
+        self._index.append((values[0], self._offset))
+        self._write(data)
+        self.count += len(values)
+        self._values = []
+        self._prefixlens = []
+
+    def close(self):
+        """Finish writing the list.
+
+        This writes the index and trailer.  It does not close the file
+        object.
+        """
+        self._flush_block()
+        index_offset = self._offset
+        parts = []
+        for first, offset in self._index:
+            parts.append(_pack_address(self.version, first))
+            parts.append(_index_offset.pack(offset))
+        self._write(''.join(parts))
+        self._write(_trailer.pack(self.count, len(self._index), index_offset,
+                                  _MAGIC))
+
+def dumps(items, version, prefixes=False, block_size=DEFAULT_BLOCK_SIZE):
+    """Encode a sorted sequence of IP or `Prefix` objects.
+
+    :Parameters:
+        - `items`: The objects, in ascending order.
+        - `version`: The address version, 4 or 6.
+        - `prefixes`: Whether to store prefix lengths.
+        - `block_size`: The number of items per block.
+
+    :Return:
+        Returns the encoded list as a string.
+    """
+    out = cStringIO.StringIO()
+    writer = IPListWriter(out, version, prefixes, block_size)
+    for item in items:
+        writer.add_object(item)
+    writer.close()
+    return out.getvalue()
+
+class IPList(object):
+
+    """Reader for the address list format.
+
+    Items are integers for lists of addresses, and ``(address, prefixlen)``
+    tuples for lists of networks.
+
+    :IVariables:
+        - `version`: The address version of the list.
+        - `prefixes`: Whether the list holds networks.
+        - `block_size`: The number of items per block.
+    """
+
+    def __init__(self, data):
+        """Open a list.
+
+        :Parameters:
+            - `data`: The encoded list.  A string or any other object that
+              supports the buffer interface, such as an mmap.
+
+        :Exceptions:
+            - `IPListFormatError`: The data is not a valid list.
+        """
+        self._data = data
+        if len(data) < _header.size + _trailer.size:
+            raise IPListFormatError('truncated')
+        (magic, format_version, self.version, flags,
+         self.block_size) = _header.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise IPListFormatError('bad magic %r' % (magic,))
+        if format_version != _FORMAT_VERSION:
+            raise IPListFormatError('unsupported version %d' %
+                                    (format_version,))
+        if self.version not in (4, 6) or self.block_size < 1:
+            raise IPListFormatError('bad header')
+        self.prefixes = bool(flags & _FLAG_PREFIXES)
+        (self._count, nblocks, index_offset,
+         magic) = _trailer.unpack_from(data, len(data) - _trailer.size)
+        if magic != _MAGIC:
+            raise IPListFormatError('bad trailer')
+        entry_size = _address[self.version].size + _index_offset.size
+        if (index_offset + nblocks * entry_size != len(data) - _trailer.size or
+            nblocks != (self._count + self.block_size - 1) // self.block_size):
+            raise IPListFormatError('bad index')
+        self._firsts = []
+        self._offsets = []
+        offset = index_offset
+        for unused in xrange(nblocks):
+            self._firsts.append(_unpack_address(self.version, data, offset))
+            offset += _address[self.version].size
+            self._offsets.append(_index_offset.unpack_from(data, offset)[0])
+            offset += _index_offset.size
+        self._cached_block = None
+        self._cached_items = None
+
+    @classmethod
+    def open(cls, path):
+        """Map a list file into memory.
+
+        :Parameters:
+            - `path`: The path of the file.
+
+        :Return:
+            Returns a new `IPList`.
+        """
+        fileobj = open(path, 'rb')
+        try:
+            data = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            fileobj.close()
+        return cls(data)
+
+    def __len__(self):
+        return self._count
+
+    def _block_length(self, block):
+        if block == len(self._offsets) - 1:
+            return self._count - block * self.block_size
+        return self.block_size
+
+    def decode_block(self, block):
+        """Decode one block.
+
+        :Parameters:
+            - `block`: The block number.
+
+        :Return:
+            Returns a tuple ``(values, prefixlens)`` of lists.
+            ``prefixlens`` is None for lists of addresses.
+
+        :Exceptions:
+            - `IPListFormatError`: The block data is invalid.
+        """
+        try:
+            values, prefixlens, unused = _net.decode_deltas(
+                self._data, self.version, self._block_length(block),
+                self._firsts[block], self.prefixes, self._offsets[block])
+        except (ValueError, OverflowError):
+            raise IPListFormatError('bad block %d' % (block,))
+        return values, prefixlens
+
+    def iter_blocks(self):
+        """Decode the list one block at a time.
+
+        :Return:
+            Returns an iterator of ``(values, prefixlens)`` tuples.  See
+            `decode_block`.
+        """
+        for block in xrange(len(self._offsets)):
+            yield self.decode_block(block)
+
+    def _block_items(self, block):
+        if block != self._cached_block:
+            values, prefixlens = self.decode_block(block)
+            if prefixlens is not None:
+                values = zip(values, prefixlens)
+            self._cached_items = values
+            self._cached_block = block
+        return self._cached_items
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if index < 0 or index >= self._count:
+            raise IndexError(index)
+        block, position = divmod(index, self.block_size)
+        return self._block_items(block)[position]
+
+    def __iter__(self):
+        for values, prefixlens in self.iter_blocks():
+            if prefixlens is None:
+                for value in values:
+                    yield value
+            else:
+                for item in zip(values, prefixlens):
+                    yield item
+
+    def contains_int(self, value):
+        """Check whether an address is in a list of addresses.
+
+        This only decodes the one block that could hold the address.  For
+        lists of networks use `to_lookup`.
+
+        :Parameters:
+            - `value`: The address as an integer.
+
+        :Return:
+            Returns True if the address is in the list.
+        """
+        if self.prefixes:
+            raise TypeError('use to_lookup() for lists of networks')
+        block = bisect.bisect_right(self._firsts, value) - 1
+        if block < 0:
+            return False
+        values = self._block_items(block)
+        position = bisect.bisect_left(values, value)
+        return position < len(values) and values[position] == value
+
+    def __contains__(self, ip):
+        if ip.version != self.version:
+            return False
+        return self.contains_int(ip.ip)
+
+    def to_array(self):
+        """Decode all addresses.
+
+        :Return:
+            Returns the addresses as an ``array('I')`` for IPv4 lists or a
+            list of integers for IPv6 lists.  Prefix lengths are not
+            included.
+        """
+        if self.version == 4:
+            result = array.array('I')
+        else:
+            result = []
+        for values, unused in self.iter_blocks():
+            result.extend(values)
+        return result
+
+    def to_lookup(self, lookup=None):
+        """Decode the list into a `RangeLookup` table.
+
+        Each address (or network) is added to the table as it is decoded, no
+        IP objects are created.
+
+        :Parameters:
+            - `lookup`: An existing table to add to.  By default a new one is
+              created.
+
+        :Return:
+            Returns the `RangeLookup`.
+        """
+        if lookup is None:
+            lookup = RangeLookup()
+        version = self.version
+        for values, prefixlens in self.iter_blocks():
+            if prefixlens is None:
+                for value in values:
+                    lookup.add_range_int(version, value, value)
+            else:
+                for value, prefixlen in zip(values, prefixlens):
+                    lookup.add_prefix_int(version, value, prefixlen)
+        return lookup
@@ -0,0 +1,227 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# $Header: //prod/main/ap/aplib/aplib/net/loader.py#1 $
+
+"""Bulk loader for text lists of addresses.
+
+The `RangeLoader` object reads a text list of addresses, one per line, and
+yields each line as an integer range.  The lines may use any of these
+syntaxes, mixed freely:
+
+- IP addresses: ``1.2.3.4`` ``2001:db8::1``
+- Networks: ``1.2.3.0/24`` ``2001:db8::/32``.  Host bits are ignored, as with
+  `aplib.net.range.Prefix`.
+- Address ranges: ``1.2.3.4-1.2.3.9`` ``2001:db8::1-2001:db8::ff``
+- IPv4 globs as accepted by `aplib.net.range.IPGlob`: ``10.1-3.*``
+  ``1.2.3.0-10`` ``1.2.``
+
+Blank lines are skipped, and ``#`` starts a comment that runs to the end of
+the line.
+
+Lines that cannot be parsed do not stop the load.  They are recorded in the
+loader's ``errors`` list along with their line number.
+
+No IP or IPRange objects are created, so this is much faster than calling
+`aplib.net.ip.IP` or the range constructors for every line.
+
+Usage::
+
+    loader = RangeLoader()
+    table = RangeLookup()
+    for version, first, last in loader.load_file('allowlist.txt'):
+        table.add_range_int(version, first, last)
+    for lineno, line in loader.errors:
+        log('bad entry on line %i: %r' % (lineno, line))
+"""
+
+__version__ = '$Revision: #1 $'
+
+import struct
+
+from aplib.net import _net
+from aplib.net.exceptions import IPValidationError
+from aplib.net.range import IPGlob
+
+_IPV4_FULL = 0xffffffffL
+_IPV6_FULL = (1L << 128) - 1
+
+def _unpack6(packed):
+    hi, lo = struct.unpack('!2Q', packed)
+    return hi << 64 | lo
+
+def parse_line(line):
+    """Parse a single entry.
+
+    :Parameters:
+        - `line`: The entry, without a comment or surrounding whitespace.
+
+    :Return:
+        Returns a tuple ``(version, first, last)`` of integers.
+
+    :Exceptions:
+        - `IPValidationError`: The entry is not valid.
+    """
+    if ':' in line:
+        if '-' in line:
+            start, end = line.split('-', 1)
+            first = _net.parse_ipv6(start.strip())
+            last = _net.parse_ipv6(end.strip())
+            if first is None or last is None:
+                raise IPValidationError(line)
+            first = _unpack6(first)
+            last = _unpack6(last)
+        else:
+            result = _net.parse_ipv6_prefix(line)
+            if result is None:
+                raise IPValidationError(line)
+            hostmask = _IPV6_FULL >> result[1]
+            first = _unpack6(result[0]) & ~hostmask
+            last = first | hostmask
+        version = 6
+    else:
+        result = None
+        if '/' in line:
+            result = _net.parse_cidr4(line)
+            if result is None:
+                raise IPValidationError(line)
+        elif '-' in line:
+            # Either a full range or a glob with a dash in one octet.
+            start, end = line.split('-', 1)
+            first = _net.parse_ipv4(start.strip())
+            last = _net.parse_ipv4(end.strip())
+            if first is None or last is None:
+                first, last = IPGlob._parse_int(line)
+        else:
+            first = _net.parse_ipv4(line)
+            if first is None:
+                first, last = IPGlob._parse_int(line)
+            else:
+                last = first
+        if result is not None:
+            hostmask = _IPV4_FULL >> result[1]
+            first = result[0] & ~hostmask
+            last = first | hostmask
+        version = 4
+    if last < first:
+        raise IPValidationError(line)
+    return version, first, last
+
+class RangeLoader(object):
+
+    """Loader for text lists of addresses.
+
+    A loader may be used for several loads.  Errors accumulate across loads
+    until ``errors`` is cleared.
+
+    :IVariables:
+        - `chunk_size`: The number of bytes read at a time.
+        - `errors`: A list of ``(line_number, line)`` tuples for the lines
+          that could not be parsed.  Line numbers start at 1.  ``line`` has
+          the comment and surrounding whitespace removed.
+        - `count`: The number of ranges yielded.
+    """
+
+    def __init__(self, chunk_size=65536):
+        """Create a loader.
+
+        :Parameters:
+            - `chunk_size`: The number of bytes to read at a time.
+        """
+        self.chunk_size = chunk_size
+        self.errors = []
+        self.count = 0
+
+    def load(self, source):
+        """Load ranges from a file.
+
+        :Parameters:
+            - `source`: A file object, mmap, or any other object with a
+              ``read(size)`` method returning strings.
+
+        :Return:
+            Returns a generator of ``(version, first, last)`` tuples, one for
+            every valid entry, in the order they appear.
+        """
+        chunk_size = self.chunk_size
+        lineno = 0
+        partial = ''
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            lines = chunk.split('\n')
+            lines[0] = partial + lines[0]
+            partial = lines.pop()
+            for result in self._parse_lines(lines, lineno):
+                yield result
+            lineno += len(lines)
+        if partial:
+            for result in self._parse_lines([partial], lineno):
+                yield result
+
+    def load_lines(self, lines):
+        """Load ranges from an iterable of lines.
+
+        :Parameters:
+            - `lines`: An iterable of strings, one entry per string.
+
+        :Return:
+            Returns a generator of ``(version, first, last)`` tuples.  See
+            `load`.
+        """
+        for lineno, line in enumerate(lines):
+            for result in self._parse_lines((line,), lineno):
+                yield result
+
+    def load_file(self, path):
+        """Load ranges from the named file.
+
+        :Parameters:
+            - `path`: The path of the file to read.
+
+        :Return:
+            Returns a generator of ``(version, first, last)`` tuples.  See
+            `load`.
+        """
+        f = open(path, 'rb')
+        try:
+            for result in self.load(f):
+                yield result
+        finally:
+            f.close()
+
+    def _parse_lines(self, lines, lineno):
+        """Parse a list of lines, the first being number ``lineno + 1``."""
+        for line in lines:
+            lineno += 1
+            if '#' in line:
+                line = line[:line.index('#')]
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                result = parse_line(line)
+            except IPValidationError:
+                self.errors.append((lineno, line))
+                continue
+            self.count += 1
+            yield result
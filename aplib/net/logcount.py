@@ -0,0 +1,424 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/logcount.py#1 $
+
+"""Parallel per-prefix address counting over large log files.
+
+Introduction
+============
+`count_files` finds every IP address in a set of text files and counts, for
+each network of the requested prefix lengths, how many times an address in
+it occurred and how many distinct addresses were seen.
+
+The work is split the map/reduce way:
+
+- The files are divided into chunks on line boundaries (`split_file`).
+- A process pool scans the chunks.  Each worker maps its chunk, extracts
+  and counts the addresses in C, and writes the distinct addresses and
+  their counts to a shard file.  Nothing but the file names passes between
+  the processes, so no per-address objects are pickled.
+- The parent merges the shards (`merge_shards`).  The shards are sorted, so
+  they are merged as streams: each shard is mapped into memory and decoded a
+  block at a time.
+
+Shard format
+============
+A shard holds one section per address version.  A section is a header
+(magic ``'APSH'``, address version (1 byte), 3 unused bytes, address count
+(8 bytes) and list length (8 bytes), in network byte order), the counts as
+native 32-bit integers, and the distinct addresses as an `aplib.net.iplist`
+list.  Shards are temporary files read on the machine that wrote them.
+
+Usage
+=====
+::
+
+    counts = count_files(['/var/log/maillog'], {4: (16, 24), 6: (48,)})
+    for prefix, hits, addresses in counts.top(4, 24, 10):
+        print prefix, hits, addresses
+"""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import heapq
+import itertools
+import mmap
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+
+from aplib.net import _net
+from aplib.net.iplist import IPList, IPListWriter
+from aplib.net.mask import Mask4, Mask6
+
+DEFAULT_CHUNK_SIZE = 64 << 20
+
+DEFAULT_PREFIXLENS = {4: (24,), 6: (48,)}
+
+_MASK = {4: Mask4, 6: Mask6}
+
+_SHARD_MAGIC = 'APSH'
+_shard_header = struct.Struct('!4sB3xQQ')
+
+def split_file(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Divide a file into chunks that start and end on line boundaries.
+
+    :Parameters:
+        - `path`: The path of the file.
+        - `chunk_size`: The approximate size of each chunk in bytes.  A chunk
+          is extended to the end of the line it would otherwise split.
+
+    :Return:
+        Returns a list of ``(start, end)`` offsets covering the whole file.
+        An empty file has no chunks.
+    """
+    if chunk_size < 1:
+        raise ValueError(chunk_size)
+    size = os.path.getsize(path)
+    result = []
+    fileobj = open(path, 'rb')
+    try:
+        start = 0
+        while start < size:
+            end = start + chunk_size
+            if end >= size:
+                end = size
+            else:
+                fileobj.seek(end - 1)
+                fileobj.readline()
+                end = fileobj.tell()
+            result.append((start, end))
+            start = end
+    finally:
+        fileobj.close()
+    return result
+
+def _write_section(fileobj, version, addresses, counts):
+    header_offset = fileobj.tell()
+    fileobj.write(_shard_header.pack(_SHARD_MAGIC, version, len(addresses),
+                                     0))
+    fileobj.write(counts.tostring())
+    list_start = fileobj.tell()
+    writer = IPListWriter(fileobj, version)
+    for value in addresses:
+        writer.add(value)
+    writer.close()
+    end = fileobj.tell()
+    # Now that the length of the list is known, fill it in.
+    fileobj.seek(header_offset)
+    fileobj.write(_shard_header.pack(_SHARD_MAGIC, version, len(addresses),
+                                     end - list_start))
+    fileobj.seek(end)
+
+def count_chunk(path, start, end, shard_path, versions=(4, 6)):
+    """Count the addresses in part of a file and write them to a shard.
+
+    This is the work done by each process of `count_files`.
+
+    :Parameters:
+        - `path`: The path of the file to scan.
+        - `start`: The offset to start scanning at.
+        - `end`: The offset to stop scanning at.
+        - `shard_path`: The path of the shard file to write.
+        - `versions`: The address versions to look for.
+
+    :Return:
+        Returns the number of addresses found.
+    """
+    fileobj = open(path, 'rb')
+    try:
+        data = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        fileobj.close()
+    found = 0
+    try:
+        out = open(shard_path, 'wb')
+        try:
+            for version in versions:
+                if version == 4:
+                    addresses, counts = _net.count_ipv4_buffer(
+                        _net.extract_ipv4(data, start, end))
+                else:
+                    addresses, counts = _net.count_ipv6_buffer(
+                        _net.extract_ipv6(data, start, end))
+                _write_section(out, version, addresses, counts)
+                found += sum(counts)
+        finally:
+            out.close()
+    finally:
+        data.close()
+    return found
+
+def _count_task(task):
+    return count_chunk(*task)
+
+def read_shard(path, version):
+    """Read one address version from a shard.
+
+    The shard is mapped into memory and decoded one block of the address
+    list at a time as the iterator is consumed, so only a block's worth of
+    addresses and counts is held at once.
+
+    :Parameters:
+        - `path`: The path of the shard file.
+        - `version`: The address version, 4 or 6.
+
+    :Return:
+        Returns an iterator of ``(address, count)`` tuples in ascending order
+        of address.  Nothing is returned if the shard has no section for the
+        version.
+
+    :Exceptions:
+        - `ValueError`: The file is not a valid shard.  This is raised by
+          the iterator.
+    """
+    fileobj = open(path, 'rb')
+    try:
+        if not os.fstat(fileobj.fileno()).st_size:
+            return
+        data = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        fileobj.close()
+    try:
+        offset = 0
+        while offset < len(data):
+            if len(data) - offset < _shard_header.size:
+                raise ValueError('truncated shard')
+            (magic, section_version, count,
+             list_length) = _shard_header.unpack_from(data, offset)
+            if magic != _SHARD_MAGIC:
+                raise ValueError('bad shard magic %r' % (magic,))
+            offset += _shard_header.size
+            list_start = offset + count * 4
+            if list_start + list_length > len(data):
+                raise ValueError('truncated shard')
+            if section_version == version:
+                addresses = IPList(buffer(data, list_start, list_length))
+                if len(addresses) != count:
+                    raise ValueError('truncated shard')
+                for values, unused in addresses.iter_blocks():
+                    counts = array.array('I')
+                    end = offset + len(values) * 4
+                    counts.fromstring(data[offset:end])
+                    offset = end
+                    for item in itertools.izip(values, counts):
+                        yield item
+                return
+            offset = list_start + list_length
+    finally:
+        data.close()
+
+class PrefixCounts(object):
+
+    """Per-network address counts.
+
+    :IVariables:
+        - `records`: Dictionary of address version to the total number of
+          addresses found.
+        - `addresses`: Dictionary of address version to the number of
+          distinct addresses found.
+    """
+
+    def __init__(self):
+        self.records = {4: 0, 6: 0}
+        self.addresses = {4: 0, 6: 0}
+        # (version, prefixlen) -> {network: [count, distinct]}
+        self._tables = {}
+
+    def table(self, version, prefixlen):
+        """Get the counts for one prefix length in integer form.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `prefixlen`: The prefix length.
+
+        :Return:
+            Returns a dictionary of network address (an integer) to a
+            ``[count, distinct]`` list.
+
+        :Exceptions:
+            - `KeyError`: The prefix length was not counted.
+        """
+        return self._tables[(version, prefixlen)]
+
+    def prefixlens(self, version):
+        """Get the prefix lengths that were counted.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+
+        :Return:
+            Returns a sorted list of prefix lengths.
+        """
+        return sorted(prefixlen for table_version, prefixlen in self._tables
+                      if table_version == version)
+
+    def get(self, prefix):
+        """Get the counts for a network.
+
+        :Parameters:
+            - `prefix`: A `aplib.net.range.Prefix` of one of the counted
+              prefix lengths.
+
+        :Return:
+            Returns a tuple ``(count, distinct)``.
+        """
+        table = self.table(prefix.first.version, prefix.prefixlen)
+        count, distinct = table.get(prefix.first.ip, (0, 0))
+        return count, distinct
+
+    def _items(self, version, prefixlen, entries):
+        mask = _MASK[version].prefixlen_to_mask(prefixlen)
+        if version == 4:
+            cls = aplib.net.ip.IPv4
+        else:
+            cls = aplib.net.ip.IPv6
+        for network, (count, distinct) in entries:
+            yield (aplib.net.range.Prefix(cls(network, mask)), count,
+                   distinct)
+
+    def items(self, version, prefixlen):
+        """Get the counts for one prefix length.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `prefixlen`: The prefix length.
+
+        :Return:
+            Returns a list of ``(prefix, count, distinct)`` tuples sorted by
+            network.  ``prefix`` is a `aplib.net.range.Prefix`.
+        """
+        entries = sorted(self.table(version, prefixlen).iteritems())
+        return list(self._items(version, prefixlen, entries))
+
+    def top(self, version, prefixlen, n=10, distinct=False):
+        """Get the busiest networks of one prefix length.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `prefixlen`: The prefix length.
+            - `n`: The number of networks to return.
+            - `distinct`: If true, rank by the number of distinct addresses
+              instead of the number of occurrences.
+
+        :Return:
+            Returns a list of ``(prefix, count, distinct)`` tuples, largest
+            first.  See `items`.
+        """
+        field = int(bool(distinct))
+        entries = heapq.nlargest(
+            n, self.table(version, prefixlen).iteritems(),
+            key=lambda item: (item[1][field], -item[0]))
+        return list(self._items(version, prefixlen, entries))
+
+def merge_shards(paths, prefixlens=DEFAULT_PREFIXLENS):
+    """Merge shards into per-network counts.
+
+    :Parameters:
+        - `paths`: The paths of the shard files.
+        - `prefixlens`: Dictionary of address version to a sequence of the
+          prefix lengths to count.
+
+    :Return:
+        Returns a `PrefixCounts` object.
+    """
+    result = PrefixCounts()
+    for version, lengths in prefixlens.iteritems():
+        tables = []
+        masks = []
+        for prefixlen in lengths:
+            table = result._tables.setdefault((version, prefixlen), {})
+            tables.append(table)
+            masks.append(_MASK[version].prefixlen_to_mask(prefixlen))
+        levels = zip(tables, masks)
+        streams = [read_shard(path, version) for path in paths]
+        records = addresses = 0
+        previous = None
+        for value, count in heapq.merge(*streams):
+            records += count
+            new = value != previous
+            if new:
+                addresses += 1
+                previous = value
+            for table, mask in levels:
+                network = value & mask
+                entry = table.get(network)
+                if entry is None:
+                    table[network] = [count, 1]
+                else:
+                    entry[0] += count
+                    entry[1] += new
+        result.records[version] = records
+        result.addresses[version] = addresses
+    return result
+
+def count_files(paths, prefixlens=DEFAULT_PREFIXLENS, processes=None,
+                chunk_size=DEFAULT_CHUNK_SIZE, workdir=None, pool=None):
+    """Count the addresses in text files per network.
+
+    :Parameters:
+        - `paths`: The paths of the files to scan.
+        - `prefixlens`: Dictionary of address version to a sequence of the
+          prefix lengths to count.  Versions not in the dictionary are not
+          scanned for.
+        - `processes`: The number of worker processes.  Defaults to the
+          number of CPUs.
+        - `chunk_size`: The approximate number of bytes each worker scans
+          at a time.
+        - `workdir`: The directory to create the temporary shard directory
+          in.  Defaults to the system temporary directory.
+        - `pool`: An object with an ``imap_unordered(function, iterable)``
+          method, such as a ``multiprocessing.Pool``.  By default a pool of
+          `processes` processes is created for the call.
+
+    :Return:
+        Returns a `PrefixCounts` object.
+    """
+    versions = tuple(sorted(prefixlens))
+    shard_dir = tempfile.mkdtemp(prefix='logcount.', dir=workdir)
+    try:
+        tasks = []
+        for path in paths:
+            for start, end in split_file(path, chunk_size):
+                shard_path = os.path.join(shard_dir, '%i.shard' % (len(tasks),))
+                tasks.append((path, start, end, shard_path, versions))
+        if pool is None:
+            pool = multiprocessing.Pool(processes)
+            try:
+                for unused in pool.imap_unordered(_count_task, tasks):
+                    pass
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for unused in pool.imap_unordered(_count_task, tasks):
+                pass
+        return merge_shards([task[3] for task in tasks], prefixlens)
+    finally:
+        shutil.rmtree(shard_dir)
+
+# Putting this at the bottom is a bit of a hack to work around cyclical
+# import issues.
+import aplib.net.ip
+import aplib.net.range
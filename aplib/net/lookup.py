@@ -0,0 +1,190 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/lookup.py#1 $
+
+"""Address range lookup table.
+
+The `RangeLookup` object holds a set of IP address ranges (networks, ranges,
+or single addresses) and answers whether an address falls within any of them.
+The ranges are kept as sorted, non-overlapping ``(first, last)`` integer
+pairs per address version, so a lookup is a single binary search no matter
+how many ranges were added or how they nest.
+
+Usage::
+
+    >>> table = RangeLookup([Prefix('10.0.0.0/8'), IP('192.168.1.1')])
+    >>> IP('10.1.2.3') in table
+    True
+    >>> table.contains_int(4, 0xc0a80102)
+    False
+"""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import bisect
+
+from aplib.net import _net
+from aplib.net.mask import Mask4, Mask6
+from aplib.net.range import IPRange
+
+_MASK = {4: Mask4, 6: Mask6}
+
+def _new_bounds(version):
+    # IPv4 bounds fit in a compact C array, IPv6 ones need Python longs.
+    if version == 4:
+        return array.array('I')
+    return []
+
+class RangeLookup(object):
+
+    """A set of address ranges with fast membership tests.
+
+    Ranges may be added at any time.  Newly added ranges are merged into the
+    table on the next lookup.
+    """
+
+    def __init__(self, items=()):
+        """Create a lookup table.
+
+        :Parameters:
+            - `items`: An optional iterable of items to add.  See `add`.
+        """
+        self._starts = {4: _new_bounds(4), 6: _new_bounds(6)}
+        self._ends = {4: _new_bounds(4), 6: _new_bounds(6)}
+        self._pending = {4: [], 6: []}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        """Add a range to the table.
+
+        :Parameters:
+            - `item`: An `IPRange` (including `Prefix` and `IPGlob`) or an IP
+              object.  For an IP object the whole network it belongs to is
+              added, so ``IP('1.2.3.4/24')`` adds ``1.2.3.0-1.2.3.255``.
+        """
+        if isinstance(item, IPRange):
+            self.add_range_int(item.first.version, item.first.ip,
+                               item.last.ip)
+        else:
+            self.add_prefix_int(item.version, item.ip, item.prefixlen)
+
+    def add_range_int(self, version, first, last):
+        """Add a range in integer form to the table.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `first`: The first address of the range.
+            - `last`: The last address of the range.
+        """
+        if last < first:
+            raise ValueError((first, last))
+        self._pending[version].append((first, last))
+
+    def add_prefix_int(self, version, value, prefixlen):
+        """Add a network in integer form to the table.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: An address in the network.
+            - `prefixlen`: The prefix length of the network.
+        """
+        mask = _MASK[version]
+        netmask = mask.prefixlen_to_mask(prefixlen)
+        first = value & netmask
+        self._pending[version].append(
+            (first, first | (netmask ^ mask.FULL_MASK)))
+
+    def _merge(self, version):
+        """Merge pending ranges into the sorted table."""
+        ranges = self._pending[version]
+        ranges.extend(zip(self._starts[version], self._ends[version]))
+        ranges.sort()
+        starts = _new_bounds(version)
+        ends = _new_bounds(version)
+        for first, last in ranges:
+            # Merge overlapping and adjacent ranges.
+            if ends and first <= ends[-1] + 1:
+                if last > ends[-1]:
+                    ends[-1] = last
+            else:
+                starts.append(first)
+                ends.append(last)
+        self._starts[version] = starts
+        self._ends[version] = ends
+        self._pending[version] = []
+
+    def __contains__(self, ip):
+        return self.contains_int(ip.version, ip.ip)
+
+    def contains_int(self, version, value):
+        """Check whether an address in integer form is in the table.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.
+
+        :Return:
+            Returns True if the address is inside one of the ranges.
+        """
+        if self._pending[version]:
+            self._merge(version)
+        starts = self._starts[version]
+        index = bisect.bisect_right(starts, value) - 1
+        return index >= 0 and value <= self._ends[version][index]
+
+    def contains_ipv4_array(self, addresses):
+        """Check many IPv4 addresses.
+
+        The lookups run in C without the GIL, so large arrays can be split
+        across threads.
+
+        :Parameters:
+            - `addresses`: A buffer of addresses as native uint32 values, such
+              as an ``array.array('I')`` or a NumPy ``uint32`` array.
+
+        :Return:
+            Returns an ``array.array('B')`` with 1 for every address in the
+            table and 0 otherwise.
+        """
+        if self._pending[4]:
+            self._merge(4)
+        return _net.contains_ipv4_buffer(addresses, self._starts[4],
+                                         self._ends[4])
+
+    def ranges(self, version):
+        """Get the ranges in the table.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+
+        :Return:
+            Returns a sorted list of ``(first, last)`` integer tuples.
+            Overlapping and adjacent ranges have been merged.
+        """
+        if self._pending[version]:
+            self._merge(version)
+        return zip(self._starts[version], self._ends[version])
+
+    def __len__(self):
+        """The number of disjoint ranges in the table."""
+        return len(self.ranges(4)) + len(self.ranges(6))
@@ -166,6 +166,10 @@ class Mask(object):
     def __hash__(self):
         return hash(self.mask)
 
+    def __reduce__(self):
+        return (aplib.net.codec.decode_mask,
+                (aplib.net.codec.encode_mask(self), self.__class__))
+
     # XXX: This doesn't feel like a good idea.  There should be higher-level
     # functions that obviate the need for these.  Think about this.
     #def __lshift__(self, numbits):
@@ -377,3 +381,6 @@ class Mask6(Mask):
         prefixlen, mask_int = cls._parse_prefixlen(mask)
         return prefixlen, mask_int, MASK_FORMAT.PREFIX
 
+# Putting this at the bottom is a bit of a hack to work around cyclical
+# import issues.
+import aplib.net.codec
@@ -0,0 +1,121 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/permute.py#1 $
+
+"""Keyed pseudo-random permutations of large index ranges.
+
+`Permutation` maps every index in ``range(size)`` to a distinct index in the
+same range, in an order determined by a seed, without building a list.  It
+is used by `aplib.net.range.IPRange.shuffled` and
+`aplib.net.range.IPRange.sample` to visit the addresses of a range in a
+shuffled but reproducible order::
+
+    >>> perm = Permutation(10, seed=42)
+    >>> sorted(perm) == range(10)
+    True
+    >>> perm[3] == list(perm)[3]
+    True
+
+The permutation is a balanced Feistel network over the smallest power of
+four that holds `size`, with "cycle walking" to stay inside the range: an
+output that is too large is permuted again until it falls inside.  Since the
+power of four is less than four times `size`, this takes fewer than four
+passes on average.  It is not suitable for cryptographic use.
+"""
+
+__version__ = '$Revision: #1 $'
+
+_U64 = (1 << 64) - 1
+
+def _mix64(value):
+    """The SplitMix64 finalizer."""
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & _U64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & _U64
+    return value ^ (value >> 31)
+
+class Permutation(object):
+
+    """A keyed permutation of ``range(size)``.
+
+    :IVariables:
+        - `size`: The number of indexes.
+        - `seed`: The seed the permutation was created with.
+    """
+
+    def __init__(self, size, seed=0, rounds=6):
+        """Create a permutation.
+
+        :Parameters:
+            - `size`: The number of indexes.  May be larger than 2**64.
+            - `seed`: An integer selecting the permutation.
+            - `rounds`: The number of Feistel rounds.
+        """
+        if size < 1:
+            raise ValueError(size)
+        self.size = size
+        self.seed = seed
+        # Each half holds at least one bit so that tiny ranges still shuffle.
+        self._half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self._half_mask = (1 << self._half_bits) - 1
+        seed = _mix64(seed & _U64 ^ (seed >> 64) & _U64)
+        self._keys = [_mix64(seed + (i + 1) * 0x9e3779b97f4a7c15 & _U64)
+                      for i in xrange(rounds)]
+
+    def _round(self, value, key):
+        result = 0
+        shift = 0
+        # A half can be wider than 64 bits for ranges over 2**128.
+        while shift < self._half_bits:
+            result |= _mix64((value >> shift ^ key) & _U64) << shift
+            shift += 64
+        return result & self._half_mask
+
+    def _encrypt(self, index):
+        bits = self._half_bits
+        mask = self._half_mask
+        left = index >> bits
+        right = index & mask
+        for key in self._keys:
+            left, right = right, left ^ self._round(right, key)
+        return left << bits | right
+
+    def __getitem__(self, index):
+        """Get the index that `index` is mapped to.
+
+        :Parameters:
+            - `index`: An integer from 0 to ``size - 1``.
+
+        :Return:
+            Returns an integer from 0 to ``size - 1``.
+        """
+        if index < 0 or index >= self.size:
+            raise IndexError(index)
+        index = self._encrypt(index)
+        while index >= self.size:
+            index = self._encrypt(index)
+        return index
+
+    def __iter__(self):
+        """Visit every index once, in permuted order."""
+        index = 0
+        while index < self.size:
+            yield self[index]
+            index += 1
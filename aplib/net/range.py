@@ -43,7 +43,10 @@ Future
 
 __version__ = '$Revision: #2 $'
 
+import itertools
+
 from aplib.net.exceptions import IPValidationError
+from aplib.net.permute import Permutation
 
 def _slice_indices(slice, length):
     """Compute slice indices.
@@ -240,6 +243,52 @@ class IPRange(object):
             yield self.first.__class__(index)
             index += step
 
+    def shuffled(self, seed=0, ints=False):
+        """Return an iterator to visit IP addresses in a shuffled order.
+
+        The order is a pseudo-random permutation of the range selected by
+        `seed`, so the same seed always gives the same order.  No list of
+        addresses is built, so this works for ranges of any size.  See
+        `aplib.net.permute.Permutation`.
+
+        :Parameters:
+            - `seed`: An integer selecting the order.
+            - `ints`: If true, return the addresses as integers instead of IP
+              objects.
+
+        :Return:
+            Returns an iterator that visits every address in the range once.
+        """
+        first = int(self.first)
+        cls = self.first.__class__
+        for index in Permutation(self.size(), seed):
+            if ints:
+                yield first + index
+            else:
+                yield cls(first + index)
+
+    def sample(self, n, seed=0, ints=False):
+        """Pick distinct random addresses from the range.
+
+        This is the first `n` addresses of `shuffled`, so a larger sample
+        with the same seed starts with a smaller one.
+
+        :Parameters:
+            - `n`: The number of addresses.
+            - `seed`: An integer selecting the sample.
+            - `ints`: If true, return the addresses as integers instead of IP
+              objects.
+
+        :Return:
+            Returns a list of `n` addresses.
+
+        :Exceptions:
+            - `ValueError`: `n` is larger than the range.
+        """
+        if n < 0 or n > self.size():
+            raise ValueError(n)
+        return list(itertools.islice(self.shuffled(seed, ints), n))
+
     def __contains__(self, other):
         return self.first <= other <= self.last
 
@@ -268,6 +317,10 @@ class IPRange(object):
     def __hash__(self):
         return hash((self.first, self.last))
 
+    def __reduce__(self):
+        return (aplib.net.codec.decode_range,
+                (aplib.net.codec.encode_range(self), self.__class__))
+
     def __str__(self):
         return '%s-%s' % (self.first, self.last)
 
@@ -354,6 +407,10 @@ class Prefix(IPRange):
         last = address.broadcast
         super(Prefix, self).__init__(first, last)
 
+    def __reduce__(self):
+        return (aplib.net.codec.decode_range,
+                (aplib.net.codec.encode_range(self), self.__class__))
+
     def __str__(self):
         return '%s/%i' % (self.first, self.prefixlen)
 
@@ -397,6 +454,16 @@ class IPGlob(IPRange):
 
     @staticmethod
     def _parse(address):
+        first, last = IPGlob._parse_int(address)
+        IPv4 = aplib.net.ip.IPv4
+        return IPv4(first), IPv4(last)
+
+    @staticmethod
+    def _parse_int(address):
+        """Parse a glob into a ``(first, last)`` tuple of integers.
+
+        No check is made that ``first`` is not greater than ``last``.
+        """
         parts = address.split('.')
         if len(parts) > 4:
             raise IPValidationError(address)
@@ -407,8 +474,8 @@ class IPGlob(IPRange):
         if len(parts) < 4:
             parts.extend(['*']*(4-len(parts)))
 
-        first = []
-        last = []
+        first = 0
+        last = 0
         stars_only = False
 
         def int_part(x):
@@ -418,29 +485,30 @@ class IPGlob(IPRange):
                 raise IPValidationError(address)
             if x < 0 or x > 255:
                 raise IPValidationError(address)
-            return str(x)
+            return x
 
         for part in parts:
+            first <<= 8
+            last <<= 8
             if part == '*':
-                first.append('0')
-                last.append('255')
+                last |= 255
                 stars_only = True
             elif stars_only:
                 raise IPValidationError(address)
             elif '-' in part:
                 x, y = part.split('-', 1)
-                first.append(int_part(x))
-                last.append(int_part(y))
+                first |= int_part(x)
+                last |= int_part(y)
                 stars_only = True
             else:
                 x = int_part(part)
-                first.append(part)
-                last.append(part)
+                first |= x
+                last |= x
 
-        IPv4 = aplib.net.ip.IPv4
-        return IPv4('.'.join(first)), IPv4('.'.join(last))
+        return first, last
 
 
 # Putting this at the bottom is a bit of a hack to work around cyclical
 # import issues.
+import aplib.net.codec
 import aplib.net.ip
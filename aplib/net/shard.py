@@ -0,0 +1,317 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/shard.py#1 $
+
+"""Consistent sharding of per-address state by network.
+
+Introduction
+============
+When per-address state (rate limits, reputation caches) is split across
+processes or hosts, hashing each address on its own scatters the addresses
+of one network across all the shards, so no shard sees the network as a
+whole.  The sharders in this module hash the enclosing network instead, with
+a configurable prefix length per address version, so every address of a
+``/24`` (or an IPv6 ``/48``) lands on the same shard.
+
+Two consistent hashing schemes are provided, so that changing the number of
+shards moves as little state as possible:
+
+- `JumpSharder` uses jump consistent hashing over numbered shards.  Growing
+  from n to n + 1 shards moves 1/(n + 1) of the networks, all to the new
+  shard.  It is best when shards are numbered and only added or removed at
+  the end.
+- `RendezvousSharder` uses rendezvous (highest random weight) hashing over
+  named nodes.  Removing a node only moves the networks that were on it,
+  wherever it is in the list.
+
+Both hash in C, and have a bulk form (`PrefixSharder.shard_ints`) that maps a
+whole array of IPv4 addresses without the GIL.
+
+Usage
+=====
+::
+
+    sharder = JumpSharder(16, prefixlen4=24, prefixlen6=48)
+    worker = workers[sharder.shard(IP('192.0.2.77'))]
+
+    sharder = RendezvousSharder(['cache1', 'cache2', 'cache3'])
+    host = sharder.node(IP('2001:db8:1:2::1'))
+"""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import hashlib
+import struct
+
+from aplib.net import _net
+from aplib.net.mask import Mask4, Mask6
+
+_MASK = {4: Mask4, 6: Mask6}
+
+class PrefixSharder(object):
+
+    """Base class for mapping addresses to shards by their network.
+
+    Subclasses implement `_pick` and `_pick_ipv4_buffer`.
+
+    :IVariables:
+        - `prefixlen4`: The prefix length of the IPv4 networks to shard by.
+        - `prefixlen6`: The prefix length of the IPv6 networks to shard by.
+        - `seed`: A 64-bit integer mixed into every key.  Sharders with
+          different seeds distribute networks independently.
+    """
+
+    def __init__(self, prefixlen4=24, prefixlen6=48, seed=0):
+        """Initialize the sharder.
+
+        :Parameters:
+            - `prefixlen4`: The prefix length of the IPv4 networks to shard
+              by.  32 shards each address on its own.
+            - `prefixlen6`: The prefix length of the IPv6 networks to shard
+              by.
+            - `seed`: A 64-bit integer mixed into every key.
+        """
+        if prefixlen4 < 0 or prefixlen4 > Mask4.WIDTH:
+            raise ValueError(prefixlen4)
+        if prefixlen6 < 0 or prefixlen6 > Mask6.WIDTH:
+            raise ValueError(prefixlen6)
+        self.prefixlen4 = prefixlen4
+        self.prefixlen6 = prefixlen6
+        self.seed = seed
+
+    def prefixlen(self, version):
+        """Get the prefix length used for an address version.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+
+        :Return:
+            Returns the prefix length.
+        """
+        if version == 4:
+            return self.prefixlen4
+        return self.prefixlen6
+
+    def key_prefix(self, ip):
+        """Get the network whose addresses share a shard with an address.
+
+        :Parameters:
+            - `ip`: An IP object.
+
+        :Return:
+            Returns a `aplib.net.range.Prefix`.
+        """
+        prefixlen = self.prefixlen(ip.version)
+        return aplib.net.range.Prefix(
+            ip.__class__(ip.ip, _MASK[ip.version].prefixlen_to_mask(prefixlen)))
+
+    def key_int(self, version, value):
+        """Get the hash key of an address in integer form.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.
+
+        :Return:
+            Returns the key as a 64-bit integer.  All the addresses of a
+            network have the same key.
+        """
+        return _net.prefix_key(version, value, self.prefixlen(version),
+                               self.seed)
+
+    def shard(self, ip):
+        """Get the shard of an address.
+
+        :Parameters:
+            - `ip`: An IP object, or a `aplib.net.range.IPRange` which is
+              placed by its first address.
+
+        :Return:
+            Returns the shard number.
+        """
+        if isinstance(ip, aplib.net.range.IPRange):
+            ip = ip.first
+        return self._pick(self.key_int(ip.version, ip.ip))
+
+    def shard_int(self, version, value):
+        """Get the shard of an address in integer form.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.
+
+        :Return:
+            Returns the shard number.
+        """
+        return self._pick(self.key_int(version, value))
+
+    def shard_ints(self, version, values):
+        """Get the shards of many addresses in integer form.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `values`: The addresses.  For IPv4 this is best given as an
+              ``array.array('I')`` or other buffer of native uint32 values,
+              which is processed in C without the GIL.
+
+        :Return:
+            Returns an ``array.array('I')`` of shard numbers.
+        """
+        if version == 4:
+            if not isinstance(values, array.array) or values.typecode != 'I':
+                values = array.array('I', values)
+            return self._pick_ipv4_buffer(values)
+        return array.array('I', [self.shard_int(version, value)
+                                 for value in values])
+
+    def _pick(self, key):
+        """Map a key to a shard number."""
+        raise NotImplementedError
+
+    def _pick_ipv4_buffer(self, values):
+        """Map a buffer of IPv4 addresses to shard numbers."""
+        raise NotImplementedError
+
+class JumpSharder(PrefixSharder):
+
+    """Sharding over numbered shards with jump consistent hashing.
+
+    :IVariables:
+        - `shards`: The number of shards.
+    """
+
+    def __init__(self, shards, prefixlen4=24, prefixlen6=48, seed=0):
+        """Initialize the sharder.
+
+        :Parameters:
+            - `shards`: The number of shards.
+            - `prefixlen4`: See `PrefixSharder`.
+            - `prefixlen6`: See `PrefixSharder`.
+            - `seed`: See `PrefixSharder`.
+        """
+        if shards < 1:
+            raise ValueError(shards)
+        PrefixSharder.__init__(self, prefixlen4, prefixlen6, seed)
+        self.shards = shards
+
+    def _pick(self, key):
+        return _net.jump_hash(key, self.shards)
+
+    def _pick_ipv4_buffer(self, values):
+        return _net.shard_ipv4_buffer(values, self.prefixlen4, self.shards,
+                                      None, self.seed)
+
+def _node_key(node):
+    return struct.unpack('!Q', hashlib.md5(str(node)).digest()[:8])[0]
+
+class RendezvousSharder(PrefixSharder):
+
+    """Sharding over named nodes with rendezvous hashing.
+
+    Shard numbers are indexes into `nodes`.  A node's share of networks only
+    depends on its name, not its position, so use `node` rather than shard
+    numbers if nodes are removed from the middle of the list.
+
+    :IVariables:
+        - `nodes`: The list of nodes.  Treat it as read-only, use
+          `add_node` and `remove_node` to change it.
+    """
+
+    def __init__(self, nodes, prefixlen4=24, prefixlen6=48, seed=0):
+        """Initialize the sharder.
+
+        :Parameters:
+            - `nodes`: A sequence of nodes.  Nodes may be any object; they
+              are identified by ``str(node)``, which must be unique.
+            - `prefixlen4`: See `PrefixSharder`.
+            - `prefixlen6`: See `PrefixSharder`.
+            - `seed`: See `PrefixSharder`.
+        """
+        PrefixSharder.__init__(self, prefixlen4, prefixlen6, seed)
+        self.nodes = []
+        self._keys = []
+        self._update()
+        for node in nodes:
+            self.add_node(node)
+
+    def _update(self):
+        self._packed_keys = struct.pack('=%iQ' % (len(self._keys),),
+                                        *self._keys)
+
+    def add_node(self, node):
+        """Add a node.
+
+        :Parameters:
+            - `node`: The node.  See `__init__`.
+        """
+        if str(node) in [str(other) for other in self.nodes]:
+            raise ValueError(node)
+        self.nodes.append(node)
+        self._keys.append(_node_key(node))
+        self._update()
+
+    def remove_node(self, node):
+        """Remove a node.
+
+        The nodes after it shift down one shard number.
+
+        :Parameters:
+            - `node`: The node.
+        """
+        index = self.nodes.index(node)
+        del self.nodes[index]
+        del self._keys[index]
+        self._update()
+
+    def node(self, ip):
+        """Get the node an address belongs to.
+
+        :Parameters:
+            - `ip`: An IP object or `aplib.net.range.IPRange`.
+
+        :Return:
+            Returns the node.
+        """
+        return self.nodes[self.shard(ip)]
+
+    def node_int(self, version, value):
+        """Get the node an address in integer form belongs to.
+
+        :Parameters:
+            - `version`: The address version, 4 or 6.
+            - `value`: The address as an integer.
+
+        :Return:
+            Returns the node.
+        """
+        return self.nodes[self.shard_int(version, value)]
+
+    def _pick(self, key):
+        return _net.rendezvous_hash(key, self._packed_keys)
+
+    def _pick_ipv4_buffer(self, values):
+        return _net.shard_ipv4_buffer(values, self.prefixlen4, 0,
+                                      self._packed_keys, self.seed)
+
+# Putting this at the bottom is a bit of a hack to work around cyclical
+# import issues.
+import aplib.net.range
@@ -0,0 +1,295 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# $Header: //prod/main/ap/aplib/aplib/net/special.py#1 $
+
+"""Special-purpose address classification.
+
+This module holds a table of the IANA special-purpose address registries for
+IPv4 and IPv6 (RFC 6890 and the RFCs that have updated them since), plus the
+multicast ranges.  `classify_int` returns every property of an address as a
+bitmask of `ADDRESS_FLAGS` values with a single binary search.
+
+The IP objects use this for `aplib.net.ip.BaseIP.classify` and the ``is_*``
+predicates::
+
+    >>> IP('100.64.1.2').classify() & ADDRESS_FLAGS.SHARED
+    8
+    >>> flag_names(IP('2001:db8::1').classify())
+    ['DOCUMENTATION', 'NOT_GLOBAL']
+
+The registry entries are nested (for example 192.0.0.9/32 is inside
+192.0.0.0/24).  At import time they are flattened into a sorted list of
+non-overlapping intervals, each with the combined flags of every entry that
+covers it.  The `ADDRESS_FLAGS.NOT_GLOBAL` flag comes from the most specific
+entry that states whether it is globally reachable.
+"""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import bisect
+import struct
+
+from aplib.net import _net
+
+class ADDRESS_FLAGS:
+
+    """Static constants for address properties.
+
+    These are bit flags, an address may have several of them.
+
+    - `PRIVATE`: Private-use (RFC 1918) or Unique-Local (RFC 4193).
+    - `LOOPBACK`: Loopback (RFC 1122, RFC 4291).
+    - `LINK_LOCAL`: Link-local (RFC 3927, RFC 4291).
+    - `SHARED`: Shared address space for carrier-grade NAT (RFC 6598).
+    - `MULTICAST`: Multicast (RFC 5771, RFC 4291).
+    - `UNSPECIFIED`: 0.0.0.0 or ``::``.
+    - `THIS_NETWORK`: "This network", 0.0.0.0/8 (RFC 791).
+    - `BROADCAST`: The limited broadcast address (RFC 919).
+    - `RESERVED`: Reserved for future use, 240.0.0.0/4 (RFC 1112).
+    - `DOCUMENTATION`: Documentation (RFC 5737, RFC 3849, RFC 9637).
+    - `BENCHMARKING`: Benchmarking (RFC 2544, RFC 5180).
+    - `IETF_PROTOCOL`: IETF protocol assignments (RFC 6890).
+    - `NAT64`: IPv4/IPv6 translation (RFC 6052, RFC 8215, RFC 7050).
+    - `SIX_TO_FOUR`: 6to4 (RFC 3056, RFC 7526).
+    - `TEREDO`: Teredo (RFC 4380).
+    - `IPV4_MAPPED`: IPv4-mapped addresses (RFC 4291).
+    - `DISCARD`: Discard-only prefix (RFC 6666).
+    - `DUMMY`: Dummy address (RFC 7600, RFC 9780).
+    - `ORCHID`: ORCHIDv2 (RFC 7343) and drone remote ID (RFC 9374).
+    - `AMT`: Automatic multicast tunneling (RFC 7450).
+    - `AS112`: AS112 DNS service (RFC 7534, RFC 7535).
+    - `SEGMENT_ROUTING`: Segment routing SIDs (RFC 9602).
+    - `ANYCAST`: Well-known anycast services (PCP, TURN, DNS-SD SRP).
+    - `NOT_GLOBAL`: Not globally reachable according to the registry.
+    """
+
+    PRIVATE = 1 << 0
+    LOOPBACK = 1 << 1
+    LINK_LOCAL = 1 << 2
+    SHARED = 1 << 3
+    MULTICAST = 1 << 4
+    UNSPECIFIED = 1 << 5
+    THIS_NETWORK = 1 << 6
+    BROADCAST = 1 << 7
+    RESERVED = 1 << 8
+    DOCUMENTATION = 1 << 9
+    BENCHMARKING = 1 << 10
+    IETF_PROTOCOL = 1 << 11
+    NAT64 = 1 << 12
+    SIX_TO_FOUR = 1 << 13
+    TEREDO = 1 << 14
+    IPV4_MAPPED = 1 << 15
+    DISCARD = 1 << 16
+    DUMMY = 1 << 17
+    ORCHID = 1 << 18
+    AMT = 1 << 19
+    AS112 = 1 << 20
+    SEGMENT_ROUTING = 1 << 21
+    ANYCAST = 1 << 22
+    NOT_GLOBAL = 1 << 23
+
+_F = ADDRESS_FLAGS
+
+# (prefix, flags, globally reachable)
+#
+# Globally reachable is True, False, or None where the registry says "N/A"
+# (the enclosing entry then decides).
+_REGISTRY = (
+    # IPv4
+    ('0.0.0.0/8', _F.THIS_NETWORK, False),
+    ('0.0.0.0/32', _F.UNSPECIFIED, False),
+    ('10.0.0.0/8', _F.PRIVATE, False),
+    ('100.64.0.0/10', _F.SHARED, False),
+    ('127.0.0.0/8', _F.LOOPBACK, False),
+    ('169.254.0.0/16', _F.LINK_LOCAL, False),
+    ('172.16.0.0/12', _F.PRIVATE, False),
+    ('192.0.0.0/24', _F.IETF_PROTOCOL, False),
+    ('192.0.0.0/29', 0, False),                   # DS-Lite
+    ('192.0.0.8/32', _F.DUMMY, False),
+    ('192.0.0.9/32', _F.ANYCAST, True),           # PCP
+    ('192.0.0.10/32', _F.ANYCAST, True),          # TURN
+    ('192.0.0.170/31', _F.NAT64, False),          # NAT64/DNS64 discovery
+    ('192.0.2.0/24', _F.DOCUMENTATION, False),
+    ('192.31.196.0/24', _F.AS112, True),
+    ('192.52.193.0/24', _F.AMT, True),
+    ('192.88.99.0/24', _F.SIX_TO_FOUR, None),
+    ('192.168.0.0/16', _F.PRIVATE, False),
+    ('192.175.48.0/24', _F.AS112, True),
+    ('198.18.0.0/15', _F.BENCHMARKING, False),
+    ('198.51.100.0/24', _F.DOCUMENTATION, False),
+    ('203.0.113.0/24', _F.DOCUMENTATION, False),
+    ('224.0.0.0/4', _F.MULTICAST, None),
+    ('240.0.0.0/4', _F.RESERVED, False),
+    ('255.255.255.255/32', _F.BROADCAST, False),
+    # IPv6
+    ('::/128', _F.UNSPECIFIED, False),
+    ('::1/128', _F.LOOPBACK, False),
+    ('::ffff:0:0/96', _F.IPV4_MAPPED, False),
+    ('64:ff9b::/96', _F.NAT64, True),
+    ('64:ff9b:1::/48', _F.NAT64, False),
+    ('100::/64', _F.DISCARD, False),
+    ('100:0:0:1::/64', _F.DUMMY, False),
+    ('2001::/23', _F.IETF_PROTOCOL, False),
+    ('2001::/32', _F.TEREDO, None),
+    ('2001:1::1/128', _F.ANYCAST, True),          # PCP
+    ('2001:1::2/128', _F.ANYCAST, True),          # TURN
+    ('2001:1::3/128', _F.ANYCAST, True),          # DNS-SD SRP
+    ('2001:2::/48', _F.BENCHMARKING, False),
+    ('2001:3::/32', _F.AMT, True),
+    ('2001:4:112::/48', _F.AS112, True),
+    ('2001:20::/28', _F.ORCHID, True),
+    ('2001:30::/28', _F.ORCHID, True),
+    ('2001:db8::/32', _F.DOCUMENTATION, False),
+    ('2002::/16', _F.SIX_TO_FOUR, None),
+    ('2620:4f:8000::/48', _F.AS112, True),
+    ('3fff::/20', _F.DOCUMENTATION, False),
+    ('5f00::/16', _F.SEGMENT_ROUTING, False),
+    ('fc00::/7', _F.PRIVATE, False),
+    ('fe80::/10', _F.LINK_LOCAL, False),
+    ('ff00::/8', _F.MULTICAST, None),
+)
+
+def _parse(prefix):
+    """Parse a registry prefix into ``(version, first, last, prefixlen)``."""
+    if ':' in prefix:
+        packed, prefixlen = _net.parse_ipv6_prefix(prefix)
+        hi, lo = struct.unpack('!2Q', packed)
+        first = hi << 64 | lo
+        width = 128
+        version = 6
+    else:
+        first, prefixlen = _net.parse_cidr4(prefix)
+        width = 32
+        version = 4
+    hostmask = (1 << (width - prefixlen)) - 1
+    return version, first, first | hostmask, prefixlen
+
+def _build(version):
+    """Flatten the registry for one version.
+
+    :Return:
+        Returns a tuple ``(starts, flags)``.  ``flags[i]`` applies to the
+        addresses from ``starts[i]`` up to ``starts[i + 1] - 1``.
+    """
+    entries = []
+    for prefix, flags, is_global in _REGISTRY:
+        entry = _parse(prefix)
+        if entry[0] == version:
+            entries.append(entry[1:] + (flags, is_global))
+    bounds = set([0])
+    for first, last, unused, unused, unused in entries:
+        bounds.add(first)
+        bounds.add(last + 1)
+    if version == 4:
+        starts = array.array('I')
+        bounds.discard(1 << 32)
+    else:
+        starts = []
+        bounds.discard(1 << 128)
+    result = []
+    for start in sorted(bounds):
+        flags = 0
+        global_prefixlen = -1
+        not_global = 0
+        for first, last, prefixlen, entry_flags, is_global in entries:
+            if first <= start <= last:
+                flags |= entry_flags
+                if is_global is not None and prefixlen > global_prefixlen:
+                    global_prefixlen = prefixlen
+                    not_global = 0 if is_global else _F.NOT_GLOBAL
+        flags |= not_global
+        # Merge with the previous interval if nothing changed.
+        if not result or result[-1] != flags:
+            starts.append(start)
+            result.append(flags)
+    return starts, result
+
+_tables = {4: _build(4), 6: _build(6)}
+_ipv4_flags = array.array('I', _tables[4][1])
+_ipv6_starts = ''.join([struct.pack('!2Q', start >> 64,
+                                    start & 0xffffffffffffffff)
+                        for start in _tables[6][0]])
+_ipv6_flags = array.array('I', _tables[6][1])
+
+def classify_int(version, value):
+    """Classify an address in integer form.
+
+    :Parameters:
+        - `version`: The address version, 4 or 6.
+        - `value`: The address as an integer.
+
+    :Return:
+        Returns a bitmask of `ADDRESS_FLAGS` values.  An ordinary global
+        unicast address returns 0.
+    """
+    starts, flags = _tables[version]
+    return flags[bisect.bisect_right(starts, value) - 1]
+
+def flag_names(flags):
+    """Get the names of the flags set in a bitmask.
+
+    :Parameters:
+        - `flags`: A bitmask of `ADDRESS_FLAGS` values.
+
+    :Return:
+        Returns a list of the flag names, lowest bit first.
+    """
+    names = [(value, name) for name, value in vars(ADDRESS_FLAGS).iteritems()
+             if not name.startswith('_')]
+    names.sort()
+    return [name for value, name in names if flags & value]
+
+def classify_ipv4_array(addresses):
+    """Classify many IPv4 addresses.
+
+    The lookups run in C without the GIL, so large arrays can be split
+    across threads.
+
+    :Parameters:
+        - `addresses`: A buffer of addresses as native uint32 values, such as
+          an ``array.array('I')`` or a NumPy ``uint32`` array.
+
+    :Return:
+        Returns an ``array.array('I')`` of `ADDRESS_FLAGS` bitmasks.
+    """
+    return _net.classify_ipv4_buffer(addresses, _tables[4][0], _ipv4_flags)
+
+def filter_ipv6_buffer(data, unmap=True, exclude=0):
+    """Split off IPv4-mapped addresses and drop classified IPv6 addresses.
+
+    The work is done in C without the GIL.
+
+    :Parameters:
+        - `data`: A buffer of packed IPv6 addresses, 16 bytes each in network
+          byte order.
+        - `unmap`: If true, IPv4-mapped addresses (``::ffff:0:0/96``) are
+          taken out and returned as IPv4 addresses.
+        - `exclude`: A mask of `ADDRESS_FLAGS`.  IPv6 addresses with any of
+          these flags are dropped.  The mapped addresses are not checked.
+
+    :Return:
+        Returns a tuple ``(mapped, others)`` of an ``array.array('I')`` of
+        the IPv4 addresses and a string of the remaining packed addresses.
+    """
+    return _net.filter_ipv6_buffer(data, unmap, _ipv6_starts, _ipv6_flags,
+                                   exclude)
@@ -0,0 +1,76 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# $Header: //prod/main/ap/aplib/aplib/net/u128.pxi#1 $
+#
+# Conversion between Python integers, 64-bit halves, and network byte order,
+# shared by aplib.net._ip and aplib.net._net so they agree on the layout.
+# Use the "include" statement to include these functions.  You must include
+# "python.pxi" and "pyrex_helpers.pyx" before this file, and cimport
+# uint32_t and uint64_t from libc.
+
+cdef void _store_u64(unsigned char *out, uint64_t value) nogil:
+    cdef int i
+    for i from 7 >= i >= 0:
+        out[i] = value & 0xff
+        value = value >> 8
+
+cdef uint64_t _load_u64(unsigned char *data):
+    cdef uint64_t value
+    cdef int i
+    value = 0
+    for i from 0 <= i < 8:
+        value = (value << 8) | data[i]
+    return value
+
+cdef int _long_to_u128(object value, uint64_t *hi, uint64_t *lo) except -1:
+    """Convert a Python integer in the range of an IPv6 address to two 64-bit
+    halves."""
+    cdef unsigned char buf[16]
+    _PyLong_AsByteArray(long(value), buf, 16, 0, 0)
+    hi[0] = _load_u64(buf)
+    lo[0] = _load_u64(buf + 8)
+    return 0
+
+cdef object _u128_to_long(uint64_t hi, uint64_t lo):
+    cdef unsigned char buf[16]
+    _store_u64(buf, hi)
+    _store_u64(buf + 8, lo)
+    return _PyLong_FromByteArray(buf, 16, 0, 0)
+
+cdef int _value_to_u128(int version, object value, uint64_t *hi,
+                        uint64_t *lo) except -1:
+    cdef uint32_t value4
+    if version == 4:
+        value4 = value
+        hi[0] = 0
+        lo[0] = value4
+    elif version == 6:
+        _long_to_u128(value, hi, lo)
+    else:
+        raise ValueError(version)
+    return 0
+
+cdef object _u128_to_value(int version, uint64_t hi, uint64_t lo):
+    if version == 4:
+        if hi or lo > 0xffffffffU:
+            raise ValueError('address out of range')
+        return minimal_ulong(lo)
+    return _u128_to_long(hi, lo)
@@ -47,7 +47,10 @@ setup (
     packages=['aplib', 'aplib/net', 'aplib/tsc_time'],
     ext_modules=[
         # Please keep this list alphabetized.
-        CythonExtension ('aplib.net._net', ['aplib/net/aplib.net._net.pyx']),
+        CythonExtension ('aplib.net._ip', ['aplib/net/aplib.net._ip.pyx'],
+                         depends=['aplib/net/u128.pxi']),
+        CythonExtension ('aplib.net._net', ['aplib/net/aplib.net._net.pyx'],
+                         depends=['aplib/net/u128.pxi']),
         CythonExtension ('aplib.oserrors', ['aplib/aplib.oserrors.pyx']),
     ],
     cmdclass={'build_ext': build_ext},
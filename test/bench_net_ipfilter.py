@@ -0,0 +1,77 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Benchmark of the IP filters against an exact lookup.
+
+Usage: python bench_net_ipfilter.py [entries [probes]]
+
+Fills a `RangeLookup` and each filter type with ``entries`` IPv4 addresses,
+then times ``probes`` calls of ``contains_int`` on each, for addresses that
+are mostly not listed.  A filter is only worth putting in front of the
+lookup if it answers faster.
+"""
+
+__version__ = '$Revision: #1 $'
+
+import random
+import sys
+import time
+
+from aplib.net.ipfilter import BloomFilter, CuckooFilter, PrefixBloomFilter
+from aplib.net.lookup import RangeLookup
+
+def timed(function):
+    start = time.time()
+    result = function()
+    return time.time() - start, result
+
+def main(argv):
+    entries = int(argv[1]) if len(argv) > 1 else 200000
+    probes = int(argv[2]) if len(argv) > 2 else 100000
+    rand = random.Random(0)
+    listed = [rand.randrange(1 << 32) for unused in xrange(entries)]
+    addresses = [rand.randrange(1 << 32) for unused in xrange(probes)]
+    lookup = RangeLookup()
+    bloom = BloomFilter(entries, 0.01)
+    prefix_bloom = PrefixBloomFilter(entries, 0.01)
+    cuckoo = CuckooFilter(entries, 0.001)
+    for value in listed:
+        lookup.add_prefix_int(4, value, 32)
+        bloom.add_int(4, value)
+        prefix_bloom.add_int(4, value, 32)
+        cuckoo.add_int(4, value)
+    # Merge the pending ranges before timing.
+    lookup.contains_int(4, 0)
+    results = []
+    for name, table in (('RangeLookup', lookup), ('BloomFilter', bloom),
+                        ('PrefixBloomFilter', prefix_bloom),
+                        ('CuckooFilter', cuckoo)):
+        contains = table.contains_int
+        elapsed, found = timed(lambda: [value for value in addresses
+                                        if contains(4, value)])
+        results.append((name, elapsed, len(found)))
+    base = results[0][1]
+    print '%-18s %8s %8s %8s' % ('', 'time', 'found', 'speedup')
+    for name, elapsed, found in results:
+        print '%-18s %7.3fs %8i %7.2fx' % (name, elapsed, found,
+                                           base / elapsed)
+
+if __name__ == '__main__':
+    main(sys.argv)
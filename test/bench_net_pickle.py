@@ -0,0 +1,73 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Benchmark of pickling IP objects.
+
+Usage: python bench_net_pickle.py [count]
+
+Times dumping and loading ``count`` IPv4 and IPv6 objects with cPickle
+protocol 2, in the compact format used now and in the format used before,
+which pickled the ``ip``, ``prefixlen`` and ``_netmask`` attributes.
+"""
+
+__version__ = '$Revision: #1 $'
+
+import copy_reg
+import cPickle
+import sys
+import time
+
+from aplib.net.ip import BaseIP, IPv4, IPv6
+
+def _attribute_reduce(self):
+    return (copy_reg.__newobj__, (self.__class__,),
+            (self.ip, self.prefixlen, self._netmask))
+
+def timed(function):
+    start = time.time()
+    result = function()
+    return time.time() - start, result
+
+def run(ips):
+    dump_time, data = timed(lambda: cPickle.dumps(ips, 2))
+    load_time, result = timed(lambda: cPickle.loads(data))
+    assert result == ips
+    return len(data), dump_time, load_time
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 200000
+    print '%-6s %-10s %10s %8s %8s' % ('', 'format', 'bytes', 'dump', 'load')
+    for name, ips in (('IPv4', [IPv4(i * 7919) for i in xrange(count)]),
+                      ('IPv6', [IPv6(i << 64 | i) for i in xrange(count)])):
+        compact = run(ips)
+        BaseIP.__reduce__ = _attribute_reduce
+        try:
+            attributes = run(ips)
+        finally:
+            del BaseIP.__reduce__
+        for format, (size, dump_time, load_time) in (
+                ('attributes', attributes), ('compact', compact)):
+            print '%-6s %-10s %10i %7.3fs %7.3fs' % (name, format, size,
+                                                      dump_time, load_time)
+        print '%-6s load speedup %.2fx, %.0f%% of the size' % (
+            name, attributes[2] / compact[2], 100.0 * compact[0] / attributes[0])
+
+if __name__ == '__main__':
+    main(sys.argv)
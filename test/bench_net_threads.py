@@ -0,0 +1,93 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Benchmark of the GIL-releasing aplib.net operations across threads.
+
+Usage: python bench_net_threads.py [max_threads] [megabytes]
+
+Builds a synthetic mail log, then times scanning it for addresses, and
+classifying, matching and formatting the addresses found, with 1 up to
+``max_threads`` threads.  On a machine with enough cores the speedup should
+be close to the number of threads.
+"""
+
+__version__ = '$Revision: #1 $'
+
+import random
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+from aplib.net import _net
+from aplib.net.extract import extract_parallel
+from aplib.net.lookup import RangeLookup
+from aplib.net.range import Prefix
+from aplib.net import special
+
+def make_log(megabytes):
+    rand = random.Random(0)
+    lines = []
+    size = 0
+    while size < megabytes * 1024 * 1024:
+        line = ('Oct 19 10:00:%02i mx1 smtpd[%i]: connect from '
+                'host.example.com[%i.%i.%i.%i]:25\n' %
+                (rand.randrange(60), rand.randrange(100000),
+                 rand.randrange(256), rand.randrange(256),
+                 rand.randrange(256), rand.randrange(256)))
+        lines.append(line)
+        size += len(line)
+    return ''.join(lines)
+
+def split_array(addresses, count):
+    step = (len(addresses) + count - 1) // count
+    return [addresses[i:i + step] for i in xrange(0, len(addresses), step)]
+
+def timed(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+def main(argv):
+    max_threads = int(argv[1]) if len(argv) > 1 else 4
+    megabytes = int(argv[2]) if len(argv) > 2 else 64
+    data = make_log(megabytes)
+    addresses = extract_parallel(data, 4, 1)
+    table = RangeLookup(Prefix('%i.0.0.0/8' % (i,)) for i in xrange(0, 256, 3))
+    print 'log: %i MB, %i addresses' % (megabytes, len(addresses))
+    print '%-8s %11s %11s %11s %11s' % ('threads', 'extract', 'classify',
+                                         'contains', 'format')
+    base = None
+    for threads in xrange(1, max_threads + 1):
+        pool = ThreadPool(threads)
+        parts = split_array(addresses, threads)
+        times = (
+            timed(lambda: extract_parallel(data, 4, threads, pool)),
+            timed(lambda: pool.map(special.classify_ipv4_array, parts)),
+            timed(lambda: pool.map(table.contains_ipv4_array, parts)),
+            timed(lambda: pool.map(_net.format_ipv4_buffer, parts)),
+        )
+        pool.close()
+        if base is None:
+            base = times
+        print '%-8i %s' % (threads, ' '.join(
+            '%5.3fs %3.1fx' % (t, b / t) for t, b in zip(times, base)))
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,574 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for connection_pool module."""
+
+__version__ = '$Revision: #1 $'
+
+import socket
+import time
+import unittest
+
+from aplib import connection_pool
+from aplib.connection_pool import (ConnectionManager, ConnectionPool,
+                                   Connection, Histogram, IfaceNotCompatible,
+                                   MaxConnectionsLimit, MaxPoolsLimit)
+
+BIND = ('10.0.0.1', '2001:db8::1')
+
+class FakeSocket(object):
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakeConnection(Connection):
+
+    __slots__ = ()
+
+    def init_socket(self):
+        self.sock = FakeSocket()
+
+class FakePool(ConnectionPool):
+
+    __slots__ = ()
+
+    conn_class = FakeConnection
+
+class WaitingPool(FakePool):
+
+    """Runs the queued callbacks instead of blocking, one per wait."""
+
+    __slots__ = ('others',)
+
+    def _wait(self, waiter, timeout):
+        if self.others:
+            self.others.pop(0)()
+
+# Called while a HookedConnection connects, to act as another coro thread.
+connect_hooks = []
+
+class HookedConnection(FakeConnection):
+
+    __slots__ = ()
+
+    def init_socket(self):
+        if connect_hooks:
+            connect_hooks.pop(0)()
+        FakeConnection.init_socket(self)
+
+class HookedPool(WaitingPool):
+
+    __slots__ = ()
+
+    conn_class = HookedConnection
+
+class FakeThread(object):
+
+    def __init__(self):
+        self.scheduled = 0
+
+    def schedule(self):
+        self.scheduled += 1
+
+class Test(unittest.TestCase):
+
+    def test_manager_pools(self):
+        manager = ConnectionManager(FakePool, max_pools=2)
+        conn = manager.get_connection('192.0.2.1', 25, BIND)
+        self.assertEqual(conn.bind_address, '10.0.0.1')
+        self.assertEqual(conn.host, '192.0.2.1')
+        pool = manager.get_pool('192.0.2.1', 25)
+        self.assertTrue(pool.manager is manager)
+        self.assertTrue(conn in pool.connections)
+        conn6 = manager.get_connection('2001:db8::25', 25, BIND)
+        self.assertEqual(conn6.bind_address, '2001:db8::1')
+        self.assertEqual(sorted(manager.pools),
+                         [('192.0.2.1', 25, 4), ('2001:db8::25', 25, 6)])
+        self.assertRaises(MaxPoolsLimit, manager.get_connection,
+                          '192.0.2.2', 25, BIND)
+        self.assertRaises(IfaceNotCompatible, manager.get_connection,
+                          '2001:db8::25', 25, (BIND[0], None))
+        self.assertEqual(manager.no_of_sockets, 2)
+
+        # Once a pool has no connections it is removed to make room.
+        conn6.close()
+        conn6.in_use = False
+        manager.clean()
+        self.assertEqual(manager.no_of_sockets, 1)
+        self.assertEqual(manager.pools.keys(), [('192.0.2.1', 25, 4)])
+        manager.get_connection('192.0.2.2', 25, BIND)
+        self.assertEqual(len(manager.pools), 2)
+
+    def test_manager_sockets(self):
+        manager = ConnectionManager(FakePool, max_sockets=3,
+                                    max_connections=2)
+        manager.get_connection('192.0.2.1', 25, BIND)
+        manager.get_connection('192.0.2.1', 25, BIND)
+        self.assertRaises(MaxConnectionsLimit, manager.get_connection,
+                          '192.0.2.1', 25, BIND)
+        manager.get_connection('192.0.2.2', 25, BIND)
+        self.assertRaises(MaxConnectionsLimit, manager.get_connection,
+                          '192.0.2.3', 25, BIND)
+        self.assertEqual(manager.no_of_sockets, 3)
+
+    def test_idle_lists(self):
+        pool = FakePool('192.0.2.1', 25, max_connections=4)
+        a = pool.get_connection(BIND)
+        b = pool.get_connection(BIND)
+        c = pool.get_connection(('10.0.0.2', None))
+        self.assertEqual(pool.no_of_connections, 3)
+        a.in_use = False
+        b.in_use = False
+        c.in_use = False
+        self.assertFalse(b.in_use)
+        self.assertEqual(sorted(pool.connections), sorted([a, b, c]))
+        # The most recently returned connection for the bind address is used
+        # first.
+        self.assertTrue(pool.get_connection(BIND) is b)
+        self.assertTrue(pool.get_connection(BIND) is a)
+        self.assertTrue(pool.get_connection(('10.0.0.2', None)) is c)
+        d = pool.get_connection(BIND)
+        self.assertEqual(pool.no_of_connections, 4)
+        self.assertRaises(MaxConnectionsLimit, pool.get_connection, BIND)
+
+        # Connections closed while idle are skipped.
+        a.in_use = False
+        d.in_use = False
+        d.close()
+        self.assertTrue(pool.get_connection(BIND) is a)
+        self.assertEqual(pool.no_of_connections, 3)
+
+        # Connections closed while in use are dropped when they come back.
+        a.close()
+        a.in_use = False
+        self.assertEqual(pool.no_of_connections, 2)
+        self.assertTrue(a.pool is None)
+
+    def test_release(self):
+        pool = FakePool('192.0.2.1', 25)
+        conn = pool.get_connection(BIND)
+        conn.last_used_time -= 100
+        pool.release(conn)
+        self.assertFalse(conn.in_use)
+        self.assertTrue(conn.last_used_time > time.time() - 10)
+        self.assertRaises(ValueError, pool.release, conn)
+        self.assertTrue(pool.get_connection(BIND) is conn)
+        pool.release(conn, reusable=False)
+        self.assertTrue(conn.sock is None)
+        self.assertEqual(pool.no_of_connections, 0)
+
+        with pool.connection(BIND) as conn:
+            self.assertTrue(conn.in_use)
+        self.assertFalse(conn.in_use)
+        self.assertEqual(pool.connections, [conn])
+        try:
+            with pool.connection(BIND) as conn2:
+                self.assertTrue(conn2 is conn)
+                raise KeyError
+        except KeyError:
+            pass
+        self.assertTrue(conn.sock is None)
+        self.assertEqual(pool.connections, [])
+
+        # A connection of another pool is refused and left alone.
+        other = FakePool('192.0.2.2', 25)
+        conn = other.get_connection(BIND)
+        self.assertRaises(ValueError, pool.release, conn)
+        self.assertFalse(conn.sock is None)
+        self.assertEqual(other.no_of_connections, 1)
+        other.release(conn)
+        self.assertEqual(other.connections, [conn])
+
+        # A connection dropped while in use is just closed.
+        conn = pool.get_connection(BIND)
+        conn.close()
+        pool.clean_connections()
+        self.assertTrue(conn.pool is None)
+        pool.release(conn)
+        self.assertFalse(conn.in_use)
+        self.assertEqual(pool.no_of_connections, 0)
+
+        manager = ConnectionManager(FakePool)
+        with manager.connection('192.0.2.1', 25, BIND) as conn:
+            pass
+        self.assertEqual(manager.get_pool('192.0.2.1', 25).connections,
+                         [conn])
+        self.assertEqual(manager.no_of_sockets, 1)
+
+    def test_clean_connections(self):
+        pool = FakePool('192.0.2.1', 25, max_connections=3)
+        conns = [pool.get_connection(BIND) for i in xrange(3)]
+        for conn in conns:
+            conn.in_use = False
+        conns[0].last_used_time -= connection_pool.DEFAULT_SOCK_TIMEOUT + 1
+        pool.clean_connections()
+        self.assertTrue(conns[0].sock is None)
+        self.assertEqual(pool.no_of_connections, 2)
+        # Idle connections over the limit are closed, oldest first.
+        pool.max_connections = 1
+        pool.clean_connections()
+        self.assertEqual(pool.connections, [conns[2]])
+
+    def test_expire(self):
+        manager = ConnectionManager(FakePool, sock_timeout=10)
+        a = manager.get_connection('192.0.2.1', 25, BIND)
+        b = manager.get_connection('192.0.2.1', 25, BIND)
+        c = manager.get_connection('192.0.2.2', 25, BIND)
+        pool = manager.get_pool('192.0.2.1', 25)
+        self.assertEqual(pool.sock_timeout, 10)
+        self.assertEqual(FakePool('192.0.2.1', 25).sock_timeout,
+                         connection_pool.DEFAULT_SOCK_TIMEOUT)
+        self.assertEqual(pool.next_expiry(), None)
+        now = time.time()
+        a.in_use = False
+        b.in_use = False
+        self.assertTrue(now + 10 <= pool.next_expiry() <= time.time() + 10)
+        self.assertEqual(manager.expire(now), 0)
+        self.assertEqual(len(manager._expiry_heap), 1)
+
+        # Only the expired connection is closed, and the pool is rescheduled
+        # for the next one.
+        a.last_used_time -= 5
+        self.assertEqual(manager.expire(now + 6), 0)
+        b.last_used_time += 5
+        self.assertEqual(manager.expire(now + 11), 1)
+        self.assertTrue(a.sock is None and a.pool is None)
+        self.assertEqual(pool.connections, [b])
+        self.assertEqual(len(manager._expiry_heap), 1)
+        self.assertEqual(manager.no_of_sockets, 2)
+
+        # Empty pools are removed, and pools with connections in use are not
+        # visited.
+        self.assertEqual(manager.expire(now + 16), 1)
+        self.assertEqual(manager.pools.keys(), [('192.0.2.2', 25, 4)])
+        self.assertEqual(manager._expiry_heap, [])
+        self.assertEqual(manager.expire(now + 100), 0)
+        self.assertTrue(c.sock is not None)
+        self.assertEqual(manager.no_of_sockets, 1)
+
+    def test_wait(self):
+        pool = WaitingPool('192.0.2.1', 25, max_connections=2)
+        pool.others = []
+        a = pool.get_connection(BIND)
+        b = pool.get_connection(BIND)
+        # Waiting is off by default.
+        self.assertRaises(MaxConnectionsLimit, pool.get_connection, BIND)
+        self.assertEqual(pool.waits, 0)
+
+        # A released connection is handed to the waiter.
+        pool.max_waiters = 1
+        pool.others.append(lambda: pool.release(a))
+        self.assertTrue(pool.get_connection(BIND) is a)
+        self.assertTrue(a.in_use)
+        self.assertEqual(pool.connections.count(a), 1)
+
+        # A closed connection frees a slot for a new connection.
+        pool.others.append(lambda: pool.release(b, reusable=False))
+        c = pool.get_connection(BIND)
+        self.assertTrue(c not in (a, b) and c.in_use)
+        self.assertEqual(pool.no_of_connections, 2)
+
+        # Timing out.
+        self.assertRaises(MaxConnectionsLimit, pool.get_connection, BIND, 0)
+        self.assertEqual(pool.wait_timeouts, 1)
+
+        # A full queue fails fast.
+        def nested():
+            self.assertRaises(MaxConnectionsLimit, pool.get_connection, BIND)
+            pool.release(c)
+        pool.others.append(nested)
+        self.assertTrue(pool.get_connection(BIND) is c)
+        stats = pool.wait_stats()
+        self.assertEqual(stats['waiting'], 0)
+        self.assertEqual(stats['waits'], 4)
+        self.assertEqual(stats['waits_rejected'], 1)
+        self.assertEqual(stats['wait_timeouts'], 1)
+        self.assertTrue(stats['wait_time_max'] >= 0)
+
+    def test_wait_order(self):
+        pool = WaitingPool('192.0.2.1', 25, max_connections=1, max_waiters=2)
+        pool.others = []
+        a = pool.get_connection(BIND)
+        newcomer = []
+
+        def free_slot():
+            pool.release(a, reusable=False)
+            # The slot is held for the woken waiter, so a caller arriving
+            # before it runs queues (and here times out) instead of taking
+            # the slot.
+            self.assertEqual(pool.no_of_connections, 0)
+            self.assertRaises(MaxConnectionsLimit, pool.get_connection,
+                              BIND, 0)
+            newcomer.append(True)
+        pool.others.append(free_slot)
+        b = pool.get_connection(BIND)
+        self.assertEqual(newcomer, [True])
+        self.assertTrue(b is not a and b.in_use)
+        self.assertEqual(pool.no_of_connections, 1)
+        self.assertEqual(pool._reserved, 0)
+        self.assertEqual(pool.wait_timeouts, 1)
+
+        # While someone waits, a new caller queues even if it could connect.
+        pool.max_connections = 2
+        waiter = connection_pool._Waiter('10.0.0.1')
+        pool._waiters.append(waiter)
+        self.assertRaises(MaxConnectionsLimit, pool.get_connection, BIND, 0)
+        self.assertEqual(pool.no_of_connections, 1)
+        pool._waiters.remove(waiter)
+        self.assertTrue(pool.get_connection(BIND, 0).in_use)
+
+    def test_connect_limit(self):
+        manager = ConnectionManager(HookedPool, max_sockets=2,
+                                    max_connecting=1, max_waiters=5)
+        pool = manager.get_pool('192.0.2.1', 25)
+        pool.others = []
+        self.assertEqual(pool.max_connecting, 1)
+        waiter = connection_pool._Waiter('10.0.0.1')
+        waiter.thread = FakeThread()
+
+        def during_connect():
+            self.assertEqual(pool.connecting, 1)
+            # The connect in flight holds a slot and a socket.
+            self.assertEqual(pool.no_of_connections, 1)
+            self.assertEqual(manager.no_of_sockets, 1)
+            self.assertRaises(MaxConnectionsLimit, pool.get_connection,
+                              BIND, 0)
+            pool._waiters.append(waiter)
+        connect_hooks.append(during_connect)
+        a = pool.get_connection(BIND)
+        self.assertEqual(pool.connecting, 0)
+        # The finished connect woke up the next waiter and holds the
+        # connect slot for it.
+        self.assertEqual(waiter.thread.scheduled, 1)
+        self.assertEqual(list(pool._waiters), [])
+        self.assertTrue(waiter.reserved)
+        self.assertRaises(MaxConnectionsLimit, pool.get_new_connection, BIND)
+        pool._release_reservation(waiter)
+
+        # A failed connect frees its slot and socket.
+        def fail():
+            raise IOError
+        connect_hooks.append(fail)
+        self.assertRaises(IOError, pool.get_connection, BIND)
+        self.assertEqual(pool.connecting, 0)
+        self.assertEqual(pool.no_of_connections, 1)
+        self.assertEqual(manager.no_of_sockets, 1)
+        self.assertTrue(pool.get_connection(BIND) is not a)
+
+    def test_probe_idle(self):
+        manager = ConnectionManager(FakePool, probe_idle=5)
+        pool = manager.get_pool('192.0.2.1', 25)
+        self.assertEqual(pool.probe_idle, 5)
+        a = pool.get_connection(BIND)
+        a.sock, remote = socket.socketpair()
+        try:
+            self.assertTrue(a.is_alive())
+            pool.release(a)
+            a.last_used_time -= 10
+            self.assertTrue(pool.get_connection(BIND) is a)
+            pool.release(a)
+
+            # Dead connections idle for less than probe_idle are not checked.
+            remote.close()
+            self.assertFalse(a.is_alive())
+            self.assertTrue(pool.get_connection(BIND) is a)
+            pool.release(a)
+            a.last_used_time -= 10
+            b = pool.get_connection(BIND)
+            self.assertTrue(b is not a)
+            self.assertTrue(a.sock is None and a.pool is None)
+            self.assertEqual(pool.dead_connections, 1)
+            self.assertEqual(pool.no_of_connections, 1)
+            self.assertEqual(manager.no_of_sockets, 1)
+        finally:
+            a.close()
+            remote.close()
+
+    def test_warm(self):
+        manager = ConnectionManager(HookedPool, max_sockets=5,
+                                    max_connections=3, min_idle=2,
+                                    sock_timeout=10)
+        pool = manager.get_pool('192.0.2.1', 25)
+        self.assertEqual(pool.min_idle, 2)
+        # Nothing is known about the bind address yet.
+        self.assertEqual(manager.warm(), 0)
+        a = pool.get_connection(BIND)
+        now = time.time()
+        self.assertEqual(manager.warm(limit=1, now=now), 1)
+        self.assertEqual(manager.warm(now=now), 1)
+        self.assertEqual(manager.warm(now=now), 0)
+        self.assertEqual(len(pool.connections), 3)
+        # max_connections is respected.
+        pool.release(a)
+        pool.get_connection(BIND)
+        pool.get_connection(BIND)
+        self.assertEqual(manager.warm(now=now), 0)
+
+        # Failed connects back off.
+        other = manager.get_pool('192.0.2.2', 25)
+        other.get_connection(BIND)
+        def fail():
+            raise IOError
+        connect_hooks.append(fail)
+        self.assertEqual(manager.warm(now=now), 0)
+        self.assertEqual(other.warm_failures, 1)
+        self.assertEqual(manager.no_of_sockets, 4)
+        # Not only socket errors count as failures.
+        def fail_other():
+            raise ValueError
+        connect_hooks.append(fail_other)
+        self.assertEqual(other.warm(now=now + 0.5), 0)
+        self.assertEqual(other.warm(now=now + 1), 0)
+        self.assertEqual(other.warm_failures, 2)
+        self.assertEqual(other.warm(now=now + 2), 0)
+        # The manager's socket budget is respected.
+        self.assertEqual(other.warm(now=now + 3), 1)
+        self.assertEqual(other.warm_failures, 0)
+        self.assertEqual(manager.no_of_sockets, 5)
+
+        # Pools to be kept warm are not removed when empty.
+        for conn in list(other._busy):
+            other.release(conn, False)
+        self.assertEqual(manager.expire(now + 100), 2)
+        self.assertEqual(other.no_of_connections, 0)
+        self.assertEqual(manager.remove_empty_pools(), 0)
+        self.assertEqual(len(manager.pools), 2)
+
+    def test_warm_order(self):
+        manager = ConnectionManager(FakePool, min_idle=3, warm_rate=2)
+        pools = []
+        for i in xrange(5):
+            pool = manager.get_pool('192.0.2.%i' % (i + 1,), 25)
+            pool.release(pool.get_connection(BIND))
+            pools.append(pool)
+        idle = lambda: sorted(len(pool.connections) for pool in pools)
+        # Each call opens at most warm_rate connections, one per pool, and
+        # picks up where the last one stopped, so every pool gets a turn.
+        now = time.time()
+        for unused in xrange(3):
+            self.assertEqual(manager.warm(manager.warm_rate, now), 2)
+        self.assertEqual(idle(), [2, 2, 2, 2, 3])
+        self.assertEqual(manager.warm(manager.warm_rate, now), 2)
+        self.assertEqual(manager.warm(manager.warm_rate, now), 2)
+        self.assertEqual(idle(), [3, 3, 3, 3, 3])
+        self.assertEqual(manager.warm(manager.warm_rate, now), 0)
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for value in (0, 1e-9, 0.001, 0.0015, 1.0, 1.5, 1e6):
+            histogram.record(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 7)
+        self.assertEqual(snapshot['max'], 1e6)
+        self.assertEqual(snapshot['buckets'],
+                         {2.0 ** -20: 2, 2.0 ** -9: 2, 2.0: 2, 2.0 ** 12: 1})
+
+    def test_snapshot(self):
+        manager = ConnectionManager(FakePool, max_pools=1, max_connections=2)
+        a = manager.get_connection('192.0.2.1', 25, BIND)
+        b = manager.get_connection('192.0.2.1', 25, BIND)
+        self.assertRaises(MaxConnectionsLimit, manager.get_connection,
+                          '192.0.2.1', 25, BIND)
+        self.assertRaises(MaxPoolsLimit, manager.get_connection,
+                          '192.0.2.2', 25, BIND)
+        a.in_use = False
+        manager.get_connection('192.0.2.1', 25, BIND)
+        manager.get_pool('192.0.2.1', 25).release(b, reusable=False)
+        self.assertRaises(IfaceNotCompatible, manager.get_connection,
+                          '192.0.2.1', 25, (None, BIND[1]))
+
+        snapshot = manager.snapshot(per_pool=True)
+        pool_stats = snapshot.pop('pool_stats')
+        self.assertEqual(snapshot,
+                         {'pools': 1, 'max_pools': 1, 'sockets': 1,
+                          'max_sockets': None, 'pools_created': 1,
+                          'pools_removed': 0, 'pool_limit_errors': 1,
+                          'evictions': 0,
+                          'hits': 1, 'misses': 4, 'connects': 2,
+                          'connect_failures': 0, 'limit_errors': 1,
+                          'iface_errors': 1, 'dead_connections': 0,
+                          'waits': 0, 'wait_timeouts': 0,
+                          'waits_rejected': 0})
+        stats = pool_stats[('192.0.2.1', 25, 4)]
+        self.assertEqual((stats['connections'], stats['idle'],
+                          stats['busy']), (1, 0, 1))
+        self.assertEqual(stats['connect_times']['count'], 2)
+        self.assertEqual(stats['lifetimes']['count'], 1)
+        self.assertEqual(stats['wait_times']['count'], 0)
+
+    def test_evict_idle(self):
+        manager = ConnectionManager(FakePool, max_sockets=3,
+                                    max_connections=3)
+        self.assertFalse(manager.evict_idle())
+        a = manager.get_connection('192.0.2.1', 25, BIND)
+        b = manager.get_connection('192.0.2.2', 25, BIND)
+        c = manager.get_connection('192.0.2.2', 25, BIND)
+        a.in_use = False
+        b.in_use = False
+        c.in_use = False
+        # The heap entries are out of date now, and are refreshed as needed.
+        a.last_used_time += 5
+        b.last_used_time -= 2
+        c.last_used_time -= 1
+
+        # The new pool takes the place of the least recently used idle
+        # connection, wherever it is.
+        d = manager.get_connection('192.0.2.3', 25, BIND)
+        self.assertTrue(b.sock is None and b.pool is None)
+        self.assertEqual(manager.no_of_sockets, 3)
+        e = manager.get_connection('192.0.2.3', 25, BIND)
+        self.assertTrue(c.sock is None)
+        # Pools left empty are removed.
+        self.assertEqual(manager.pools.keys().count(('192.0.2.2', 25, 4)), 0)
+        manager.get_connection('192.0.2.3', 25, BIND)
+        self.assertTrue(a.sock is None)
+        self.assertEqual(manager.evictions, 3)
+        self.assertEqual(manager.snapshot()['evictions'], 3)
+
+        # Only when every connection is in use is it an error.
+        self.assertRaises(MaxConnectionsLimit, manager.get_connection,
+                          '192.0.2.4', 25, BIND)
+        d.in_use = False
+        self.assertTrue(manager.get_connection('192.0.2.3', 25, BIND) is d)
+        e.in_use = False
+        manager.get_connection('192.0.2.4', 25, BIND)
+        self.assertTrue(e.sock is None)
+        self.assertEqual(manager.no_of_sockets, 3)
+
+    def test_evict_own_idle(self):
+        manager = ConnectionManager(FakePool, max_sockets=1)
+        a = manager.get_connection('192.0.2.1', 25, ('10.0.0.2', None))
+        a.in_use = False
+        pool = manager.get_pool('192.0.2.1', 25)
+        # The pool's only connection is evicted, the pool must stay.
+        b = manager.get_connection('192.0.2.1', 25, BIND)
+        self.assertTrue(a.sock is None)
+        self.assertTrue(pool.manager is manager)
+        self.assertTrue(manager.get_pool('192.0.2.1', 25) is pool)
+        self.assertEqual(pool.connections, [b])
+        self.assertEqual(manager.no_of_sockets, 1)
+        self.assertRaises(MaxConnectionsLimit, manager.get_connection,
+                          '192.0.2.1', 25, ('10.0.0.2', None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for aggregate module."""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import cStringIO
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+from aplib.net import aggregate
+from aplib.net.special import ADDRESS_FLAGS
+
+LOG = """\
+connect from 8.8.8.8 to 10.0.0.1
+connect from 8.8.8.9
+connect from 8.8.4.4 via ::ffff:8.8.8.10
+connect from 2001:4860::1 and 2001:4860:0:1::1
+connect from 2001:4860::2 and fe80::1
+"""
+
+class Test(unittest.TestCase):
+
+    def test_read_chunks(self):
+        for chunk_size in (1, 5, 40, 1000):
+            chunks = list(aggregate.read_chunks(
+                [cStringIO.StringIO(LOG), cStringIO.StringIO('a\nb')],
+                chunk_size))
+            self.assertEqual(''.join(chunks), LOG + 'a\nb')
+            for chunk in chunks[:-1]:
+                self.assertTrue(chunk.endswith('\n'))
+            self.assertEqual(chunks[-1], 'b')
+
+    def test_stages(self):
+        batches = list(aggregate.extract([LOG]))
+        self.assertEqual(batches[0],
+                         (4, array.array('I', [0x08080808, 0x0a000001,
+                                               0x08080809, 0x08080404])))
+        self.assertEqual(batches[1][0], 6)
+        self.assertEqual(len(batches[1][1]), 5 * 16)
+
+        batches = list(aggregate.normalize(batches))
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(batches[1], (4, array.array('I', [0x0808080a])))
+        self.assertEqual(batches[2][0], 6)
+        self.assertEqual(len(batches[2][1]), 4 * 16)
+
+        batches = list(aggregate.normalize(aggregate.extract([LOG]),
+                                           exclude=ADDRESS_FLAGS.NOT_GLOBAL))
+        self.assertEqual(batches[0],
+                         (4, array.array('I', [0x08080808, 0x08080809,
+                                               0x08080404])))
+        self.assertEqual(len(batches[2][1]), 3 * 16)
+
+        buckets = list(aggregate.bucket(batches, {4: (24, 8), 6: (32,)}))
+        self.assertEqual(
+            [(version, prefixlen, list(networks), list(counts))
+             for version, prefixlen, networks, counts in buckets],
+            [(4, 24, [0x08080400, 0x08080800], [1, 2]),
+             (4, 8, [0x08000000], [3]),
+             (4, 24, [0x08080800], [1]),
+             (4, 8, [0x08000000], [1]),
+             (6, 32, [0x20014860 << 96], [3])])
+
+        totals = aggregate.aggregate(buckets)
+        self.assertEqual(totals, {(4, 24): {0x08080400: 1, 0x08080800: 3},
+                                  (4, 8): {0x08000000: 4},
+                                  (6, 32): {0x20014860 << 96: 3}})
+        self.assertEqual(list(aggregate.format_top(totals, 1)),
+                         ['# IPv4 /8: 1 networks, 4 addresses',
+                          '4 8.0.0.0/8',
+                          '# IPv4 /24: 2 networks, 4 addresses',
+                          '3 8.8.8.0/24',
+                          '# IPv6 /32: 1 networks, 3 addresses',
+                          '3 2001:4860::/32'])
+
+    def test_bucket_ipv6(self):
+        values = [0x20010db8 << 96 | 0xffff << 64 | 1,
+                  0x20010db8 << 96 | 0x1234 << 64 | 2,
+                  0x20010db8 << 96 | 0x1234 << 64 | 2,
+                  0x20010db9 << 96 | 3]
+        packed = struct.pack('!8Q', *[half for value in values
+                                      for half in (value >> 64,
+                                                   value & (1 << 64) - 1)])
+        prefixlens = (0, 1, 31, 32, 36, 50, 64, 127, 128)
+        buckets = aggregate.bucket([(6, packed)], {6: prefixlens})
+        for (version, prefixlen, networks, counts), expected in zip(
+                buckets, prefixlens):
+            self.assertEqual(prefixlen, expected)
+            mask = ((1 << prefixlen) - 1) << (128 - prefixlen)
+            tally = {}
+            for value in values:
+                tally[value & mask] = tally.get(value & mask, 0) + 1
+            self.assertEqual(networks, sorted(tally))
+            self.assertEqual(list(counts),
+                             [tally[network] for network in networks])
+
+    def test_main(self):
+        out = cStringIO.StringIO()
+        status = aggregate.main(['-4', '24,16', '-6', ''],
+                                cStringIO.StringIO(LOG), out)
+        self.assertEqual(status, 0)
+        self.assertEqual(out.getvalue(),
+                         '# IPv4 /16: 2 networks, 5 addresses\n'
+                         '4 8.8.0.0/16\n'
+                         '1 10.0.0.0/16\n'
+                         '# IPv4 /24: 3 networks, 5 addresses\n'
+                         '3 8.8.8.0/24\n'
+                         '1 8.8.4.0/24\n'
+                         '1 10.0.0.0/24\n')
+
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, LOG)
+            os.close(fd)
+            out = cStringIO.StringIO()
+            aggregate.main(['-g', '-n', '1', '--no-unmap', path, path],
+                           None, out)
+            self.assertEqual(out.getvalue(),
+                             '# IPv4 /24: 2 networks, 6 addresses\n'
+                             '4 8.8.8.0/24\n'
+                             '# IPv6 /64: 2 networks, 6 addresses\n'
+                             '4 2001:4860::/64\n')
+        finally:
+            os.unlink(path)
+
+    def test_main_missing_file(self):
+        path = os.path.join(tempfile.gettempdir(), 'no-such-file-%i' %
+                            (os.getpid(),))
+        out = cStringIO.StringIO()
+        stderr = sys.stderr
+        sys.stderr = cStringIO.StringIO()
+        try:
+            status = aggregate.main([path], None, out)
+            error = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(status, 1)
+        self.assertTrue(error.startswith(path + ': '))
+        self.assertEqual(out.getvalue(), '')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for allocator module."""
+
+__version__ = '$Revision: #1 $'
+
+import random
+import unittest
+
+from aplib.net.allocator import AddressAllocator
+from aplib.net.exceptions import AllocatorFullError
+from aplib.net.ip import IP
+from aplib.net.range import IPGlob, IPRange, Prefix
+
+class Test(unittest.TestCase):
+
+    def test_allocate(self):
+        pool = AddressAllocator(Prefix('10.0.0.0/24'),
+                                reserved=[IPGlob('10.0.0.0-9')])
+        self.assertEqual(pool.available(), 246)
+        self.assertEqual(pool.allocate(), IP('10.0.0.10'))
+        self.assertEqual(pool.allocate_prefix(28), Prefix('10.0.0.16/28'))
+        self.assertEqual(pool.available(), 229)
+        self.assertFalse(pool.is_free(IP('10.0.0.10')))
+        self.assertFalse(pool.is_free(IP('10.0.0.20')))
+        self.assertTrue(pool.is_free(IP('10.0.0.11')))
+        self.assertFalse(pool.is_free(IP('10.0.1.11')))
+        pool.free(IP('10.0.0.10'))
+        self.assertTrue(pool.is_free(IP('10.0.0.10')))
+        self.assertRaises(ValueError, pool.free, IP('10.0.0.10'))
+        self.assertRaises(ValueError, pool.free, IP('10.0.1.10'))
+        pool.free(Prefix('10.0.0.16/28'))
+        self.assertEqual(pool.available(), 246)
+        # Everything but the reserved range can be allocated, one by one.
+        addresses = set()
+        for unused in xrange(246):
+            addresses.add(pool.allocate_int())
+        self.assertEqual(addresses, set(range(0x0a00000a, 0x0a000100)))
+        self.assertRaises(AllocatorFullError, pool.allocate)
+        self.assertEqual(pool.free_range_int(0x0a000000, 0x0a0000ff), 256)
+        self.assertEqual(pool.allocate_prefix(24), Prefix('10.0.0.0/24'))
+        self.assertRaises(ValueError, pool.allocate_prefix, 23)
+
+    def test_best_fit(self):
+        pool = AddressAllocator(Prefix('10.0.0.0/28'))
+        pool.reserve(IP('10.0.0.9'))
+        # The hole next to the reserved address is used before splitting the
+        # free /29.
+        self.assertEqual(pool.allocate(), IP('10.0.0.8'))
+        self.assertEqual(pool.allocate_prefix(30), Prefix('10.0.0.12/30'))
+        self.assertEqual(pool.allocate_prefix(29), Prefix('10.0.0.0/29'))
+        self.assertRaises(AllocatorFullError, pool.allocate_prefix, 30)
+        self.assertEqual(pool.allocate_prefix(31), Prefix('10.0.0.10/31'))
+        self.assertEqual(pool.available(), 0)
+
+    def test_unaligned_range(self):
+        pool = AddressAllocator(IPRange(IP('10.0.0.5'), IP('10.0.0.12')))
+        self.assertEqual(pool.available(), 8)
+        self.assertEqual(pool.allocate_prefix(30), Prefix('10.0.0.8/30'))
+        self.assertRaises(AllocatorFullError, pool.allocate_prefix, 30)
+        self.assertEqual(sorted(pool.allocate_int() for i in xrange(4)),
+                         [0x0a000005, 0x0a000006, 0x0a000007, 0x0a00000c])
+        self.assertRaises(AllocatorFullError, pool.allocate)
+        self.assertRaises(ValueError, pool.reserve, IP('10.0.0.4'))
+
+    def test_ipv6(self):
+        pool = AddressAllocator(Prefix('2001:db8::/64'),
+                                reserved=[Prefix('2001:db8::/65')])
+        self.assertEqual(pool.available(), 2 ** 63)
+        self.assertEqual(pool.allocate(), IP('2001:db8::8000:0:0:0'))
+        self.assertEqual(pool.allocate_prefix(96),
+                         Prefix('2001:db8::8000:1:0:0/96'))
+        self.assertRaises(AllocatorFullError, pool.allocate_prefix, 65)
+        self.assertEqual(pool.available(), 2 ** 63 - 1 - 2 ** 32)
+        # Only the partly used blocks are stored.
+        self.assertTrue(len(pool._nodes) < 200)
+
+    def test_random(self):
+        rand = random.Random(7)
+        pool = AddressAllocator(Prefix('192.168.0.0/22'))
+        allocated = set()
+        for unused in xrange(5000):
+            if allocated and rand.random() < 0.45:
+                value = rand.choice(list(allocated))
+                pool.free_int(value)
+                allocated.remove(value)
+            elif len(allocated) < 1024:
+                value = pool.allocate_int()
+                self.assertFalse(value in allocated)
+                allocated.add(value)
+            self.assertEqual(pool.available(), 1024 - len(allocated))
+        for value in xrange(0xc0a80000, 0xc0a80400):
+            self.assertEqual(pool.is_free_int(value), value not in allocated)
+
+if __name__ == '__main__':
+    unittest.main()
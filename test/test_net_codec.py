@@ -0,0 +1,183 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for codec module."""
+
+__version__ = '$Revision: #1 $'
+
+import copy
+import cPickle
+import mmap
+import pickle
+import unittest
+
+from aplib.net import _net
+from aplib.net.codec import (encode_ip, decode_ip, encode_ips, decode_ips,
+                             encode_mask, decode_mask, encode_range,
+                             decode_range)
+from aplib.net.exceptions import IPValidationError, MaskValidationError
+from aplib.net.ip import IP, IPv4, IPv6
+from aplib.net.mask import Mask4, Mask6
+from aplib.net.range import IPRange, Prefix, IPGlob
+
+class MyIPv4(IPv4):
+    pass
+
+class MyIPv6(IPv6):
+    __slots__ = ()
+
+class MyPrefix(Prefix):
+    __slots__ = ()
+
+class MyMask4(Mask4):
+    pass
+
+class Plain(object):
+
+    def __init__(self, value):
+        self.value = value
+
+ips = [IP('0.0.0.0'), IP('1.2.3.4/24'), IP('255.255.255.255'),
+       IP('0.0.0.0/0'), IP('::'), IP('::/0'), IP('2001:db8::1/64'),
+       IP('ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff')]
+
+class Test(unittest.TestCase):
+
+    def test_ip(self):
+        self.assertEqual(encode_ip(IP('1.2.3.4/24')), '\x18\x01\x02\x03\x04')
+        self.assertEqual(encode_ip(IP('::1')),
+                         '\xc0' + '\x00' * 15 + '\x01')
+        for ip in ips:
+            data = encode_ip(ip)
+            self.assertEqual(len(data), 5 if ip.version == 4 else 17)
+            result = decode_ip(data)
+            self.assertEqual(result, ip)
+            self.assertEqual(result.__class__, ip.__class__)
+            self.assertEqual(result.netmask_int, ip.netmask_int)
+
+        self.assertRaises(IPValidationError, decode_ip, '')
+        self.assertRaises(IPValidationError, decode_ip, '\x21\x01\x02\x03\x04')
+        self.assertRaises(IPValidationError, decode_ip, '\x18\x01\x02\x03')
+        self.assertRaises(IPValidationError, decode_ip, '\x18\x01\x02\x03\x04\x05')
+        self.assertRaises(ValueError, _net.pack_ip, 5, 1, 0)
+        self.assertRaises(ValueError, _net.pack_ip, 4, 1, 33)
+        self.assertRaises(OverflowError, _net.pack_ip, 4, 2**32, 32)
+        self.assertRaises(OverflowError, _net.pack_ip, 6, 2**128, 128)
+
+    def test_unpack_offset(self):
+        data = encode_ips(ips)
+        offset = 0
+        for ip in ips:
+            version, value, prefixlen, offset = _net.unpack_ip(data, offset)
+            self.assertEqual((version, value, prefixlen),
+                             (ip.version, ip.ip, ip.prefixlen))
+        self.assertEqual(offset, len(data))
+
+    def test_many(self):
+        data = encode_ips(ips)
+        self.assertEqual(decode_ips(data), ips)
+        self.assertEqual(decode_ips(bytearray(data)), ips)
+        m = mmap.mmap(-1, len(data))
+        m.write(data)
+        self.assertEqual(decode_ips(m), ips)
+        self.assertEqual(decode_ips(''), [])
+        self.assertRaises(IPValidationError, decode_ips, data[:-1])
+
+    def test_mask(self):
+        for mask in (Mask4('255.255.255.0'), Mask4(0xff), Mask4('/8'),
+                     Mask6('/64'), Mask6(0xff)):
+            result = decode_mask(encode_mask(mask))
+            self.assertEqual(result, mask)
+            self.assertEqual(result.format(), mask.format())
+        self.assertRaises(MaskValidationError, decode_mask, '\x05\x00\x00\x00\x00')
+
+    def test_range(self):
+        for r in (Prefix('1.2.3.0/24'), Prefix('2001:db8::/32'),
+                  IPRange(IPv4('1.2.3.4'), IPv4('1.2.3.9')),
+                  IPRange(IPv6('::1'), IPv6('::5')), IPGlob('10.1-3.*')):
+            result = decode_range(encode_range(r), r.__class__)
+            self.assertEqual(result, r)
+            self.assertEqual(result.__class__, r.__class__)
+        self.assertEqual(len(encode_range(Prefix('1.2.3.0/24'))), 5)
+        self.assertRaises(IPValidationError, decode_range,
+                          encode_ips([IPv4(1), IPv6(2)]))
+
+    def test_pickle(self):
+        objects = ips + [Mask4('255.255.0.0'), Mask6('/48'),
+                         Prefix('1.2.3.0/24'), IPGlob('1.2.*'),
+                         IPRange(IPv6('::1'), IPv6('::5'))]
+        for module in (pickle, cPickle):
+            for protocol in (0, 1, 2):
+                data = module.dumps(objects, protocol)
+                result = module.loads(data)
+                self.assertEqual(result, objects)
+                self.assertEqual([x.__class__ for x in result],
+                                 [x.__class__ for x in objects])
+
+        # Much smaller than pickling the attributes.
+        many = [IPv4(i) for i in xrange(1000)]
+        self.assertTrue(len(cPickle.dumps(many, 2)) < 17 * 1000)
+
+    def test_subclass(self):
+        ip = MyIPv4('1.2.3.4/24')
+        ip.note = 'x'
+        objects = [ip, MyIPv6('2001:db8::1/64'), MyPrefix('10.0.0.0/8'),
+                   MyMask4('255.255.0.0')]
+        copies = [copy.copy, copy.deepcopy]
+        for module in (pickle, cPickle):
+            for protocol in (0, 1, 2):
+                copies.append(lambda x, module=module, protocol=protocol:
+                              module.loads(module.dumps(x, protocol)))
+        for function in copies:
+            for obj in objects:
+                result = function(obj)
+                self.assertEqual(result, obj)
+                self.assertTrue(result.__class__ is obj.__class__)
+            self.assertEqual(function(ip).note, 'x')
+            self.assertEqual(function(ip).netmask, ip.netmask)
+        self.assertRaises(MaskValidationError, decode_mask,
+                          encode_mask(Mask6('/48')), MyMask4)
+
+    def test_old_pickle(self):
+        # Pickles made through decode_ip still load.
+        self.assertEqual(
+            cPickle.loads("\x80\x02caplib.net.codec\ndecode_ip\n"
+                          "U\x05\x18\x01\x02\x03\x04\x85R."),
+            IP('1.2.3.4/24'))
+        # Pickles made with __getstate__ still load.
+        data = ("\x80\x02caplib.net.ip\nIPv4\n)\x81(I16909060\nI24\n"
+                "L4294967040L\ntb.")
+        self.assertEqual(pickle.loads(data), IP('1.2.3.4/24'))
+        # So do the protocol 0 and 1 pickles that used copy_reg.
+        data = ("ccopy_reg\n_reconstructor\np0\n(caplib.net.ip\nIPv4\n"
+                "p1\nc__builtin__\nobject\np2\nNtp3\nRp4\n(I16909060\n"
+                "I24\nL4294967040L\ntp5\nb.")
+        for module in (pickle, cPickle):
+            self.assertEqual(module.loads(data), IP('1.2.3.4/24'))
+        data = ("ccopy_reg\n_reconstructor\nq\x00(caplib.net.ip\nIPv6\n"
+                "q\x01c__builtin__\nobject\nq\x02Ntq\x03Rq\x04(L1L\n"
+                "K@L340282366920938463444927863358058659840L\ntq\x05b.")
+        for module in (pickle, cPickle):
+            self.assertEqual(module.loads(data), IP('::1/64'))
+        # Other objects still pickle through the original reconstructor.
+        self.assertEqual(cPickle.loads(cPickle.dumps(Plain(1), 0)).value, 1)
+
+if __name__ == '__main__':
+    unittest.main()
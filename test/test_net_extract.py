@@ -0,0 +1,105 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for extract module."""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import mmap
+import os
+import tempfile
+import unittest
+
+from aplib.net import _net
+from aplib.net.extract import (extract_ipv4, extract_ipv6, extract_parallel,
+                               split_lines)
+from aplib.net.ip import IP
+from aplib.net.lookup import RangeLookup
+from aplib.net.range import Prefix
+from aplib.net import special
+
+LOG = """\
+Oct 19 10:00:01 mx1 smtpd: connect from mail.example.com[192.0.2.1]:25
+Oct 19 10:00:02 mx1 smtpd: connect from unknown[2001:db8::25]
+Oct 19 10:00:03 mx1 smtpd: client=host10.0.0.1 version 1.2.3.4.5 at 12:34:56
+Oct 19 10:00:04 mx1 smtpd: relay 10.1.2.3, mapped ::ffff:198.51.100.7.
+Oct 19 10:00:05 mx1 smtpd: bogus 256.1.1.1 and fe80::1%em0 and ::
+Oct 19 10:00:06 mx1 smtpd: last 255.255.255.255."""
+
+V4 = ['192.0.2.1', '10.1.2.3', '255.255.255.255']
+V6 = ['2001:db8::25', '::ffff:198.51.100.7', 'fe80::1']
+
+class Test(unittest.TestCase):
+
+    def test_extract(self):
+        self.assertEqual(list(extract_ipv4(LOG)), [IP(ip).ip for ip in V4])
+        self.assertEqual(extract_ipv6(LOG), [IP(ip).ip for ip in V6])
+        start = LOG.index('Oct 19 10:00:04')
+        self.assertEqual(list(extract_ipv4(LOG, start, start + 60)),
+                         [IP('10.1.2.3').ip])
+        self.assertEqual(list(extract_ipv4('')), [])
+        self.assertEqual(extract_ipv6('', 0, 0), [])
+        self.assertRaises(ValueError, extract_ipv4, LOG, 10, 5)
+
+    def test_split_lines(self):
+        for count in (1, 2, 3, 6, 100):
+            chunks = split_lines(LOG, count)
+            self.assertTrue(len(chunks) <= count)
+            self.assertEqual(''.join(LOG[s:e] for s, e in chunks), LOG)
+            for start, end in chunks[:-1]:
+                self.assertEqual(LOG[end - 1], '\n')
+        self.assertEqual(split_lines('', 4), [(0, 0)])
+
+    def test_parallel(self):
+        data = LOG * 50
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, data)
+            os.close(fd)
+            f = open(path, 'rb')
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for threads in (1, 3, 8):
+                    self.assertEqual(extract_parallel(m, 4, threads),
+                                     extract_ipv4(data))
+                    self.assertEqual(extract_parallel(m, 6, threads),
+                                     extract_ipv6(data))
+            finally:
+                m.close()
+                f.close()
+        finally:
+            os.unlink(path)
+
+    def test_buffer_lookups(self):
+        addresses = extract_ipv4(LOG)
+        self.assertEqual(list(special.classify_ipv4_array(addresses)),
+                         [IP(ip).classify() for ip in V4])
+        table = RangeLookup([Prefix('10.0.0.0/8'), IP('255.255.255.255')])
+        self.assertEqual(list(table.contains_ipv4_array(addresses)),
+                         [0, 1, 1])
+        self.assertEqual(list(table.contains_ipv4_array(array.array('I'))),
+                         [])
+        self.assertEqual(_net.format_ipv4_buffer(addresses, ' '),
+                         ' '.join(V4))
+        self.assertRaises(ValueError, _net.format_ipv4_buffer, 'abc')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,8 +22,13 @@
 
 __version__ = '$Revision: #8 $'
 
+import os
+import subprocess
+import sys
 import unittest
 
+import aplib.net.ip
+from aplib.net import _net
 from aplib.net.ip import (IP, IPv4, IPv6,
                           IPValidationError, MaskValidationError,
                           Mask4, Mask6, htop, ptoh, is_ip, is_ipv4, is_ipv6, is_cidr
@@ -261,6 +266,42 @@ class Test(unittest.TestCase):
         self.assertEqual(IPv6('1:2:3:4:5:6:7:8').format(always_prefix=True), '1:2:3:4:5:6:7:8/128')
         self.assertEqual(IPv6('1:2:3:4:5:6:7:8/127').format(), '1:2:3:4:5:6:7:8/127')
 
+    def test_format_fixed_width(self):
+        self.assertEqual(IPv4('1.2.3.4').format(fixed_width=True),
+                         '001.002.003.004')
+        self.assertEqual(IPv4('10.0.0.0/8').format(fixed_width=True),
+                         '010.000.000.000/8')
+        self.assertEqual(IPv6('2001:db8::1').format(fixed_width=True),
+                         '2001:0db8:0000:0000:0000:0000:0000:0001')
+        self.assertEqual(IPv6('::/0').format(True, True),
+                         '0000:0000:0000:0000:0000:0000:0000:0000/0')
+        for ip in valid_ips + valid_v4_cidrs + valid_v6_cidrs:
+            self.assertEqual(IP(IP(ip).format(fixed_width=True)), IP(ip))
+
+    def test_format_many(self):
+        ips = [IP(ip) for ip in valid_ips + valid_v4_cidrs + valid_v6_cidrs]
+        for version in (4, 6):
+            same = [ip for ip in ips if ip.version == version]
+            values = [ip.ip for ip in same]
+            prefixlens = [ip.prefixlen for ip in same]
+            self.assertEqual(_net.format_many(values, version),
+                             '\n'.join(ip.int_to_str(ip.ip) for ip in same))
+            self.assertEqual(
+                _net.format_many(values, version, ', ', True, prefixlens),
+                ', '.join(ip.format(True) for ip in same))
+            self.assertEqual(
+                _net.format_many(values, version, '', False, prefixlens, True),
+                ''.join(ip.format(fixed_width=True) for ip in same))
+            # Fixed width output sorts in address order.
+            text = _net.format_many(sorted(values), version, fixed_width=True)
+            self.assertEqual(text.split('\n'), sorted(text.split('\n')))
+        self.assertEqual(_net.format_many([], 4), '')
+        self.assertRaises(OverflowError, _net.format_many, [2**32], 4)
+        self.assertRaises(OverflowError, _net.format_many, [-1], 6)
+        self.assertRaises(ValueError, _net.format_many, [1], 4, '', False,
+                          [33])
+        self.assertRaises(ValueError, _net.format_many, [1], 4, '', False, [])
+
     def test_network(self):
         self.assertEqual(IPv4('1.2.3.4/32').network, Prefix('1.2.3.4/32'))
         self.assertEqual(IPv4('1.2.3.4/24').network, Prefix('1.2.3.0/24'))
@@ -547,5 +588,45 @@ class Test(unittest.TestCase):
         for ip in valid_cidrs:
             self.assertEqual(IP(ip), pickle.loads(pickle.dumps(IP(ip))))
 
+    def test_hash(self):
+        values = [IP(ip) for ip in valid_ips + valid_v4_cidrs + valid_v6_cidrs]
+        for ip in values:
+            self.assertEqual(hash(ip), hash(IP(str(ip))))
+        self.assertEqual(len(set(values)), len(set(map(str, values))))
+        self.assertNotEqual(hash(IPv4('0.0.0.1')), hash(IPv6('::1')))
+        self.assertNotEqual(hash(IPv4('1.2.3.4')), hash(IPv4('1.2.3.4/24')))
+
+    def test_cached_properties(self):
+        ip = IPv4('1.2.3.4/24')
+        if aplib.net.ip._IPCore is not aplib.net.ip._PyIPCore:
+            self.assertTrue(ip.network is ip.network)
+            self.assertTrue(ip.broadcast is ip.broadcast)
+        self.assertEqual(ip.network, Prefix('1.2.3.0/24'))
+        # Resetting a field (as the unpickling code does) clears the cache.
+        ip.prefixlen = 16
+        ip._netmask = 0xffff0000
+        self.assertEqual(ip.network, Prefix('1.2.0.0/16'))
+        self.assertEqual(ip.broadcast, IPv4('1.2.255.255'))
+
+    def test_pure_python(self):
+        # Run the tests again without the C extension.
+        code = ("import sys, unittest\n"
+                "sys.modules['aplib.net._ip'] = None\n"
+                "import aplib.net.ip\n"
+                "assert aplib.net.ip._IPCore is aplib.net.ip._PyIPCore\n"
+                "tests = unittest.defaultTestLoader.loadTestsFromNames(\n"
+                "    ['test_net_ip', 'test_net_codec', 'test_net_range'])\n"
+                "result = unittest.TextTestRunner().run(tests)\n"
+                "sys.exit(not result.wasSuccessful())\n")
+        if aplib.net.ip._IPCore is aplib.net.ip._PyIPCore:
+            # Already running without it.
+            return
+        process = subprocess.Popen([sys.executable, '-c', code],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,117 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for iparray module."""
+
+__version__ = '$Revision: #1 $'
+
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from aplib.net.exceptions import IPValidationError, MaskValidationError
+from aplib.net.ip import IP
+from aplib.net.range import IPGlob, Prefix
+
+if numpy is not None:
+    from aplib.net import iparray
+
+ips4 = ['0.0.0.0', '1.2.3.4', '10.20.30.40', '127.0.0.1', '192.0.2.255',
+        '224.1.2.3', '255.255.255.255']
+ips6 = ['::', '::1', '2001:db8::1', 'fe80::1234:5678', '::ffff:1.2.3.4',
+        '8000::', 'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff']
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        if numpy is None:
+            self.skipTest('numpy is not installed')
+
+    def test_conversion(self):
+        for version, ips in ((4, ips4), (6, ips6)):
+            arr = iparray.from_strings(ips, version)
+            self.assertEqual(len(arr), len(ips))
+            self.assertEqual(iparray.to_ints(arr, version),
+                             [IP(ip).ip for ip in ips])
+            self.assertEqual(iparray.to_strings(arr, version),
+                             [str(IP(ip)) for ip in ips])
+            self.assertEqual(iparray.to_ints(
+                iparray.from_ints([IP(ip).ip for ip in ips], version),
+                version), [IP(ip).ip for ip in ips])
+        self.assertEqual(iparray.from_strings([], 6).dtype, iparray.IPV6_DTYPE)
+        self.assertRaises(IPValidationError, iparray.from_strings,
+                          ['1.2.3.4/24'], 4)
+        self.assertRaises(IPValidationError, iparray.from_strings, ['::1'], 4)
+        self.assertRaises(IPValidationError, iparray.from_strings, ['x'], 6)
+
+        arr, prefixlens = iparray.from_cidr_strings(['1.2.3.4/24', '5.6.7.8'],
+                                                    4)
+        self.assertEqual(arr.tolist(), [0x01020304, 0x05060708])
+        self.assertEqual(prefixlens.tolist(), [24, 32])
+        arr, prefixlens = iparray.from_cidr_strings(['2001:db8::1/32'], 6)
+        self.assertEqual(iparray.to_ints(arr, 6), [IP('2001:db8::1').ip])
+        self.assertEqual(prefixlens.tolist(), [32])
+
+    def test_masking(self):
+        for version, ips, width in ((4, ips4, 32), (6, ips6, 128)):
+            arr = iparray.from_strings(ips, version)
+            for prefixlen in (0, 1, 8, 31, width - 1, width):
+                objects = [IP('%s/%i' % (ip, prefixlen)) for ip in ips]
+                networks = iparray.apply_netmask(arr, version, prefixlen)
+                self.assertEqual(iparray.to_ints(networks, version),
+                                 [ip.network.first.ip for ip in objects])
+                broadcasts = iparray.broadcast(arr, version, prefixlen)
+                self.assertEqual(iparray.to_ints(broadcasts, version),
+                                 [ip.broadcast.ip for ip in objects])
+            # One prefix length per address.
+            prefixlens = numpy.arange(len(ips)) * (width // 8)
+            networks = iparray.apply_netmask(arr, version, prefixlens)
+            self.assertEqual(iparray.to_ints(networks, version),
+                             [IP('%s/%i' % (ip, p)).network.first.ip
+                              for ip, p in zip(ips, prefixlens)])
+            self.assertRaises(MaskValidationError, iparray.apply_netmask,
+                              arr, version, width + 1)
+            self.assertRaises(MaskValidationError, iparray.broadcast,
+                              arr, version, -1)
+
+    def test_classify(self):
+        for version, ips in ((4, ips4), (6, ips6)):
+            arr = iparray.from_strings(ips, version)
+            self.assertEqual(iparray.classify(arr, version).tolist(),
+                             [IP(ip).classify() for ip in ips])
+
+    def test_contains(self):
+        ranges = [Prefix('10.0.0.0/8'), IPGlob('192.0.2.*'), IP('1.2.3.4'),
+                  Prefix('2001:db8::/32'), Prefix('::/127')]
+        expected = {4: [False, True, True, False, True, False, False],
+                    6: [True, True, True, False, False, False, False]}
+        for version, ips in ((4, ips4), (6, ips6)):
+            arr = iparray.from_strings(ips, version)
+            self.assertEqual(iparray.contains(arr, version, ranges).tolist(),
+                             expected[version])
+        arr = iparray.from_strings(ips4, 4)
+        self.assertEqual(iparray.contains(arr, 4, []).tolist(),
+                         [False] * len(ips4))
+
+if __name__ == '__main__':
+    unittest.main()
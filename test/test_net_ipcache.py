@@ -0,0 +1,117 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for ipcache module."""
+
+__version__ = '$Revision: #1 $'
+
+import unittest
+
+from aplib.net.ip import IP
+from aplib.net.ipcache import IPCache, CACHE_STATE
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_hit_miss(self):
+        cache = IPCache(10, ttl=60, clock=self.clock)
+        ip = IP('1.2.3.4')
+        self.assertEqual(cache.lookup(ip), (CACHE_STATE.MISS, None))
+        cache.set(ip, 'listed')
+        self.assertEqual(cache.lookup(ip), (CACHE_STATE.HIT, 'listed'))
+        self.assertEqual(cache.get_int(4, 0x01020304), 'listed')
+        # Same integer, different version.
+        self.assertEqual(cache.get_int(6, 0x01020304, 'x'), 'x')
+        self.assertEqual(cache.get(IP('::1.2.3.4')), None)
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 3)
+
+        self.clock.now += 61
+        self.assertEqual(cache.lookup(ip), (CACHE_STATE.MISS, None))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.expirations, 1)
+
+    def test_negative_ttl(self):
+        cache = IPCache(10, ttl=60, negative_ttl=5, clock=self.clock)
+        cache.set_int(4, 1, 'listed')
+        cache.set_int(4, 2, None, negative=True)
+        cache.set_int(4, 3, 'x', ttl=1)
+        self.clock.now += 2
+        self.assertEqual(cache.lookup_int(4, 3)[0], CACHE_STATE.MISS)
+        self.assertEqual(cache.lookup_int(4, 2)[0], CACHE_STATE.HIT)
+        self.clock.now += 4
+        self.assertEqual(cache.lookup_int(4, 2)[0], CACHE_STATE.MISS)
+        self.assertEqual(cache.lookup_int(4, 1)[0], CACHE_STATE.HIT)
+
+    def test_stale(self):
+        cache = IPCache(10, ttl=10, stale_ttl=5, clock=self.clock)
+        cache.set_int(6, 1, 'old')
+        self.clock.now += 11
+        self.assertEqual(cache.lookup_int(6, 1), (CACHE_STATE.REFRESH, 'old'))
+        self.assertEqual(cache.lookup_int(6, 1), (CACHE_STATE.STALE, 'old'))
+        cache.refresh_failed_int(6, 1)
+        self.assertEqual(cache.lookup_int(6, 1), (CACHE_STATE.REFRESH, 'old'))
+        cache.set_int(6, 1, 'new')
+        self.assertEqual(cache.lookup_int(6, 1), (CACHE_STATE.HIT, 'new'))
+        self.clock.now += 16
+        self.assertEqual(cache.lookup_int(6, 1), (CACHE_STATE.MISS, None))
+        self.assertEqual(cache.stale_hits, 3)
+
+    def test_lru(self):
+        cache = IPCache(3, ttl=60, clock=self.clock)
+        for i in xrange(3):
+            cache.set_int(4, i, i)
+        # Touch 0 so that 1 is the least recently used.
+        cache.get_int(4, 0)
+        cache.set_int(4, 3, 3)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.get_int(4, 1), None)
+        self.assertEqual(cache.get_int(4, 0), 0)
+        self.assertTrue(cache.delete_int(4, 0))
+        self.assertFalse(cache.delete_int(4, 0))
+        self.assertEqual(len(cache), 2)
+
+    def test_expire(self):
+        cache = IPCache(1000, ttl=10, clock=self.clock)
+        for i in xrange(100):
+            cache.set_int(4, i, i, ttl=i + 1)
+        # Overwriting leaves dead items in the heap.
+        for i in xrange(50):
+            cache.set_int(4, i, i, ttl=100)
+        self.clock.now += 60
+        self.assertEqual(cache.expire(), 10)
+        self.assertEqual(len(cache), 90)
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 90)
+        self.assertEqual(stats['expirations'], 10)
+
+if __name__ == '__main__':
+    unittest.main()
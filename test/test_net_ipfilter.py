@@ -0,0 +1,147 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for ipfilter module."""
+
+__version__ = '$Revision: #1 $'
+
+import os
+import tempfile
+import unittest
+
+from aplib.net.exceptions import FilterFormatError, FilterFullError
+from aplib.net.ip import IP, IPv4, IPv6
+from aplib.net.ipfilter import BloomFilter, PrefixBloomFilter, CuckooFilter
+from aplib.net.range import Prefix
+
+members = [IPv4(0x0a000000 + i * 7) for i in xrange(500)] + \
+          [IPv6(0x20010db8 << 96 | i * 13) for i in xrange(500)]
+others = [IPv4(0x0b000000 + i) for i in xrange(2000)] + \
+         [IPv6(0x20010db9 << 96 | i) for i in xrange(2000)]
+
+class Test(unittest.TestCase):
+
+    def _check_filter(self, f, error_rate):
+        for ip in members:
+            self.assertTrue(ip in f)
+            self.assertTrue(f.contains_int(ip.version, ip.ip))
+        false_positives = len([ip for ip in others if ip in f])
+        self.assertTrue(false_positives <= len(others) * error_rate * 3,
+                        false_positives)
+
+    def _roundtrip(self, f, cls):
+        data = f.tostring()
+        copy = cls.fromstring(data)
+        self.assertEqual(copy.tostring(), data)
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, data)
+            os.close(fd)
+            fileobj = open(path, 'rb')
+            try:
+                mapped = cls.mmap(fileobj)
+                for ip in members:
+                    self.assertTrue(ip in mapped)
+                self.assertRaises(TypeError, mapped.add, members[0])
+            finally:
+                fileobj.close()
+        finally:
+            os.unlink(path)
+        return copy
+
+    def test_bloom(self):
+        f = BloomFilter.from_ips(members, error_rate=0.01)
+        self.assertEqual(len(f), len(members))
+        self._check_filter(f, 0.01)
+        copy = self._roundtrip(f, BloomFilter)
+        self._check_filter(copy, 0.01)
+        # Prefix lengths are ignored.
+        self.assertTrue(IP('10.0.0.7/24') in f)
+
+    def test_bloom_size(self):
+        f = BloomFilter(1000000, error_rate=0.001)
+        self.assertTrue(f.nbits / 8 < 2 * 1024 * 1024)
+        self.assertEqual(f.nhashes, 10)
+
+    def test_bad_data(self):
+        data = BloomFilter.from_ips(members).tostring()
+        self.assertRaises(FilterFormatError, BloomFilter.fromstring, '')
+        self.assertRaises(FilterFormatError, BloomFilter.fromstring,
+                          'XXXX' + data[4:])
+        self.assertRaises(FilterFormatError, BloomFilter.fromstring,
+                          data[:-1])
+        # Version 1 filters hashed differently.
+        self.assertRaises(FilterFormatError, BloomFilter.fromstring,
+                          data[:4] + '\x01' + data[5:])
+        self.assertRaises(FilterFormatError, CuckooFilter.fromstring, data)
+        self.assertRaises(FilterFormatError, PrefixBloomFilter.fromstring,
+                          data)
+
+    def test_prefix_bloom(self):
+        prefixes = [Prefix('10.1.0.0/16'), Prefix('192.168.5.0/24'),
+                    Prefix('2001:db8::/32'), IP('1.2.3.4/8')]
+        f = PrefixBloomFilter.from_prefixes(prefixes, error_rate=0.001)
+        self.assertEqual(f.prefixlens(4), [24, 16, 8])
+        self.assertEqual(f.prefixlens(6), [32])
+        self.assertTrue(IP('10.1.200.3') in f)
+        self.assertTrue(IP('192.168.5.255') in f)
+        self.assertTrue(IP('1.255.0.1') in f)
+        self.assertTrue(IP('2001:db8:1::5') in f)
+        self.assertFalse(IP('10.2.0.1') in f)
+        self.assertFalse(IP('2001:db9::1') in f)
+
+        copy = PrefixBloomFilter.fromstring(f.tostring())
+        self.assertEqual(copy.prefixlens(4), [24, 16, 8])
+        self.assertTrue(IP('10.1.200.3') in copy)
+        self.assertFalse(IP('2001:db9::1') in copy)
+
+    def test_cuckoo(self):
+        f = CuckooFilter.from_ips(members, error_rate=0.001)
+        self.assertEqual(f.fingerprint_bits, 16)
+        self._check_filter(f, 0.001)
+        copy = self._roundtrip(f, CuckooFilter)
+        self._check_filter(copy, 0.001)
+
+        for ip in members[::2]:
+            self.assertTrue(f.remove(ip))
+        self.assertEqual(len(f), len(members) / 2)
+        for ip in members[1::2]:
+            self.assertTrue(ip in f)
+        self.assertTrue(len([ip for ip in members[::2] if ip in f]) < 5)
+        self.assertFalse(f.remove(IP('11.0.0.1')))
+
+    def test_cuckoo_full(self):
+        f = CuckooFilter(8, error_rate=0.1)
+        added = []
+        try:
+            for i in xrange(100):
+                f.add_int(4, i)
+                added.append(i)
+        except FilterFullError:
+            pass
+        self.assertTrue(len(added) >= 8)
+        self.assertTrue(len(added) < 100)
+        self.assertRaises(FilterFullError, f.add_int, 4, 1000)
+        # Nothing that was added is lost, including the displaced item.
+        for i in added:
+            self.assertTrue(f.contains_int(4, i))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for iplist module."""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import os
+import tempfile
+import unittest
+
+from aplib.net import _net
+from aplib.net.exceptions import IPListFormatError
+from aplib.net.ip import IP, IPv4
+from aplib.net.iplist import IPList, IPListWriter, dumps
+from aplib.net.range import Prefix
+
+class Test(unittest.TestCase):
+
+    def test_deltas(self):
+        values = [0, 1, 127, 128, 2**32 - 1]
+        data = _net.encode_deltas(4, values)
+        self.assertEqual(data, '\x00\x01\x7e\x01\xff\xfe\xff\xff\x0f')
+        self.assertEqual(_net.decode_deltas(data, 4, 5),
+                         (values, None, len(data)))
+
+        values = [5, 2**64 - 1, 2**64, 2**128 - 1]
+        prefixlens = [128, 0, 64, 65]
+        data = _net.encode_deltas(6, values, 5, prefixlens)
+        self.assertEqual(_net.decode_deltas(data, 6, 4, 5, True),
+                         (values, prefixlens, len(data)))
+
+        self.assertRaises(ValueError, _net.encode_deltas, 4, [2, 1])
+        self.assertRaises(ValueError, _net.encode_deltas, 4, [1], 2)
+        self.assertRaises(ValueError, _net.encode_deltas, 4, [1], 0, [33])
+        self.assertRaises(OverflowError, _net.encode_deltas, 4, [2**32])
+        self.assertRaises(ValueError, _net.decode_deltas, data, 6, 5, 5, True)
+        self.assertRaises(ValueError, _net.decode_deltas,
+                          '\xff\xff\xff\xff\x7f', 4, 1)
+
+    def test_addresses(self):
+        ips = [IPv4(i * 3) for i in xrange(1000)]
+        data = dumps(ips, 4, block_size=64)
+        self.assertTrue(len(data) < 1500 + 16 * 8)
+        iplist = IPList(data)
+        self.assertEqual(len(iplist), 1000)
+        self.assertEqual(list(iplist), [ip.ip for ip in ips])
+        self.assertEqual(iplist[0], 0)
+        self.assertEqual(iplist[500], 1500)
+        self.assertEqual(iplist[-1], 2997)
+        self.assertRaises(IndexError, iplist.__getitem__, 1000)
+        self.assertTrue(IP('0.0.11.181') in iplist)
+        self.assertFalse(IP('0.0.11.182') in iplist)
+        self.assertFalse(IP('::3') in iplist)
+        self.assertTrue(iplist.contains_int(63 * 3))
+        self.assertTrue(iplist.contains_int(64 * 3))
+        self.assertFalse(iplist.contains_int(3000))
+        self.assertEqual(iplist.to_array(), array.array('I', list(iplist)))
+        self.assertTrue(IP('0.0.0.3') in iplist.to_lookup())
+        self.assertFalse(IP('0.0.0.4') in iplist.to_lookup())
+
+    def test_prefixes(self):
+        prefixes = sorted([Prefix('10.0.0.0/8'), Prefix('10.1.0.0/16'),
+                           Prefix('2001:db8::/32'), Prefix('::/0'),
+                           Prefix('2001:db8::/48'), Prefix('ffff::/16')])
+        prefixes = [p for p in prefixes if p.first.version == 6]
+        data = dumps(prefixes, 6, prefixes=True, block_size=2)
+        iplist = IPList(data)
+        self.assertEqual(iplist.version, 6)
+        self.assertTrue(iplist.prefixes)
+        self.assertEqual(list(iplist), [(p.first.ip, p.prefixlen)
+                                        for p in prefixes])
+        self.assertEqual(iplist[3], (0xffff << 112, 16))
+        self.assertRaises(TypeError, iplist.contains_int, 1)
+        table = iplist.to_lookup()
+        self.assertEqual(table.ranges(6), [(0, 2**128 - 1)])
+
+    def test_writer(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            fileobj = os.fdopen(fd, 'wb')
+            writer = IPListWriter(fileobj, 4, prefixes=True, block_size=3)
+            writer.add(0x0a000000, 8)
+            writer.add(0x0a000000, 24)
+            writer.add_object(IP('10.1.2.3/16'))
+            writer.add_object(Prefix('10.2.0.0/16'))
+            self.assertRaises(ValueError, writer.add, 1, 8)
+            self.assertRaises(ValueError, writer.add, 0x0b000000)
+            self.assertRaises(ValueError, writer.add_object, IP('::1'))
+            writer.close()
+            fileobj.close()
+
+            iplist = IPList.open(path)
+            self.assertEqual(list(iplist), [(0x0a000000, 8), (0x0a000000, 24),
+                                            (0x0a010203, 16),
+                                            (0x0a020000, 16)])
+            self.assertTrue(IP('10.200.0.0') in iplist.to_lookup())
+        finally:
+            os.unlink(path)
+
+    def test_empty(self):
+        iplist = IPList(dumps([], 4))
+        self.assertEqual(len(iplist), 0)
+        self.assertEqual(list(iplist), [])
+        self.assertFalse(iplist.contains_int(1))
+
+    def test_bad_data(self):
+        data = dumps([IPv4(1), IPv4(2)], 4)
+        self.assertRaises(IPListFormatError, IPList, '')
+        self.assertRaises(IPListFormatError, IPList, 'XXXX' + data[4:])
+        self.assertRaises(IPListFormatError, IPList, data[:-1])
+        self.assertRaises(IPListFormatError, IPList, data[:12] + data[14:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for loader module."""
+
+__version__ = '$Revision: #1 $'
+
+import cStringIO
+import mmap
+import os
+import tempfile
+import unittest
+
+from aplib.net.exceptions import IPValidationError
+from aplib.net.loader import RangeLoader, parse_line
+from aplib.net.range import IPGlob, Prefix
+
+DATA = """\
+# Customer allowlist
+1.2.3.0/24
+1.2.3.4/24
+1.2.3.4-1.2.3.9
+10.1-3.*
+  8.8.8.8   # resolver
+
+not an address
+2001:db8::1/32
+::1 - ::5\r
+1.2.3.9-1.2.3.4
+1.2.
+300.1.2.3
+"""
+
+EXPECTED = [(4, 0x01020300, 0x010203ff),
+            (4, 0x01020300, 0x010203ff),
+            (4, 0x01020304, 0x01020309),
+            (4, 0x0a010000, 0x0a03ffff),
+            (4, 0x08080808, 0x08080808),
+            (6, 0x20010db8 << 96, (0x20010db8 << 96) | ((1 << 96) - 1)),
+            (6, 1, 5),
+            (4, 0x01020000, 0x0102ffff),
+           ]
+
+ERRORS = [(8, 'not an address'), (11, '1.2.3.9-1.2.3.4'), (13, '300.1.2.3')]
+
+class Test(unittest.TestCase):
+
+    def test_parse_line(self):
+        for glob in ('1', '1.2.3', '1.2-3', '1.2.3.0-10', '*', '001.2.3.4'):
+            first, last = IPGlob(glob).first, IPGlob(glob).last
+            self.assertEqual(parse_line(glob), (4, first.ip, last.ip))
+        prefix = Prefix('2001:db8::1234/100')
+        self.assertEqual(parse_line('2001:db8::1234/100'),
+                         (6, prefix.first.ip, prefix.last.ip))
+        self.assertEqual(parse_line('::/0'), (6, 0, 2**128 - 1))
+        self.assertEqual(parse_line('1.2.3.4/0'), (4, 0, 2**32 - 1))
+        for bad in ('1.2.3.4/33', '1.2.3.4-', '::1-1.2.3.4', '1..2', 'x',
+                    '1.2.3.4.5', '1.*.3.4', '::1/129'):
+            self.assertRaises(IPValidationError, parse_line, bad)
+
+    def test_load(self):
+        # A small chunk size exercises lines split across reads.
+        for chunk_size in (1, 7, 65536):
+            loader = RangeLoader(chunk_size)
+            self.assertEqual(list(loader.load(cStringIO.StringIO(DATA))),
+                             EXPECTED)
+            self.assertEqual(loader.errors, ERRORS)
+            self.assertEqual(loader.count, len(EXPECTED))
+
+        loader = RangeLoader()
+        self.assertEqual(list(loader.load_lines(DATA.splitlines())), EXPECTED)
+        self.assertEqual(loader.errors, ERRORS)
+
+    def test_load_file(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, DATA.rstrip('\n'))
+            os.close(fd)
+            loader = RangeLoader()
+            self.assertEqual(list(loader.load_file(path)), EXPECTED)
+            self.assertEqual(loader.errors, ERRORS)
+
+            f = open(path, 'rb')
+            try:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                loader = RangeLoader(16)
+                self.assertEqual(list(loader.load(m)), EXPECTED)
+                m.close()
+            finally:
+                f.close()
+        finally:
+            os.unlink(path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for logcount module."""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import multiprocessing.pool
+import os
+import shutil
+import tempfile
+import unittest
+
+from aplib.net import logcount
+from aplib.net.range import Prefix
+
+LOG = """\
+Oct 19 10:00:00 mx1 connect from 10.1.2.3 port 25
+Oct 19 10:00:01 mx1 connect from 10.1.2.3 port 25
+Oct 19 10:00:02 mx1 connect from 10.1.2.200 relay 192.168.7.7
+Oct 19 10:00:03 mx1 connect from 2001:db8::1 port 25
+Oct 19 10:00:04 mx1 connect from 2001:db8:0:1::1 port 25
+Oct 19 10:00:05 mx1 connect from 10.9.0.1 port 25
+"""
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'maillog')
+        f = open(self.path, 'wb')
+        f.write(LOG * 50)
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_split_file(self):
+        data = open(self.path, 'rb').read()
+        for chunk_size in (1, 10, 100, 1000, len(data), len(data) * 2):
+            chunks = logcount.split_file(self.path, chunk_size)
+            self.assertEqual(chunks[0][0], 0)
+            self.assertEqual(chunks[-1][1], len(data))
+            for (start, end), (next_start, unused) in zip(chunks,
+                                                          chunks[1:]):
+                self.assertEqual(end, next_start)
+                self.assertEqual(data[end - 1], '\n')
+        empty = os.path.join(self.dir, 'empty')
+        open(empty, 'wb').close()
+        self.assertEqual(logcount.split_file(empty), [])
+        self.assertRaises(ValueError, logcount.split_file, self.path, 0)
+
+    def test_shard(self):
+        shard = os.path.join(self.dir, 'shard')
+        self.assertEqual(logcount.count_chunk(self.path, 0, len(LOG), shard),
+                         7)
+        self.assertEqual(list(logcount.read_shard(shard, 4)),
+                         [(0x0a010203, 2), (0x0a0102c8, 1), (0x0a090001, 1),
+                          (0xc0a80707, 1)])
+        self.assertEqual(list(logcount.read_shard(shard, 6)),
+                         [(0x20010db8 << 96 | 1, 1),
+                          (0x20010db8 << 96 | 1 << 64 | 1, 1)])
+        logcount.count_chunk(self.path, 0, len(LOG), shard, (6,))
+        self.assertEqual(list(logcount.read_shard(shard, 4)), [])
+        self.assertEqual(len(list(logcount.read_shard(shard, 6))), 2)
+
+    def test_read_shard_blocks(self):
+        # Counts line up with addresses across the blocks of the list.
+        shard = os.path.join(self.dir, 'shard')
+        addresses = array.array('I', xrange(0, 30000, 3))
+        counts = array.array('I', xrange(1, 10001))
+        out = open(shard, 'wb')
+        logcount._write_section(out, 4, addresses, counts)
+        out.close()
+        self.assertEqual(list(logcount.read_shard(shard, 4)),
+                         zip(addresses, counts))
+        data = open(shard, 'rb').read()
+        out = open(shard, 'wb')
+        out.write(data[:-100])
+        out.close()
+        self.assertRaises(ValueError, list, logcount.read_shard(shard, 4))
+
+    def check_counts(self, counts, copies):
+        self.assertEqual(counts.records, {4: 5 * copies, 6: 2 * copies})
+        self.assertEqual(counts.addresses, {4: 4, 6: 2})
+        self.assertEqual(counts.prefixlens(4), [8, 24])
+        self.assertEqual(counts.get(Prefix('10.1.2.0/24')),
+                         (3 * copies, 2))
+        self.assertEqual(counts.get(Prefix('10.0.0.0/8')), (4 * copies, 3))
+        self.assertEqual(counts.get(Prefix('11.0.0.0/8')), (0, 0))
+        self.assertEqual(counts.items(4, 8),
+                         [(Prefix('10.0.0.0/8'), 4 * copies, 3),
+                          (Prefix('192.0.0.0/8'), copies, 1)])
+        self.assertEqual(counts.top(4, 24, 2),
+                         [(Prefix('10.1.2.0/24'), 3 * copies, 2),
+                          (Prefix('10.9.0.0/24'), copies, 1)])
+        self.assertEqual(counts.items(6, 48),
+                         [(Prefix('2001:db8::/48'), 2 * copies, 2)])
+        self.assertEqual(counts.top(6, 64, 1, distinct=True),
+                         [(Prefix('2001:db8::/64'), copies, 1)])
+
+    def test_count_files(self):
+        prefixlens = {4: (24, 8), 6: (48, 64)}
+        # Use threads so the test does not depend on forking.
+        pool = multiprocessing.pool.ThreadPool(3)
+        try:
+            counts = logcount.count_files([self.path, self.path], prefixlens,
+                                          chunk_size=500, workdir=self.dir,
+                                          pool=pool)
+        finally:
+            pool.close()
+        self.check_counts(counts, 100)
+        # The shards are removed.
+        self.assertEqual(os.listdir(self.dir), ['maillog'])
+
+        counts = logcount.count_files([self.path], prefixlens, processes=2,
+                                      chunk_size=1000)
+        self.check_counts(counts, 50)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for lookup module."""
+
+__version__ = '$Revision: #1 $'
+
+import unittest
+
+from aplib.net.ip import IP, IPv6
+from aplib.net.lookup import RangeLookup
+from aplib.net.range import IPRange, Prefix, IPGlob
+
+class Test(unittest.TestCase):
+
+    def test_contains(self):
+        table = RangeLookup([Prefix('10.0.0.0/8'), IP('192.168.1.1'),
+                             IPGlob('172.16-17.*'), Prefix('2001:db8::/32')])
+        self.assertTrue(IP('10.0.0.0') in table)
+        self.assertTrue(IP('10.255.255.255') in table)
+        self.assertFalse(IP('11.0.0.0') in table)
+        self.assertFalse(IP('9.255.255.255') in table)
+        self.assertTrue(IP('192.168.1.1') in table)
+        self.assertFalse(IP('192.168.1.2') in table)
+        self.assertTrue(IP('172.17.3.4') in table)
+        self.assertTrue(IP('2001:db8:ffff::1') in table)
+        self.assertFalse(IP('::10.0.0.1') in table)
+        self.assertTrue(table.contains_int(4, 0x0a000001))
+        self.assertFalse(RangeLookup().contains_int(6, 1))
+
+    def test_merge(self):
+        table = RangeLookup()
+        table.add(Prefix('1.2.3.0/25'))
+        table.add(Prefix('1.2.3.128/25'))
+        table.add(IP('1.2.3.4/24'))
+        table.add_range_int(4, 0x01020400, 0x01020410)
+        table.add_range_int(4, 10, 20)
+        table.add_range_int(4, 15, 30)
+        self.assertEqual(table.ranges(4), [(10, 30), (0x01020300, 0x01020410)])
+        self.assertEqual(len(table), 2)
+        # Adding after a lookup merges again.
+        self.assertTrue(table.contains_int(4, 25))
+        table.add_range_int(4, 31, 40)
+        self.assertEqual(table.ranges(4)[0], (10, 40))
+        table.add(IPRange(IPv6('::1'), IPv6('::2')))
+        self.assertEqual(table.ranges(6), [(1, 2)])
+        self.assertRaises(ValueError, table.add_range_int, 4, 2, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for permute module."""
+
+__version__ = '$Revision: #1 $'
+
+import unittest
+
+from aplib.net.permute import Permutation
+
+class Test(unittest.TestCase):
+
+    def test_permutation(self):
+        for size in (1, 2, 3, 4, 5, 16, 17, 255, 256, 1000):
+            perm = Permutation(size, 3)
+            values = list(perm)
+            self.assertEqual(sorted(values), range(size))
+            self.assertEqual([perm[i] for i in xrange(size)], values)
+        self.assertRaises(IndexError, Permutation(10).__getitem__, 10)
+        self.assertRaises(IndexError, Permutation(10).__getitem__, -1)
+        self.assertRaises(ValueError, Permutation, 0)
+
+    def test_seed(self):
+        orders = set(tuple(Permutation(50, seed)) for seed in xrange(20))
+        self.assertEqual(len(orders), 20)
+        self.assertEqual(list(Permutation(50, 1 << 70)),
+                         list(Permutation(50, 1 << 70)))
+        self.assertNotEqual(list(Permutation(50, 1 << 70)),
+                            list(Permutation(50, 0)))
+
+    def test_large(self):
+        for size in (2 ** 64, 2 ** 128, 3 ** 90):
+            perm = Permutation(size, 7)
+            values = [perm[i] for i in xrange(200)]
+            self.assertEqual(len(set(values)), 200)
+            for value in values:
+                self.assertTrue(0 <= value < size)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -198,5 +198,26 @@ class Test(unittest.TestCase):
         self.assertTrue(Prefix('1.2.3.4').overlaps(Prefix('1.2.3.4')))
         self.assertTrue(Prefix('::').overlaps(Prefix('::')))
 
+    def test_shuffled(self):
+        r = IPGlob('1.2.3.4-100')
+        shuffled = list(r.shuffled(5))
+        self.assertEqual(sorted(shuffled), list(r))
+        self.assertNotEqual(shuffled, list(r))
+        self.assertEqual(list(r.shuffled(5)), shuffled)
+        self.assertNotEqual(list(r.shuffled(6)), shuffled)
+        self.assertEqual(list(r.shuffled(5, ints=True)),
+                         [ip.ip for ip in shuffled])
+        self.assertEqual(r.sample(10, 5), shuffled[:10])
+        self.assertEqual(r.sample(0), [])
+        self.assertRaises(ValueError, r.sample, 98)
+
+        # Huge ranges are not materialized.
+        p = Prefix('2001:db8::/64')
+        sample = p.sample(1000, 1, ints=True)
+        self.assertEqual(len(set(sample)), 1000)
+        for value in sample:
+            self.assertTrue(p.first.ip <= value <= p.last.ip)
+        self.assertEqual(Prefix('1.2.3.4').sample(1), [IPv4('1.2.3.4')])
+
 if __name__ == '__main__':
     unittest.main()
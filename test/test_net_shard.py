@@ -0,0 +1,117 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for shard module."""
+
+__version__ = '$Revision: #1 $'
+
+import array
+import unittest
+
+from aplib.net import _net
+from aplib.net.ip import IP
+from aplib.net.range import Prefix
+from aplib.net.shard import JumpSharder, RendezvousSharder
+
+# Addresses spread over many /24 networks.
+ADDRESSES = array.array('I', [(i * 2654435761) & 0xffffffff
+                              for i in xrange(5000)])
+
+class Test(unittest.TestCase):
+
+    def test_prefix_key(self):
+        self.assertEqual(_net.prefix_key(4, 0x01020304, 24),
+                         _net.prefix_key(4, 0x010203ff, 24))
+        self.assertNotEqual(_net.prefix_key(4, 0x01020304, 24),
+                            _net.prefix_key(4, 0x01020404, 24))
+        self.assertNotEqual(_net.prefix_key(4, 0x01020304, 24),
+                            _net.prefix_key(4, 0x01020304, 24, 1))
+        self.assertNotEqual(_net.prefix_key(4, 0x01020300, 24),
+                            _net.prefix_key(4, 0x01020300, 32))
+        base = 0x20010db8 << 96
+        self.assertEqual(_net.prefix_key(6, base | 1, 48),
+                         _net.prefix_key(6, base | 0xffff << 64, 48))
+        self.assertNotEqual(_net.prefix_key(6, base, 48),
+                            _net.prefix_key(6, base | 1 << 80, 48))
+        self.assertEqual(_net.prefix_key(6, base | 1, 120),
+                         _net.prefix_key(6, base | 2, 120))
+        self.assertRaises(ValueError, _net.prefix_key, 4, 1, 33)
+
+    def test_jump_hash(self):
+        self.assertEqual(_net.jump_hash(12345, 1), 0)
+        self.assertRaises(ValueError, _net.jump_hash, 1, 0)
+        # Growing the bucket count only moves keys to the new bucket.
+        keys = [_net.prefix_key(4, value, 32) for value in xrange(2000)]
+        before = [_net.jump_hash(key, 10) for key in keys]
+        after = [_net.jump_hash(key, 11) for key in keys]
+        moved = [b for a, b in zip(before, after) if a != b]
+        self.assertEqual(set(moved), set([10]))
+        self.assertTrue(100 < len(moved) < 300)
+
+    def test_jump_sharder(self):
+        sharder = JumpSharder(8)
+        self.assertEqual(sharder.shard(IP('10.1.2.3')),
+                         sharder.shard(IP('10.1.2.250')))
+        self.assertEqual(sharder.shard(Prefix('10.1.2.0/24')),
+                         sharder.shard_int(4, 0x0a010203))
+        self.assertEqual(sharder.key_prefix(IP('10.1.2.3')),
+                         Prefix('10.1.2.0/24'))
+        self.assertEqual(sharder.key_prefix(IP('2001:db8:1:2::1')),
+                         Prefix('2001:db8:1::/48'))
+        shards = sharder.shard_ints(4, ADDRESSES)
+        self.assertEqual(list(shards),
+                         [sharder.shard_int(4, value) for value in ADDRESSES])
+        self.assertEqual(sharder.shard_ints(4, list(ADDRESSES[:10])),
+                         shards[:10])
+        counts = [list(shards).count(i) for i in xrange(8)]
+        self.assertTrue(min(counts) > 450, counts)
+        values = [0x20010db8 << 96 | i << 80 for i in xrange(20)]
+        self.assertEqual(list(sharder.shard_ints(6, values)),
+                         [sharder.shard_int(6, value) for value in values])
+        self.assertRaises(ValueError, JumpSharder, 0)
+        self.assertRaises(ValueError, JumpSharder, 1, 33)
+
+    def test_rendezvous_sharder(self):
+        nodes = ['a', 'b', 'c', 'd']
+        sharder = RendezvousSharder(nodes, prefixlen4=16)
+        self.assertEqual(sharder.node(IP('10.1.2.3')),
+                         sharder.node(IP('10.1.200.3')))
+        self.assertEqual(sharder.node_int(4, 0x0a010203),
+                         sharder.node(IP('10.1.2.3')))
+        before = [nodes[i] for i in sharder.shard_ints(4, ADDRESSES)]
+        self.assertEqual(before, [sharder.node_int(4, value)
+                                  for value in ADDRESSES])
+        self.assertEqual(set(before), set(nodes))
+        # Removing a node only moves the addresses that were on it.
+        sharder.remove_node('b')
+        after = [sharder.nodes[i] for i in sharder.shard_ints(4, ADDRESSES)]
+        for old, new in zip(before, after):
+            if old != 'b':
+                self.assertEqual(old, new)
+        self.assertTrue('b' not in after)
+        # Adding it back restores the original placement.
+        sharder.add_node('b')
+        self.assertEqual([sharder.node_int(4, value) for value in ADDRESSES],
+                         before)
+        self.assertRaises(ValueError, sharder.add_node, 'b')
+        self.assertRaises(ValueError, RendezvousSharder([]).shard_int, 4, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# Copyright (c) 2002-2011 IronPort Systems and Cisco Systems
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Unittests for special module."""
+
+__version__ = '$Revision: #1 $'
+
+import struct
+import unittest
+
+from aplib.net.ip import IP
+from aplib.net.special import (ADDRESS_FLAGS, classify_int, filter_ipv6_buffer,
+                               flag_names)
+
+F = ADDRESS_FLAGS
+
+class Test(unittest.TestCase):
+
+    def _check(self, address, flags):
+        self.assertEqual(flag_names(IP(address).classify()), flag_names(flags),
+                         address)
+
+    def test_ipv4(self):
+        self._check('1.2.3.4', 0)
+        self._check('0.0.0.0', F.THIS_NETWORK | F.UNSPECIFIED | F.NOT_GLOBAL)
+        self._check('0.1.2.3', F.THIS_NETWORK | F.NOT_GLOBAL)
+        self._check('10.0.0.0/8', F.PRIVATE | F.NOT_GLOBAL)
+        self._check('100.63.255.255', 0)
+        self._check('100.64.0.0', F.SHARED | F.NOT_GLOBAL)
+        self._check('100.127.255.255', F.SHARED | F.NOT_GLOBAL)
+        self._check('100.128.0.0', 0)
+        self._check('127.0.0.1', F.LOOPBACK | F.NOT_GLOBAL)
+        self._check('169.254.1.1', F.LINK_LOCAL | F.NOT_GLOBAL)
+        self._check('172.31.255.255', F.PRIVATE | F.NOT_GLOBAL)
+        self._check('172.32.0.0', 0)
+        self._check('192.0.0.1', F.IETF_PROTOCOL | F.NOT_GLOBAL)
+        self._check('192.0.0.8', F.IETF_PROTOCOL | F.DUMMY | F.NOT_GLOBAL)
+        self._check('192.0.0.9', F.IETF_PROTOCOL | F.ANYCAST)
+        self._check('192.0.0.171', F.IETF_PROTOCOL | F.NAT64 | F.NOT_GLOBAL)
+        self._check('192.0.2.1', F.DOCUMENTATION | F.NOT_GLOBAL)
+        self._check('192.31.196.1', F.AS112)
+        self._check('192.52.193.1', F.AMT)
+        self._check('192.88.99.1', F.SIX_TO_FOUR)
+        self._check('192.168.1.1', F.PRIVATE | F.NOT_GLOBAL)
+        self._check('198.19.255.255', F.BENCHMARKING | F.NOT_GLOBAL)
+        self._check('198.51.100.1', F.DOCUMENTATION | F.NOT_GLOBAL)
+        self._check('203.0.113.255', F.DOCUMENTATION | F.NOT_GLOBAL)
+        self._check('224.0.0.1', F.MULTICAST)
+        self._check('240.0.0.1', F.RESERVED | F.NOT_GLOBAL)
+        self._check('255.255.255.255',
+                    F.RESERVED | F.BROADCAST | F.NOT_GLOBAL)
+
+    def test_ipv6(self):
+        self._check('2600::1', 0)
+        self._check('::', F.UNSPECIFIED | F.NOT_GLOBAL)
+        self._check('::1', F.LOOPBACK | F.NOT_GLOBAL)
+        self._check('::2', 0)
+        self._check('::ffff:1.2.3.4', F.IPV4_MAPPED | F.NOT_GLOBAL)
+        self._check('64:ff9b::1.2.3.4', F.NAT64)
+        self._check('64:ff9b:1::1', F.NAT64 | F.NOT_GLOBAL)
+        self._check('100::1', F.DISCARD | F.NOT_GLOBAL)
+        self._check('100:0:0:1::1', F.DUMMY | F.NOT_GLOBAL)
+        self._check('2001::1', F.IETF_PROTOCOL | F.TEREDO | F.NOT_GLOBAL)
+        self._check('2001:1::2', F.IETF_PROTOCOL | F.ANYCAST)
+        self._check('2001:1::4', F.IETF_PROTOCOL | F.NOT_GLOBAL)
+        self._check('2001:2::1', F.IETF_PROTOCOL | F.BENCHMARKING | F.NOT_GLOBAL)
+        self._check('2001:3::1', F.IETF_PROTOCOL | F.AMT)
+        self._check('2001:4:112::1', F.IETF_PROTOCOL | F.AS112)
+        self._check('2001:20::1', F.IETF_PROTOCOL | F.ORCHID)
+        self._check('2001:200::1', 0)
+        self._check('2001:db8::1', F.DOCUMENTATION | F.NOT_GLOBAL)
+        self._check('2002::1', F.SIX_TO_FOUR)
+        self._check('2620:4f:8000::1', F.AS112)
+        self._check('3fff:fff::1', F.DOCUMENTATION | F.NOT_GLOBAL)
+        self._check('5f00::1', F.SEGMENT_ROUTING | F.NOT_GLOBAL)
+        self._check('fd00::1', F.PRIVATE | F.NOT_GLOBAL)
+        self._check('fe80::1', F.LINK_LOCAL | F.NOT_GLOBAL)
+        self._check('ff02::1', F.MULTICAST)
+        self._check('ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff', F.MULTICAST)
+
+    def test_classify_int(self):
+        self.assertEqual(classify_int(4, 0), IP('0.0.0.0').classify())
+        self.assertEqual(classify_int(4, 2**32 - 1),
+                         IP('255.255.255.255').classify())
+        self.assertEqual(classify_int(6, 2**128 - 1), F.MULTICAST)
+
+    def test_filter_ipv6_buffer(self):
+        addresses = ['2001:4860::1', '::ffff:10.1.2.3', 'fe80::1', '::1',
+                     '::ffff:8.8.8.8', '::fffe:1.2.3.4', '2001:db8::1',
+                     'ff02::1', '::', 'ffff:ffff:ffff:ffff::']
+        values = [IP(address).ip for address in addresses]
+        data = ''.join([struct.pack('!2Q', value >> 64, value & (2**64 - 1))
+                        for value in values])
+        for unmap in (False, True):
+            for exclude in (0, F.NOT_GLOBAL, F.MULTICAST | F.LOOPBACK):
+                mapped, others = filter_ipv6_buffer(data, unmap, exclude)
+                expected_mapped = []
+                expected_others = []
+                for value in values:
+                    if unmap and value >> 32 == 0xffff:
+                        expected_mapped.append(value & (2**32 - 1))
+                    elif not classify_int(6, value) & exclude:
+                        expected_others.append(value)
+                self.assertEqual(list(mapped), expected_mapped)
+                self.assertEqual(
+                    others, ''.join([data[i * 16:i * 16 + 16]
+                                     for i, value in enumerate(values)
+                                     if value in expected_others]))
+        self.assertEqual(filter_ipv6_buffer('', True, F.NOT_GLOBAL)[1], '')
+        self.assertRaises(ValueError, filter_ipv6_buffer, data[:-1])
+
+    def test_predicates(self):
+        # The network address counts, whatever the prefix length.
+        self.assertTrue(IP('10.0.0.0/8').is_private())
+        self.assertTrue(IP('224.0.0.0/4').is_multicast())
+        self.assertTrue(IP('127.0.0.0/8').is_loopback())
+        self.assertTrue(IP('fe80::/10').is_link_local())
+        self.assertFalse(IP('::1/64').is_loopback())
+
+if __name__ == '__main__':
+    unittest.main()